@@ -0,0 +1,54 @@
+"""Benchmark of the per-call overhead of wrapping sub-agents in AgentTool.
+
+Compares constructing a fresh `AgentTool` on every tool call, as the tools
+used to do, against the shared registry in `data_science.tools`. Tool calls
+go through `AgentTool.run_async`, which does not build the function
+declaration, so neither does the benchmark.
+
+Run from the working directory:
+
+    uv run python benchmarks/agent_tool_overhead.py [--calls 1000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from google.adk.tools.agent_tool import AgentTool
+
+from data_science import tools
+
+
+def bench(label, make_tool, calls):
+    """Times `calls` tool lookups and prints the mean per-call overhead."""
+    names = list(tools._AGENTS)  # pylint: disable=protected-access
+    start = time.perf_counter()
+    for i in range(calls):
+        make_tool(names[i % len(names)])
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<10} {calls} calls: {elapsed * 1e3:8.2f} ms total,"
+        f" {elapsed / calls * 1e6:8.2f} us/call"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=1000)
+    args = parser.parse_args()
+
+    before = bench(
+        "fresh",
+        lambda name: AgentTool(agent=tools._AGENTS[name]),  # pylint: disable=protected-access
+        args.calls,
+    )
+    after = bench("registry", tools.get_agent_tool, args.calls)
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
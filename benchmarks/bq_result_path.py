@@ -0,0 +1,138 @@
+"""Benchmark of reading BigQuery results as row dicts vs as Arrow record batches.
+
+Runs both result paths of `run_bigquery_validation` against a local fake
+client serving a generated result (no network):
+
+- dicts: one dict per row with dates formatted, as the tool used to do,
+- dicts + file: the same, then written as the analysis result file,
+- arrow: record batches into a `pyarrow.Table`, written as the result file
+  as is, with only the rows shown to the model converted to Python.
+
+The fake decodes its pages into `Row` objects or Arrow batches on demand, as
+the real client does for REST results.
+
+Run from the working directory:
+
+    uv run python benchmarks/bq_result_path.py [--rows 100000] [--runs 3]
+"""
+
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pyarrow as pa
+from google.cloud.bigquery import SchemaField
+from google.cloud.bigquery.table import Row
+
+from data_science.sub_agents.bigquery.arrow_results import fetch_arrow, to_rows
+from data_science.sub_agents.bigquery.tools import MAX_NUM_ROWS
+from data_science.utils.result_files import write_result_file
+
+SCHEMA = [
+    SchemaField("id", "INTEGER"),
+    SchemaField("date", "DATE"),
+    SchemaField("country", "STRING"),
+    SchemaField("product", "STRING"),
+    SchemaField("num_sold", "FLOAT"),
+]
+PAGE_ROWS = 10_000
+
+
+class FakeRowIterator:
+    """Serves generated columns as `Row`s or Arrow record batches."""
+
+    def __init__(self, num_rows):
+        rng = random.Random(0)
+        start = datetime.date(2020, 1, 1)
+        self.columns = {
+            "id": list(range(num_rows)),
+            "date": [start + datetime.timedelta(days=i % 1500) for i in range(num_rows)],
+            "country": [rng.choice(["Canada", "Finland", "Italy", "Kenya"]) for _ in range(num_rows)],
+            "product": [rng.choice(["Holographic Goose", "Kaggle", "Kerneler"]) for _ in range(num_rows)],
+            "num_sold": [rng.random() * 1000 for _ in range(num_rows)],
+        }
+        self.schema = SCHEMA
+        self.total_rows = num_rows
+
+    def __iter__(self):
+        field_to_index = {f.name: i for i, f in enumerate(SCHEMA)}
+        for values in zip(*self.columns.values()):
+            yield Row(values, field_to_index)
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        del bqstorage_client
+        for offset in range(0, self.total_rows, PAGE_ROWS):
+            yield pa.record_batch(
+                {k: v[offset : offset + PAGE_ROWS] for k, v in self.columns.items()}
+            )
+
+
+def dict_rows(results):
+    return [
+        {
+            key: (
+                value
+                if not isinstance(value, datetime.date)
+                else value.strftime("%Y-%m-%d")
+            )
+            for (key, value) in row.items()
+        }
+        for row in results
+    ]
+
+
+def run_dicts(results):
+    return dict_rows(results)[:MAX_NUM_ROWS]
+
+
+def run_dicts_and_file(results):
+    rows = dict_rows(results)
+    write_result_file(rows)
+    return rows[:MAX_NUM_ROWS]
+
+
+def run_arrow(results):
+    table = fetch_arrow(results)
+    write_result_file(table)
+    return to_rows(table, MAX_NUM_ROWS)
+
+
+def bench(label, path, results, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        rows = path(results)
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    print(
+        f"{label:<13} {results.total_rows} rows: best {best * 1e3:8.1f} ms,"
+        f" median {statistics.median(times) * 1e3:8.1f} ms"
+    )
+    return best, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    results = FakeRowIterator(args.rows)
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["RESULT_FILES_DIR"] = directory
+        dicts, _ = bench("dicts", run_dicts, results, args.runs)
+        dicts_file, expected = bench("dicts + file", run_dicts_and_file, results, args.runs)
+        arrow, rows = bench("arrow", run_arrow, results, args.runs)
+    assert rows == expected, "the Arrow path returned different rows"
+    print(f"speedup vs dicts: {dicts / arrow:.1f}x, vs dicts + file: {dicts_file / arrow:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
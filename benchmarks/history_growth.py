@@ -0,0 +1,110 @@
+"""Prompt size per turn of a long session, with and without history compaction.
+
+Simulates a session in which every turn calls the database agent (a result of
+`MAX_NUM_ROWS` rows) and the report agent (a few thousand tokens), and prints
+the estimated prompt tokens of each root agent request before and after
+`HistoryCompactor`. No model is called.
+
+Run from the working directory:
+
+    uv run python benchmarks/history_growth.py [--turns 20] [--budget 32000]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from google.adk.agents import LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.artifacts import InMemoryArtifactService
+from google.adk.models import LlmRequest
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from data_science.sub_agents.bigquery.tools import MAX_NUM_ROWS
+from data_science.utils.history_compaction import HistoryCompactor
+
+INSTRUCTION = "You are a data science agent. " * 300
+
+
+def tool_turn(i, name, output):
+    return [
+        types.Content(
+            role="model",
+            parts=[types.Part.from_function_call(name=name, args={"question": f"question {i}"})],
+        ),
+        types.Content(
+            role="user",
+            parts=[
+                types.Part(
+                    function_response=types.FunctionResponse(
+                        id=f"{name}-{i}", name=name, response={"result": output}
+                    )
+                )
+            ],
+        ),
+    ]
+
+
+def session_turn(i):
+    rows = [
+        {"country": f"country {j}", "store": f"store {j % 7}", "num_sold": j * 13.5}
+        for j in range(MAX_NUM_ROWS)
+    ]
+    db_output = f"SQL: SELECT country, store, SUM(num_sold) ...\nResult: {json.dumps(rows)}"
+    report = f"Report {i}. " + "Sales grew steadily in every country and store. " * 300
+    return (
+        [types.Content(role="user", parts=[types.Part(text=f"Question {i} about sales")])]
+        + tool_turn(i, "call_db_agent", db_output)
+        + tool_turn(i, "call_rs_agent", report)
+        + [types.Content(role="model", parts=[types.Part(text=f"Answer {i}.")])]
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--budget", type=int, default=32_000)
+    args = parser.parse_args()
+
+    sessions = InMemorySessionService()
+    session = await sessions.create_session(app_name="bench", user_id="user")
+    context = CallbackContext(
+        InvocationContext(
+            session_service=sessions,
+            artifact_service=InMemoryArtifactService(),
+            invocation_id="invocation",
+            agent=LlmAgent(name="root", model="gemini-2.0-flash"),
+            session=session,
+        )
+    )
+    compactor = HistoryCompactor(budget=args.budget)
+    history = []
+    print(f"{'turn':>4} {'before':>8} {'after':>8} {'compacted':>9}")
+    for i in range(1, args.turns + 1):
+        question = types.Content(role="user", parts=[types.Part(text=f"Question {i}")])
+        request = LlmRequest(
+            contents=[c.model_copy(deep=True) for c in history] + [question],
+            config=types.GenerateContentConfig(system_instruction=INSTRUCTION),
+        )
+        report = await compactor.compact(context, request)
+        print(
+            f"{i:>4} {report['tokens_before']:>8} {report['tokens_after']:>8}"
+            f" {report['compacted_outputs']:>9}"
+        )
+        history += session_turn(i)
+    stats = compactor.stats()
+    print(
+        f"total prompt tokens: {stats['tokens_before']} before,"
+        f" {stats['tokens_after']} after"
+        f" ({1 - stats['tokens_after'] / stats['tokens_before']:.0%} fewer)"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
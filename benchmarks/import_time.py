@@ -0,0 +1,107 @@
+"""Cold-start benchmark for importing the agent package.
+
+Runs `python -X importtime -c "import data_science"` in fresh interpreters and
+reports the cumulative import time along with the heaviest top-level
+dependencies. Use `--budget-ms` to turn it into a regression check.
+
+Run from the working directory:
+
+    uv run python benchmarks/import_time.py [--runs 5] [--budget-ms 2500]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_once(module):
+    """Imports `module` in a fresh interpreter.
+
+    Returns:
+        list[tuple[str, int, int]]: (module, depth, cumulative_us) per import.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+    imports = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            depth = len(match.group(3)) // 2
+            imports.append((match.group(4), depth, int(match.group(2))))
+    return imports
+
+
+def direct_dependencies(imports, package):
+    """Returns (module, cumulative_us) for modules imported by `package` code.
+
+    `-X importtime` prints imports in post-order, so the parent of an entry is
+    the next entry with a smaller depth.
+    """
+    deps = []
+    pending = []  # Entries still waiting for their parent, in order.
+    for name, depth, us in imports:
+        children = [entry for entry in pending if entry[1] == depth + 1]
+        pending = [entry for entry in pending if entry[1] <= depth]
+        if name == package or name.startswith(package + "."):
+            deps.extend(
+                (child, child_us)
+                for child, _, child_us in children
+                if not child.startswith(package)
+            )
+        pending.append((name, depth, us))
+    return deps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="data_science")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    totals = []
+    imports = []
+    for _ in range(args.runs):
+        imports = run_once(args.module)
+        totals.append(
+            next(us for name, _, us in imports if name == args.module) / 1e3
+        )
+
+    median = statistics.median(totals)
+    print(
+        f"import {args.module}: median {median:.1f} ms, min {min(totals):.1f} ms,"
+        f" max {max(totals):.1f} ms over {args.runs} runs"
+    )
+    # Third-party modules imported directly by package modules, heaviest first.
+    heaviest = sorted(
+        direct_dependencies(imports, args.module),
+        key=lambda entry: entry[1],
+        reverse=True,
+    )
+    print("heaviest direct dependencies (last run):")
+    for name, us in heaviest[: args.top]:
+        print(f"  {us / 1e3:8.1f} ms  {name}")
+    for heavy in ("vertexai", "langchain", "langchain_google_genai"):
+        if any(name == heavy for name, _, _ in imports):
+            print(f"warning: {heavy} is imported eagerly")
+
+    if args.budget_ms is not None and median > args.budget_ms:
+        sys.exit(f"import time {median:.1f} ms exceeds budget {args.budget_ms} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Load benchmark of session services with thousands of concurrent sessions.
+
+Each of `--sessions` sessions is created and then appends `--events` events
+concurrently, every event carrying a small state delta and every few events
+a query-result-sized one, as an agent turn does. Reported per service:
+append throughput, append latency percentiles, the time to read a session
+back, and the database size on disk.
+
+- memory: ADK's `InMemorySessionService` (no persistence),
+- adk-sqlite: ADK's `SqliteSessionService` (one connection per call, full
+  state JSON rewritten per event), if the installed ADK has it,
+- sqlite-wal: `data_science.utils.session_store.SqliteSessionService`.
+
+Run from the working directory:
+
+    uv run python benchmarks/session_store_load.py [--sessions 2000] [--events 10]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from google.adk.events import Event, EventActions
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from data_science.utils.session_store import SqliteSessionService
+
+ROWS = [{"country": "Canada", "product": "Kaggle", "num_sold": 1234.5}] * 40
+
+
+def make_event(i):
+    delta = {"sql_query": f"SELECT * FROM t WHERE id = {i}"}
+    if i % 3 == 0:
+        delta["query_result"] = ROWS
+    return Event(
+        invocation_id=f"invocation-{i // 4}",
+        author="db_ds_multiagent",
+        content=types.Content(role="model", parts=[types.Part(text=f"Answer {i}. " * 20)]),
+        actions=EventActions(state_delta=delta),
+    )
+
+
+async def load(service, num_sessions, num_events, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], []
+
+    async def user(i):
+        try:
+            async with semaphore:
+                session = await service.create_session(
+                    app_name="bench", user_id=f"user-{i}"
+                )
+            for j in range(num_events):
+                async with semaphore:
+                    start = time.perf_counter()
+                    await service.append_event(session, make_event(j))
+                    latencies.append(time.perf_counter() - start)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            errors.append(e)
+            return None
+        return session
+
+    start = time.perf_counter()
+    sessions = await asyncio.gather(*(user(i) for i in range(num_sessions)))
+    elapsed = time.perf_counter() - start
+    sessions = [s for s in sessions if s is not None]
+
+    reads = []
+    for session in random.Random(0).sample(sessions, min(200, len(sessions))):
+        start = time.perf_counter()
+        await service.get_session(
+            app_name="bench", user_id=session.user_id, session_id=session.id
+        )
+        reads.append(time.perf_counter() - start)
+    return elapsed, latencies, reads, errors
+
+
+def file_size(path):
+    return sum(
+        os.path.getsize(path + suffix)
+        for suffix in ("", "-wal")
+        if os.path.exists(path + suffix)
+    )
+
+
+def report(label, elapsed, latencies, reads, errors, size=None):
+    if not latencies:
+        print(f"{label:<11} failed: {errors[0]!r}")
+        return
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    line = (
+        f"{label:<11} {len(latencies) / elapsed:8.0f} appends/s,"
+        f" append p50 {statistics.median(latencies) * 1e3:7.2f} ms"
+        f" p99 {p99 * 1e3:7.2f} ms, get_session {statistics.median(reads) * 1e3:6.2f} ms"
+    )
+    if size is not None:
+        line += f", {size / 1e6:6.1f} MB on disk"
+    if errors:
+        line += f", {len(errors)} sessions failed ({type(errors[0]).__name__}: {errors[0]})"
+    print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1000)
+    args = parser.parse_args()
+
+    services = [("memory", lambda path: InMemorySessionService())]
+    try:
+        from google.adk.sessions.sqlite_session_service import (  # pylint: disable=import-outside-toplevel
+            SqliteSessionService as AdkSqliteSessionService,
+        )
+
+        services.append(("adk-sqlite", AdkSqliteSessionService))
+    except ImportError:
+        pass
+    services.append(("sqlite-wal", SqliteSessionService))
+
+    print(f"{args.sessions} sessions x {args.events} events, concurrency {args.concurrency}")
+    with tempfile.TemporaryDirectory() as directory:
+        for label, factory in services:
+            path = os.path.join(directory, f"{label}.db")
+            service = factory(path)
+            elapsed, latencies, reads, errors = await load(
+                service, args.sessions, args.events, args.concurrency
+            )
+            size = file_size(path) if os.path.exists(path) else None
+            report(label, elapsed, latencies, reads, errors, size)
+            if isinstance(service, SqliteSessionService):
+                print(f"{'':<11} events per commit: {service.stats()['events_per_commit']}")
+                service.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
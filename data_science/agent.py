@@ -9,17 +9,29 @@ from datetime import date
 from google.genai import types
 from google.adk.agents import Agent
 from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.readonly_context import ReadonlyContext
 from google.adk.tools import load_artifacts
 
 from data_science.utils.config import config, load_env_variables
+from data_science.utils.history_compaction import compact_history
+from data_science.utils.intent_router import route_intent
+from data_science.utils.state_budget import (
+    is_spilled,
+    spill_large_state,
+    state_manager,
+)
+from data_science.utils.tracing import model_call_tracer
 
 # Load environment variables and get the API key for Google
 env_name = load_env_variables()
 api_key = getattr(config[env_name], 'GOOGLE_API_KEY', os.getenv('GOOGLE_API_KEY'))
 
 
+from .sub_agents.bigquery.result_tools import aggregate_result, fetch_result_page
+from .sub_agents.bigquery.speculation import discard_speculative_sql, speculate_sql
 from .sub_agents.bigquery.tools import (
     get_database_settings as get_bq_database_settings,
+    schema_fingerprint,
 )
 from .prompts import return_instructions_root
 from .tools import (
@@ -32,36 +44,75 @@ from .tools import (
 date_today = date.today()
 
 
-def setup_before_agent_call(callback_context: CallbackContext):
-    """Setup the agent."""
-
-    # setting up database settings in session.state
-    if "database_settings" not in callback_context.state:
-        db_settings = dict()
-        db_settings["use_database"] = "BigQuery"
-        callback_context.state["all_db_settings"] = db_settings
+# Composed root instructions, keyed by schema fingerprint. The instruction is
+# resolved per invocation from session state, so the shared agent object is
+# never mutated.
+_root_instructions: dict[str, str] = {}
 
-    # setting up schema in instruction
-    if callback_context.state["all_db_settings"]["use_database"] == "BigQuery":
-        callback_context.state["database_settings"] = get_bq_database_settings()
-        schema = callback_context.state["database_settings"]["bq_ddl_schema"]
 
-        callback_context._invocation_context.agent.instruction = (
-            return_instructions_root()
-            + f"""
+def _compose_root_instruction(schema: str) -> str:
+    return (
+        return_instructions_root()
+        + f"""
 
     --------- The BigQuery schema of the relevant data with a few sample rows. ---------
     {schema}
 
     """
+    )
+
+
+async def root_instruction(context: ReadonlyContext) -> str:
+    """Instruction provider for the root agent.
+
+    The schema is only loaded from state (where it may be spilled to an
+    artifact) when no instruction is cached for its fingerprint.
+    """
+    db_settings = context.state.get("database_settings")
+    if not db_settings or not (
+        "bq_ddl_schema" in db_settings or is_spilled(db_settings)
+    ):
+        return return_instructions_root()
+
+    fingerprint = db_settings.get("bq_schema_fingerprint")
+    instruction = _root_instructions.get(fingerprint) if fingerprint else None
+    if instruction is None:
+        db_settings = await state_manager.load(context, "database_settings")
+        schema = db_settings["bq_ddl_schema"]
+        fingerprint = fingerprint or schema_fingerprint(schema)
+        instruction = _root_instructions[fingerprint] = _compose_root_instruction(
+            schema
         )
+    return instruction
+
+
+async def setup_before_agent_call(callback_context: CallbackContext):
+    """Setup the agent."""
+
+    # setting up database settings in session.state
+    if "all_db_settings" not in callback_context.state:
+        db_settings = dict()
+        db_settings["use_database"] = "BigQuery"
+        callback_context.state["all_db_settings"] = db_settings
+
+    # setting up schema for the instruction; only written to the session when
+    # the schema cache reports a different fingerprint.
+    if callback_context.state["all_db_settings"]["use_database"] == "BigQuery":
+        db_settings = get_bq_database_settings()
+        current = callback_context.state.get("database_settings") or {}
+        if current.get("bq_schema_fingerprint") != db_settings[
+            "bq_schema_fingerprint"
+        ]:
+            callback_context.state["database_settings"] = db_settings
+            # The DDL schema goes to an artifact; state keeps a reference.
+            await state_manager.spill(callback_context)
 
 
 root_agent = Agent(
     # model=os.getenv("ROOT_AGENT_MODEL"),
     model = "gemini-1.5-flash",
     name="db_ds_multiagent",
-    instruction=return_instructions_root(),
+    instruction=root_instruction,
     global_instruction=(
         f"""
         You are a Data Science and Data Analytics Multi Agent System.
@@ -73,8 +124,24 @@ root_agent = Agent(
         call_ds_agent,
         call_da_agent,
         call_rs_agent,
+        aggregate_result,
+        fetch_result_page,
         load_artifacts,
     ],
     before_agent_callback=setup_before_agent_call,
+    # Schema and SQL-only questions skip the first model call of a turn;
+    # other questions about the data start speculative NL2SQL, if enabled.
+    # Model calls are traced last, since the callbacks before can skip them.
+    before_model_callback=[
+        route_intent,
+        speculate_sql,
+        compact_history,
+        model_call_tracer.before_model,
+    ],
+    after_model_callback=model_call_tracer.after_model,
+    on_model_error_callback=model_call_tracer.on_model_error,
+    after_tool_callback=spill_large_state,
+    # Speculative SQL not claimed by `call_db_agent` is cancelled.
+    after_agent_callback=discard_speculative_sql,
     generate_content_config=types.GenerateContentConfig(temperature=0.01),
 )
\ No newline at end of file
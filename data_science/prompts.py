@@ -74,6 +74,7 @@ def return_instructions_root() -> str:
         * **Use `call_ds_agent` for comprehensive analysis that includes formatting, analysis, and reporting in one pipeline.**
         * **Use individual agent tools (`call_data_formatting_agent`, `call_data_analyst_agent`, `call_report_writer_agent`) when you need specific processing steps.**
         * **IF data is available from previous agent calls, YOU CAN DIRECTLY USE the appropriate agent to do new analysis using the existing data.**
+        * **If the database agent reports a `result_id` for a result larger than the rows shown, use `aggregate_result` or `fetch_result_page` with it instead of calling `call_db_agent` again.**
         * **DO NOT ask the user for project or dataset ID. You have these details in the session context. For BQ ML tasks, just verify if it is okay to proceed with the plan.**
         * **The data science pipeline agents work in sequence: formatting → analysis → reporting. Choose the appropriate entry point based on user needs.**
     </TASK>
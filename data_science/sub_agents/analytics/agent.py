@@ -1,28 +1,23 @@
-#
-
 """Data Science Agent V2: generate nl2py and use code interpreter to run the code."""
-import os
-import vertexai
-from google.adk.code_executors import VertexAiCodeExecutor
 # from google.adk.code_executors import LocalCodeExecutor
 from google.adk.agents import Agent
+from data_science.utils.tracing import model_call_tracer
+from .code_executors import get_code_executor
 from .prompts import return_instructions_ds
 # from langchain_google_genai import ChatGoogleGenerativeAI
 
-# Initialize Vertex AI with correct region FIRST
-vertexai.init(
-    project=os.getenv("GOOGLE_CLOUD_PROJECT"),
-    location="us-central1"
-)
-
+# The executor backend is chosen by ANALYTICS_CODE_EXECUTOR: "vertex" (the
+# default; Code Interpreter, for which Vertex AI is initialized in us-central1
+# on first code execution) or "local" (a warm kernel per session, which is not
+# a sandbox).
 root_agent = Agent(
     # model=os.getenv("ANALYTICS_AGENT_MODEL"),
     model = "gemini-1.5-flash",
     # model=ChatGoogleGenerativeAI(model="gemini-2.0-flash-001"),
     name="data_science_agent",
     instruction=return_instructions_ds(),
-    code_executor=VertexAiCodeExecutor(
-        optimize_data_file=True,
-        stateful=True,
-    ),
-)
\ No newline at end of file
+    code_executor=get_code_executor(),
+    before_model_callback=model_call_tracer.before_model,
+    after_model_callback=model_call_tracer.after_model,
+    on_model_error_callback=model_call_tracer.on_model_error,
+)
@@ -0,0 +1,236 @@
+"""Code executors for the analytics (ds) agent.
+
+`get_code_executor` picks the backend: the Vertex AI Code Interpreter
+extension (`LazyVertexAiCodeExecutor`, the default) or, opt-in, a local,
+process-isolated kernel per session (`LocalCodeExecutor`).
+
+The local kernels run model-generated code on the agent's host. They get no
+credentials and, where possible, no network (see `kernel`), but they are not
+a sandbox: only use them where the agent's users and data are trusted.
+"""
+
+import base64
+import logging
+import os
+import threading
+import uuid
+from typing import ClassVar, Optional
+
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.code_executors import BaseCodeExecutor
+from google.adk.code_executors.code_execution_utils import (
+    CodeExecutionInput,
+    CodeExecutionResult,
+    File,
+)
+from pydantic import PrivateAttr
+
+from data_science.utils import result_files
+from data_science.utils.clients import init_vertexai
+from data_science.utils.tracing import tracer
+
+from .kernel import Kernel, KernelError, KernelLimits
+from .kernel_pool import KernelPool
+
+logger = logging.getLogger(__name__)
+
+
+class LazyVertexAiCodeExecutor(BaseCodeExecutor):
+    """Vertex AI Code Interpreter executor that is created on first use.
+
+    Constructing `VertexAiCodeExecutor` imports the Vertex AI SDK and looks up
+    (or creates) the Code Interpreter extension over the network, so it is
+    deferred until the agent actually executes code.
+    """
+
+    resource_name: Optional[str] = None
+    location: str = "us-central1"
+
+    _delegate: Optional[BaseCodeExecutor] = PrivateAttr(default=None)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def _get_delegate(self) -> BaseCodeExecutor:
+        with self._lock:
+            if self._delegate is None:
+                # pylint: disable=import-outside-toplevel
+                from google.adk.code_executors import VertexAiCodeExecutor
+
+                init_vertexai(os.getenv("GOOGLE_CLOUD_PROJECT"), self.location)
+                self._delegate = VertexAiCodeExecutor(
+                    resource_name=self.resource_name,
+                    optimize_data_file=self.optimize_data_file,
+                    stateful=self.stateful,
+                )
+            return self._delegate
+
+    def execute_code(
+        self,
+        invocation_context: InvocationContext,
+        code_execution_input: CodeExecutionInput,
+    ) -> CodeExecutionResult:
+        return self._get_delegate().execute_code(
+            invocation_context, code_execution_input
+        )
+
+
+def _file_bytes(file: File) -> bytes:
+    """Returns the content of an input file; text content is base64-encoded."""
+    if isinstance(file.content, str):
+        return base64.b64decode(file.content)
+    return file.content
+
+
+class LocalCodeExecutor(BaseCodeExecutor):
+    """Runs code in local, process-isolated Python kernels.
+
+    Each session (`execution_id`) gets its own `Kernel` from a pool of
+    pre-warmed ones: a subprocess with pandas, numpy, scipy and matplotlib
+    preimported, whose variables persist across cells and whose memory, CPU
+    time and per-cell wall time are limited. Figures left open and files
+    written by a cell are returned as output files. A session idle for
+    `idle_timeout_seconds`, or ended with `release`, has its kernel reset and
+    returned to the pool. Without an `execution_id` (not stateful) every call
+    runs in a freshly reset kernel.
+
+    The latest query result of the session (`result_files.STATE_KEY`) is
+    memory-mapped into the kernel as `df` before the first cell that sees it.
+    """
+
+    # Whether the executor binds query result files, so that the analysis
+    # prompt can carry a description of the result instead of its rows.
+    loads_result_files: ClassVar[bool] = True
+
+    timeout_seconds: Optional[int] = 60
+    memory_limit_mb: Optional[int] = 2048
+    cpu_limit_seconds: Optional[int] = 600
+    max_output_chars: int = 20_000
+    pool_size: int = 2
+    idle_timeout_seconds: float = 900
+
+    _pool: Optional[KernelPool] = PrivateAttr(default=None)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def pool(self) -> KernelPool:
+        """The kernel pool, created on first use."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = KernelPool(
+                    size=self.pool_size,
+                    limits=KernelLimits(
+                        memory_mb=self.memory_limit_mb,
+                        cpu_seconds=self.cpu_limit_seconds,
+                        cell_timeout_seconds=self.timeout_seconds or 60,
+                        max_output_chars=self.max_output_chars,
+                    ),
+                    idle_timeout_seconds=self.idle_timeout_seconds,
+                )
+            return self._pool
+
+    def execute_code(
+        self,
+        invocation_context: InvocationContext,
+        code_execution_input: CodeExecutionInput,
+    ) -> CodeExecutionResult:
+        session_id = code_execution_input.execution_id or f"call-{uuid.uuid4()}"
+        with tracer.span("code_executor.execute", backend="local") as span:
+            try:
+                kernel, cold_start = self.pool.acquire(session_id)
+            except KernelError as e:
+                return CodeExecutionResult(stderr=str(e))
+            span.set(cold_start=cold_start)
+            try:
+                bind_error = self._bind_result_file(kernel, invocation_context)
+                result = kernel.execute(
+                    code_execution_input.code,
+                    input_files=[
+                        (f.name, _file_bytes(f))
+                        for f in code_execution_input.input_files
+                    ],
+                )
+            except KernelError as e:
+                self.pool.discard(session_id)
+                span.set(error="kernel")
+                return CodeExecutionResult(stderr=str(e))
+            finally:
+                if code_execution_input.execution_id is None:
+                    self.pool.release(session_id)
+            span.set(
+                cell_ms=round(result.duration_ms, 2),
+                error="cell" if result.error else None,
+                output_files=len(result.files),
+            )
+        stderr = result.error or ""
+        if bind_error:
+            # The prompt said `df` is loaded; tell the model it is not.
+            stderr = (
+                "The query result could not be loaded as the DataFrame `df`:"
+                f" {bind_error}\n{stderr}"
+            )
+        return CodeExecutionResult(
+            stdout=result.stdout,
+            stderr=stderr,
+            output_files=[
+                File(name=name, content=content, mime_type=mime_type)
+                for name, mime_type, content in result.files
+            ],
+        )
+
+    def _bind_result_file(self, kernel: Kernel, invocation_context) -> Optional[str]:
+        """Loads the session's latest query result as `df`, once per result.
+
+        Returns:
+            The error if loading failed, else None.
+        """
+        session = getattr(invocation_context, "session", None)
+        state = session.state if session is not None else {}
+        handoff = state.get(result_files.STATE_KEY)
+        if not handoff or kernel.data_files.get("df") == handoff["path"]:
+            return None
+        result_file = result_files.ResultFile.from_state(handoff)
+        with tracer.span("code_executor.bind_result", rows=result_file.num_rows) as span:
+            result = kernel.execute(result_files.load_code(result_file))
+            span.set(error=bool(result.error))
+        if result.error:
+            logger.warning("Loading %s failed: %s", result_file.path, result.error)
+            return result.error.strip().splitlines()[-1]
+        kernel.data_files["df"] = result_file.path
+        return None
+
+    def release(self, execution_id: str):
+        """Ends a session, returning its kernel to the pool."""
+        self.pool.release(execution_id)
+
+    def shutdown(self):
+        """Stops every kernel."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+CODE_EXECUTORS = {
+    "local": LocalCodeExecutor,
+    "vertex": LazyVertexAiCodeExecutor,
+}
+
+
+def get_code_executor(backend: Optional[str] = None, **kwargs) -> BaseCodeExecutor:
+    """Creates the stateful code executor of the analytics agent.
+
+    Args:
+        backend: "vertex" or "local". Defaults to `ANALYTICS_CODE_EXECUTOR`,
+          or "vertex". The local backend is not a sandbox (see `kernel`).
+        **kwargs: Passed to the executor.
+
+    Returns:
+        BaseCodeExecutor: The executor, with data file optimization enabled.
+    """
+    backend = (backend or os.getenv("ANALYTICS_CODE_EXECUTOR", "vertex")).lower()
+    if backend not in CODE_EXECUTORS:
+        raise ValueError(
+            f"Unknown code executor {backend!r}; expected one of {sorted(CODE_EXECUTORS)}."
+        )
+    kwargs.setdefault("optimize_data_file", True)
+    kwargs.setdefault("stateful", True)
+    return CODE_EXECUTORS[backend](**kwargs)
@@ -0,0 +1,558 @@
+#
+
+"""Local, process-isolated Python kernels for the analytics agent.
+
+A `Kernel` is a long-lived Python subprocess that executes code cells in a
+persistent namespace, like a notebook. It starts once with the libraries the
+analytics prompt promises already imported (pandas, numpy, scipy,
+matplotlib), so each cell only pays for its own code and a pipe round trip.
+
+The kernel runs in its own scratch working directory and process group under
+resource limits: address space (memory) and CPU time per session are capped
+with `setrlimit`, and every cell has a wall-clock timeout after which it is
+interrupted (and the kernel killed if it does not stop).
+
+The kernel runs model-generated code, which a prompt injection can steer, so
+it gets as little as possible: only the environment variables of
+`ENV_ALLOWLIST` (no API keys, credentials or project settings), HOME and
+TMPDIR pointing to its working directory and, on Linux, no network (a new
+user and network namespace, where unprivileged user namespaces are allowed;
+`Kernel.network_isolated` tells whether it worked). This is NOT a sandbox:
+the kernel can still read any file the agent's user can read. Use the Vertex
+AI Code Interpreter where that matters.
+
+A kernel can be `reset` to its freshly started state (empty namespace,
+preimports only, empty working directory) and handed to another session.
+
+Parent and kernel talk over stdin/stdout, one JSON message per line. This
+module is also the kernel program itself (`python kernel.py <config>`), so it
+only imports the standard library.
+"""
+
+import ast
+import base64
+import contextlib
+import gc
+import io
+import json
+import logging
+import math
+import mimetypes
+import os
+import selectors
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import warnings
+from dataclasses import dataclass, field
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Imported into every kernel namespace, as promised by `return_instructions_ds`.
+PREIMPORTS = (
+    "import io",
+    "import math",
+    "import re",
+    "import matplotlib",
+    "matplotlib.use('Agg')",
+    "import matplotlib.pyplot as plt",
+    "import numpy as np",
+    "import pandas as pd",
+    "import scipy",
+)
+# Files larger than this, written by a cell, are not returned.
+MAX_OUTPUT_FILE_BYTES = 10 * 1024 * 1024
+# Environment variables passed on to the kernel; everything else (API keys,
+# credential paths, project ids) is withheld.
+ENV_ALLOWLIST = (
+    "PATH", "LANG", "LANGUAGE", "LC_ALL", "LC_CTYPE", "TZ",
+    "LD_LIBRARY_PATH", "PYTHONPATH", "VIRTUAL_ENV", "SYSTEMROOT",
+)
+
+
+def kernel_env(work_dir: str) -> dict:
+    """Returns the environment of a kernel working in `work_dir`."""
+    env = {k: os.environ[k] for k in ENV_ALLOWLIST if k in os.environ}
+    env.update(
+        HOME=work_dir,
+        TMPDIR=work_dir,
+        MPLCONFIGDIR=work_dir,
+        MPLBACKEND="Agg",
+        PYTHONNOUSERSITE="1",
+    )
+    return env
+
+
+class KernelError(RuntimeError):
+    """The kernel could not start, died or stopped responding."""
+
+
+@dataclass
+class KernelLimits:
+    """Resource limits of a kernel.
+
+    Attributes:
+        memory_mb: Address-space limit of the kernel process.
+        cpu_seconds: CPU time the kernel may use per session, i.e. between
+          resets.
+        cell_timeout_seconds: Wall-clock time a single cell may run.
+        max_output_chars: Captured output kept per cell; the middle of longer
+          output is dropped.
+        isolate_network: Whether the kernel is cut off from the network.
+    """
+
+    memory_mb: Optional[int] = 2048
+    cpu_seconds: Optional[int] = 600
+    cell_timeout_seconds: float = 60
+    max_output_chars: int = 20_000
+    isolate_network: bool = True
+
+
+@dataclass
+class CellResult:
+    """The outcome of executing one cell.
+
+    Attributes:
+        stdout: Printed output, including warnings and the value of a trailing
+          expression.
+        error: The traceback if the cell raised, else None.
+        files: (name, mime type, base64 content) of the figures the cell left
+          open and the files it wrote to the working directory.
+        duration_ms: Time spent executing the cell inside the kernel.
+    """
+
+    stdout: str = ""
+    error: Optional[str] = None
+    files: list = field(default_factory=list)
+    duration_ms: float = 0.0
+
+
+class Kernel:
+    """A warm Python subprocess executing cells in a persistent namespace.
+
+    Args:
+        limits: Resource limits of the kernel.
+        work_dir: Working directory of the kernel. Defaults to a temporary
+          directory that is removed when the kernel is closed.
+        startup_timeout: Seconds to wait for the kernel to import its
+          libraries and report ready.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[KernelLimits] = None,
+        work_dir: Optional[str] = None,
+        startup_timeout: float = 60,
+    ):
+        self.limits = limits or KernelLimits()
+        self._owns_work_dir = work_dir is None
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix="ds_kernel_")
+        self.failed_imports: list[str] = []
+        self.cells = 0
+        self.resets = 0
+        # Data files bound in the namespace, by variable name; maintained by
+        # the code executor and cleared on reset.
+        self.data_files: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._buffer = b""
+        self._input_files: set[str] = set()
+        config = {
+            "memory_mb": self.limits.memory_mb,
+            "cpu_seconds": self.limits.cpu_seconds,
+            "max_output_chars": self.limits.max_output_chars,
+            "isolate_network": self.limits.isolate_network,
+        }
+        started = time.perf_counter()
+        self._process = subprocess.Popen(
+            [sys.executable, "-u", os.path.abspath(__file__), json.dumps(config)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=self.work_dir,
+            env=kernel_env(self.work_dir),
+            start_new_session=True,
+        )
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._process.stdout, selectors.EVENT_READ)
+        ready = self._receive(time.monotonic() + startup_timeout)
+        if ready is None:
+            self.close()
+            raise KernelError(f"Kernel did not start within {startup_timeout}s.")
+        self.failed_imports = ready["failed_imports"]
+        self.network_isolated = ready["network_isolated"]
+        if self.limits.isolate_network and not self.network_isolated:
+            logger.warning(
+                "Kernel %d could not be cut off from the network; generated code"
+                " can reach it.",
+                self.pid,
+            )
+        self.startup_ms = (time.perf_counter() - started) * 1000
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    @property
+    def alive(self) -> bool:
+        return self._process.poll() is None
+
+    def execute(
+        self, code: str, input_files=(), timeout: Optional[float] = None
+    ) -> CellResult:
+        """Executes `code` in the kernel namespace.
+
+        Args:
+            code: The Python code of the cell.
+            input_files: (name, bytes) pairs to place in the working directory
+              before the cell runs; files already placed are not rewritten.
+            timeout: Wall-clock limit of the cell. Defaults to the kernel
+              limit. A cell still running is interrupted (KeyboardInterrupt)
+              and the kernel killed if it does not stop within a few seconds.
+
+        Returns:
+            CellResult: Output, error and files of the cell.
+
+        Raises:
+            KernelError: If the kernel died or had to be killed; its state is
+              lost and it cannot be used again.
+        """
+        timeout = timeout or self.limits.cell_timeout_seconds
+        with self._lock:
+            if not self.alive:
+                raise KernelError(self._exit_reason())
+            for name, content in input_files:
+                if name not in self._input_files:
+                    with open(os.path.join(self.work_dir, name), "wb") as f:
+                        f.write(content)
+                    self._input_files.add(name)
+            self.cells += 1
+            self._send({"op": "execute", "code": code, "cell": self.cells})
+            response = self._receive(time.monotonic() + timeout)
+            if response is None:
+                os.kill(self.pid, signal.SIGINT)
+                response = self._receive(time.monotonic() + 5)
+                if response is None:
+                    self.close()
+                    raise KernelError(
+                        f"Cell timed out after {timeout}s and the kernel was"
+                        " stopped; variables were lost."
+                    )
+                if response.get("error"):
+                    response["error"] = (
+                        f"Cell timed out after {timeout}s and was interrupted.\n"
+                        + response["error"]
+                    )
+            return CellResult(
+                stdout=response["stdout"],
+                error=response.get("error"),
+                files=[tuple(f) for f in response["files"]],
+                duration_ms=response["duration_ms"],
+            )
+
+    def reset(self, timeout: float = 10):
+        """Restores the kernel to its freshly started state.
+
+        Clears the namespace (re-running the preimports, which are already
+        loaded), closes figures, resets pandas options, empties the working
+        directory and renews the CPU time limit.
+
+        Raises:
+            KernelError: If the kernel died or did not reset within `timeout`.
+        """
+        with self._lock:
+            self._send({"op": "reset"})
+            response = self._receive(time.monotonic() + timeout)
+            if response is None:
+                raise KernelError(f"Kernel did not reset within {timeout}s.")
+            with os.scandir(self.work_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    else:
+                        os.remove(entry.path)
+            self._input_files.clear()
+            self.data_files.clear()
+            self.failed_imports = response["failed_imports"]
+            self.cells = 0
+            self.resets += 1
+
+    def memory_bytes(self) -> Optional[int]:
+        """Returns the resident memory of the kernel, where /proc is available."""
+        try:
+            with open(f"/proc/{self.pid}/statm", encoding="ascii") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def close(self):
+        """Stops the kernel and removes its temporary working directory."""
+        if self.alive:
+            try:
+                self._send({"op": "shutdown"})
+                self._process.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                self._process.kill()
+                self._process.wait()
+        self._selector.close()
+        for stream in (self._process.stdin, self._process.stdout):
+            with contextlib.suppress(OSError):
+                stream.close()
+        if self._owns_work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _send(self, message: dict):
+        try:
+            self._process.stdin.write(json.dumps(message).encode("utf-8") + b"\n")
+            self._process.stdin.flush()
+        except OSError as e:
+            raise KernelError(self._exit_reason()) from e
+
+    def _receive(self, deadline: float) -> Optional[dict]:
+        """Reads the next message, or returns None once `deadline` passes."""
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._selector.select(remaining):
+                return None
+            chunk = os.read(self._process.stdout.fileno(), 1 << 16)
+            if not chunk:
+                self._process.wait()
+                raise KernelError(self._exit_reason())
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line)
+
+    def _exit_reason(self) -> str:
+        code = self._process.poll()
+        if code is None:
+            return "The kernel stopped responding."
+        if code == -getattr(signal, "SIGXCPU", 0):
+            return (
+                f"The kernel used up its CPU time limit ({self.limits.cpu_seconds}s"
+                " per session) and was stopped; variables were lost."
+            )
+        if code < 0:
+            return f"The kernel was killed by {signal.Signals(-code).name}; variables were lost."
+        return f"The kernel exited with code {code}; variables were lost."
+
+
+# The kernel program.
+
+
+def _isolate_network() -> bool:
+    """Moves the kernel into new user and network namespaces (Linux only).
+
+    Must run before any thread is started. Returns whether it worked.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        import ctypes  # pylint: disable=import-outside-toplevel
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        clone_newuser, clone_newnet = 0x10000000, 0x40000000
+        return libc.unshare(clone_newuser | clone_newnet) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+def _apply_limits(memory_mb: Optional[int]):
+    if resource is not None and memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _renew_cpu_limit(cpu_seconds: Optional[int]):
+    """Allows `cpu_seconds` more CPU time from now on."""
+    if resource is None or not cpu_seconds:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime) + cpu_seconds
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _preimport(namespace: dict) -> list[str]:
+    """Runs the preimports, returning the ones that failed."""
+    failed = []
+    for statement in PREIMPORTS:
+        try:
+            exec(statement, namespace)  # pylint: disable=exec-used
+        except Exception:  # pylint: disable=broad-exception-caught
+            failed.append(statement)
+    return failed
+
+
+def _reset(namespace: dict, home: str, cpu_seconds: Optional[int]) -> dict:
+    if "matplotlib.pyplot" in sys.modules:
+        sys.modules["matplotlib.pyplot"].close("all")
+    if "pandas" in sys.modules:
+        with warnings.catch_warnings(), contextlib.suppress(Exception):
+            warnings.simplefilter("ignore")
+            sys.modules["pandas"].reset_option("all")
+    namespace.clear()
+    namespace.update(__name__="__main__", __builtins__=__builtins__)
+    os.chdir(home)
+    gc.collect()
+    _renew_cpu_limit(cpu_seconds)
+    return {"failed_imports": _preimport(namespace)}
+
+
+class _CappedOutput(io.StringIO):
+    """Output buffer keeping the head and tail of long output."""
+
+    def __init__(self, max_chars: int):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def text(self) -> str:
+        text = self.getvalue()
+        if len(text) <= self.max_chars:
+            return text
+        half = self.max_chars // 2
+        dropped = len(text) - 2 * half
+        return f"{text[:half]}\n... [{dropped} characters omitted] ...\n{text[-half:]}"
+
+
+def _run_cell(code: str, namespace: dict):
+    """Executes a cell, printing the value of a trailing expression."""
+    tree = ast.parse(code, mode="exec")
+    last = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last = ast.Expression(tree.body.pop().value)
+    exec(compile(tree, "<cell>", "exec"), namespace)  # pylint: disable=exec-used
+    if last is not None:
+        value = eval(compile(last, "<cell>", "eval"), namespace)  # pylint: disable=eval-used
+        if value is not None:
+            print(repr(value))
+
+
+def _format_error(error: BaseException) -> str:
+    """Formats a traceback without the kernel's own frames."""
+    tb = error.__traceback__
+    while tb is not None and tb.tb_frame.f_code.co_filename != "<cell>":
+        tb = tb.tb_next
+    return "".join(traceback.format_exception(type(error), error, tb))
+
+
+def _snapshot() -> dict:
+    with os.scandir(".") as entries:
+        return {
+            e.name: (e.stat().st_mtime_ns, e.stat().st_size)
+            for e in entries
+            if e.is_file()
+        }
+
+
+def _collect_files(before: dict, cell: int) -> list:
+    """Returns the open figures and the files written by the cell."""
+    files = []
+    if "matplotlib.pyplot" in sys.modules:
+        plt = sys.modules["matplotlib.pyplot"]
+        for i, number in enumerate(plt.get_fignums()):
+            buffer = io.BytesIO()
+            plt.figure(number).savefig(buffer, format="png", bbox_inches="tight")
+            files.append(
+                (
+                    f"figure_{cell}_{i + 1}.png",
+                    "image/png",
+                    base64.b64encode(buffer.getvalue()).decode(),
+                )
+            )
+        plt.close("all")
+    for name, stat in _snapshot().items():
+        if before.get(name) == stat or stat[1] > MAX_OUTPUT_FILE_BYTES:
+            continue
+        with open(name, "rb") as f:
+            content = base64.b64encode(f.read()).decode()
+        mime_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        files.append((name, mime_type, content))
+    return files
+
+
+def _execute(request: dict, namespace: dict, max_output_chars: int) -> dict:
+    output = _CappedOutput(max_output_chars)
+    error = None
+    before = _snapshot()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        try:
+            _run_cell(request["code"], namespace)
+        except BaseException as e:  # pylint: disable=broad-exception-caught
+            error = _format_error(e)
+    duration_ms = (time.perf_counter() - started) * 1000
+    try:
+        files = _collect_files(before, request["cell"])
+    except Exception:  # pylint: disable=broad-exception-caught
+        files = []
+        output.write("\nCollecting output files failed:\n" + traceback.format_exc())
+    return {
+        "stdout": output.text(),
+        "error": error,
+        "files": files,
+        "duration_ms": duration_ms,
+    }
+
+
+def main(argv: list[str]):
+    config = json.loads(argv[1])
+    # Keep the real stdout for messages; anything else written to file
+    # descriptor 1 (e.g. by subprocesses or C extensions) goes to stderr.
+    channel = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    sys.stdout = sys.__stdout__ = os.fdopen(1, "w", encoding="utf-8", closefd=False)
+
+    def send(message: dict):
+        channel.write(json.dumps(message) + "\n")
+        channel.flush()
+
+    network_isolated = config["isolate_network"] and _isolate_network()
+    _apply_limits(config["memory_mb"])
+    home = os.getcwd()
+    namespace = {}
+    send(
+        dict(
+            _reset(namespace, home, config["cpu_seconds"]),
+            network_isolated=network_isolated,
+        )
+    )
+    while True:
+        try:
+            line = sys.stdin.readline()
+        except KeyboardInterrupt:
+            # An interrupt for a cell that had just finished.
+            continue
+        if not line:
+            return
+        request = json.loads(line)
+        if request["op"] == "shutdown":
+            return
+        if request["op"] == "reset":
+            send(_reset(namespace, home, config["cpu_seconds"]))
+            continue
+        try:
+            send(_execute(request, namespace, config["max_output_chars"]))
+        except KeyboardInterrupt:
+            send(
+                {
+                    "stdout": "",
+                    "error": "KeyboardInterrupt",
+                    "files": [],
+                    "duration_ms": 0.0,
+                }
+            )
+
+
+if __name__ == "__main__":
+    main(sys.argv)
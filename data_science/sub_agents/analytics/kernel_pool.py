@@ -0,0 +1,271 @@
+#
+
+"""A pool of pre-warmed analysis kernels shared by sessions.
+
+Starting a kernel costs a Python start-up plus the pandas/numpy/scipy/
+matplotlib imports. `KernelPool` keeps `size` kernels started ahead of time
+and hands one to a session on its first cell, so the session starts warm.
+
+When a session ends, explicitly with `release` or after `idle_timeout_seconds`
+without a cell, its kernel is reset to its freshly started state and returned
+to the pool. Kernels that served `max_sessions` sessions, grew beyond
+`max_memory_mb` or fail to reset are retired instead, and the pool is
+refilled in the background.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from data_science.utils.tracing import tracer
+
+from .kernel import Kernel, KernelError, KernelLimits
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Lease:
+    kernel: Kernel
+    last_used: float
+
+
+class KernelPool:
+    """Pre-warmed kernels handed to sessions and recycled after them.
+
+    Args:
+        size: The number of idle, pre-warmed kernels to keep ready.
+        limits: Resource limits of the kernels.
+        idle_timeout_seconds: A session without a cell for this long is ended
+          and its kernel recycled.
+        max_sessions: Sessions a kernel serves before it is retired.
+        max_memory_mb: A kernel using more resident memory than this after a
+          reset is retired rather than reused.
+        maintain: Whether a background thread, started on the first
+          `acquire`, keeps the pool filled and ends idle sessions. Otherwise
+          call `prewarm` and `expire` yourself.
+        clock: Returns the current time in seconds.
+        kernel_factory: Starts a kernel with the given limits.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        limits: Optional[KernelLimits] = None,
+        idle_timeout_seconds: float = 900,
+        max_sessions: int = 20,
+        max_memory_mb: Optional[int] = 1024,
+        maintain: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+        kernel_factory: Callable[[KernelLimits], Kernel] = Kernel,
+    ):
+        self.size = size
+        self.limits = limits or KernelLimits()
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.max_sessions = max_sessions
+        self.max_memory_mb = max_memory_mb
+        self.maintain = maintain
+        self.clock = clock
+        self.kernel_factory = kernel_factory
+        self._lock = threading.Lock()
+        self._idle: list[Kernel] = []
+        self._leases: dict[str, _Lease] = {}
+        self._starting = 0
+        self._closed = False
+        self._wakeup = threading.Event()
+        self._maintainer: Optional[threading.Thread] = None
+        self._stats = dict.fromkeys(
+            ("hits", "reuses", "cold_starts", "recycled", "retired", "expired", "errors"),
+            0,
+        )
+        self._startup_ms: list[float] = []
+
+    def acquire(self, session_id: str) -> tuple[Kernel, bool]:
+        """Returns the kernel of a session, assigning one on its first cell.
+
+        Args:
+            session_id: The session (code executor execution id).
+
+        Returns:
+            tuple: The kernel and whether it had to be started cold.
+
+        Raises:
+            KernelError: If a new kernel could not be started.
+        """
+        self._ensure_maintainer()
+        with tracer.span("kernel_pool.acquire") as span:
+            with self._lock:
+                lease = self._leases.get(session_id)
+                if lease is not None and lease.kernel.alive:
+                    lease.last_used = self.clock()
+                    self._stats["reuses"] += 1
+                    span.set(reused=True)
+                    return lease.kernel, False
+                dead = None
+                if lease is not None:
+                    # The kernel died (e.g. at its CPU limit); start over.
+                    dead = self._leases.pop(session_id).kernel
+                    self._stats["retired"] += 1
+                kernel = None
+                while self._idle and kernel is None:
+                    candidate = self._idle.pop()
+                    if candidate.alive:
+                        kernel = candidate
+                    else:
+                        self._stats["retired"] += 1
+                if kernel is not None:
+                    self._stats["hits"] += 1
+                    self._leases[session_id] = _Lease(kernel, self.clock())
+            self._wakeup.set()
+            if dead is not None:
+                dead.close()
+            if kernel is not None:
+                span.set(pool_hit=True)
+                return kernel, False
+
+            span.set(pool_hit=False)
+            kernel = self._start()
+            with self._lock:
+                self._stats["cold_starts"] += 1
+                self._leases[session_id] = _Lease(kernel, self.clock())
+            return kernel, True
+
+    def release(self, session_id: str):
+        """Ends a session, resetting its kernel and returning it to the pool."""
+        with self._lock:
+            lease = self._leases.pop(session_id, None)
+        if lease is not None:
+            self._recycle(lease.kernel)
+
+    def discard(self, session_id: str):
+        """Ends a session whose kernel is broken, stopping the kernel."""
+        with self._lock:
+            lease = self._leases.pop(session_id, None)
+            if lease is not None:
+                self._stats["retired"] += 1
+        if lease is not None:
+            lease.kernel.close()
+        self._wakeup.set()
+
+    def expire(self) -> int:
+        """Ends the sessions idle for longer than the timeout. Returns how many."""
+        now = self.clock()
+        with self._lock:
+            expired = [
+                session_id
+                for session_id, lease in self._leases.items()
+                if now - lease.last_used >= self.idle_timeout_seconds
+            ]
+            self._stats["expired"] += len(expired)
+        for session_id in expired:
+            self.release(session_id)
+        return len(expired)
+
+    def prewarm(self):
+        """Starts kernels until `size` idle kernels are ready."""
+        while True:
+            with self._lock:
+                if self._closed or len(self._idle) + self._starting >= self.size:
+                    return
+                self._starting += 1
+            try:
+                kernel = self._start()
+            except KernelError as e:
+                logger.warning("Pre-warming a kernel failed: %s", e)
+                with self._lock:
+                    self._starting -= 1
+                    self._stats["errors"] += 1
+                return
+            with self._lock:
+                self._starting -= 1
+                if self._closed:
+                    kernel.close()
+                    return
+                self._idle.append(kernel)
+
+    def stats(self) -> dict:
+        """Returns the pool counters, kernel counts and kernel memory."""
+        with self._lock:
+            kernels = self._idle + [lease.kernel for lease in self._leases.values()]
+            stats = dict(
+                self._stats,
+                idle=len(self._idle),
+                active=len(self._leases),
+            )
+            startup_ms = list(self._startup_ms)
+        memory = [m for m in (k.memory_bytes() for k in kernels) if m is not None]
+        stats.update(
+            kernel_memory_bytes=sum(memory),
+            max_kernel_memory_bytes=max(memory, default=0),
+            mean_startup_ms=round(sum(startup_ms) / len(startup_ms), 1)
+            if startup_ms
+            else None,
+        )
+        return stats
+
+    def shutdown(self):
+        """Stops the maintenance thread and every kernel."""
+        with self._lock:
+            self._closed = True
+            kernels = self._idle + [lease.kernel for lease in self._leases.values()]
+            self._idle, self._leases = [], {}
+        self._wakeup.set()
+        for kernel in kernels:
+            kernel.close()
+
+    def _start(self) -> Kernel:
+        with tracer.span("kernel_pool.start") as span:
+            kernel = self.kernel_factory(self.limits)
+            span.set(pid=kernel.pid, startup_ms=round(kernel.startup_ms, 1))
+        if kernel.failed_imports:
+            logger.warning("Kernel preimports failed: %s", kernel.failed_imports)
+        with self._lock:
+            self._startup_ms.append(kernel.startup_ms)
+            del self._startup_ms[:-100]
+        return kernel
+
+    def _recycle(self, kernel: Kernel):
+        """Resets a kernel into the pool, or retires it."""
+        reason = None
+        if kernel.resets + 1 >= self.max_sessions:
+            reason = "max_sessions"
+        else:
+            try:
+                kernel.reset()
+            except KernelError as e:
+                reason = f"reset failed: {e}"
+        memory = kernel.memory_bytes()
+        if reason is None and self.max_memory_mb and memory:
+            if memory > self.max_memory_mb * 1024 * 1024:
+                reason = "memory"
+        with self._lock:
+            if reason is None and not self._closed and len(self._idle) < self.size:
+                self._idle.append(kernel)
+                self._stats["recycled"] += 1
+                kernel = None
+            else:
+                self._stats["retired"] += 1
+        if kernel is not None:
+            logger.info("Retiring kernel %s: %s", kernel.pid, reason or "pool full")
+            kernel.close()
+        self._wakeup.set()
+
+    def _ensure_maintainer(self):
+        with self._lock:
+            if not self.maintain or self._maintainer is not None or self._closed:
+                return
+            self._maintainer = threading.Thread(
+                target=self._maintain, name="kernel-pool", daemon=True
+            )
+            self._maintainer.start()
+
+    def _maintain(self):
+        """Keeps the pool filled and ends idle sessions."""
+        interval = max(1.0, min(60.0, self.idle_timeout_seconds / 4))
+        while not self._closed:
+            self.prewarm()
+            self.expire()
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
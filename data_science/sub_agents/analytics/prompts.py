@@ -63,6 +63,8 @@ def return_instructions_ds() -> str:
 
   **Available files:** Only use the files that are available as specified in the list of available files.
 
+  **Data in the environment:** Some queries say that the query result is already loaded as the pandas DataFrame `df` and only show its columns and first rows. Use `df` directly; NEVER re-create it from the rows shown.
+
   **Data in prompt:** Some queries contain the input data directly in the prompt. You have to parse that data into a pandas DataFrame. ALWAYS parse all the data. NEVER edit the data that are given to you.
 
   **Answerability:** Some queries may not be answerable with the available data. In those cases, inform the user why you cannot process their query and suggest what type of data would be needed to fulfill their request.
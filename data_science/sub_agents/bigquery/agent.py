@@ -8,8 +8,9 @@ from google.adk.agents import Agent
 from google.adk.agents.callback_context import CallbackContext
 from google.genai import types
 
-from langchain_google_genai import ChatGoogleGenerativeAI
+# from langchain_google_genai import ChatGoogleGenerativeAI
 from data_science.utils.config import config, load_env_variables
+from data_science.utils.tracing import model_call_tracer
 
 
 
@@ -20,7 +21,7 @@ api_key = getattr(config[env_name], 'GOOGLE_API_KEY', os.getenv('GOOGLE_API_KEY'
 
 
 
-from . import tools
+from . import result_tools, tools
 from .chase_sql import chase_db_tools
 from .prompts import return_instructions_bigquery
 
@@ -46,7 +47,12 @@ database_agent = Agent(
             else tools.initial_bq_nl2sql
         ),
         tools.run_bigquery_validation,
+        result_tools.fetch_result_page,
+        result_tools.aggregate_result,
     ],
     before_agent_callback=setup_before_agent_call,
+    before_model_callback=model_call_tracer.before_model,
+    after_model_callback=model_call_tracer.after_model,
+    on_model_error_callback=model_call_tracer.on_model_error,
     generate_content_config=types.GenerateContentConfig(temperature=0.01),
 )
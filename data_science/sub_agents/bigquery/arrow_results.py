@@ -0,0 +1,75 @@
+#
+
+"""Query results as Arrow tables.
+
+Query results are read into a `pyarrow.Table` record batch by record batch,
+instead of one Python dict per row. The table is shared as is by the
+consumers: it is written once as the result file the analysis kernel
+memory-maps and the formatters read (`data_science.utils.result_files`), and
+only the rows shown to the model are converted to Python values.
+"""
+
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from google.cloud.bigquery import _pandas_helpers  # pylint: disable=protected-access
+
+
+def fetch_arrow(
+    results, max_rows: Optional[int] = None, bqstorage_client=None
+) -> pa.Table:
+    """Reads a query result into an Arrow table.
+
+    Args:
+        results: A `bigquery.table.RowIterator`, e.g. from `QueryJob.result()`.
+        max_rows: Stop after this many rows.
+        bqstorage_client: A BigQuery Storage read client to download large
+          results with; the REST API is used without one.
+
+    Returns:
+        pa.Table: The rows, in record batches as downloaded.
+    """
+    batches, num_rows = [], 0
+    for batch in results.to_arrow_iterable(bqstorage_client=bqstorage_client):
+        if max_rows is not None and num_rows + batch.num_rows > max_rows:
+            batch = batch.slice(0, max_rows - num_rows)
+        batches.append(batch)
+        num_rows += batch.num_rows
+        if max_rows is not None and num_rows >= max_rows:
+            break
+    if not batches:
+        # The iterator cannot be read again (e.g. with `to_arrow`), so the
+        # empty table is built from the result's schema.
+        return _empty_table(results.schema)
+    return pa.Table.from_batches(batches)
+
+
+def _empty_table(schema) -> pa.Table:
+    """Returns an empty table with the columns of a BigQuery schema."""
+    arrow_schema = _pandas_helpers.bq_to_arrow_schema(schema)
+    if arrow_schema is None:  # A column type without an Arrow equivalent.
+        arrow_schema = pa.schema([(field.name, pa.null()) for field in schema])
+    return arrow_schema.empty_table()
+
+
+def to_rows(
+    table: pa.Table, max_rows: Optional[int] = None, offset: int = 0
+) -> list[dict]:
+    """Converts (`max_rows` rows from `offset` of) a table to JSON-friendly dicts.
+
+    Dates become "YYYY-MM-DD" strings, datetimes and timestamps ISO-like
+    strings and NUMERIC and BIGNUMERIC values floats, converted column-wise
+    before the rows are built.
+    """
+    table = table.slice(offset, max_rows)
+    columns = []
+    for column in table.columns:
+        if pa.types.is_date(column.type):
+            column = pc.strftime(column, format="%Y-%m-%d")
+        elif pa.types.is_timestamp(column.type) or pa.types.is_time(column.type):
+            column = pc.cast(column, pa.string())
+        elif pa.types.is_decimal(column.type):
+            column = pc.cast(column, pa.float64())
+        columns.append(column)
+    return pa.table(columns, names=table.column_names).to_pylist()
@@ -24,6 +24,9 @@ chase_sql_constants_dict: immutabledict.immutabledict[str, Any] = (
             "temperature": 0.5,
             # Type of SQL generation method.
             "generate_sql_type": "dc",
+            # Whether to serve the static prompt prefix (instructions, examples
+            # and schema) from a Vertex AI context cache.
+            "use_context_cache": True,
         }
     )
 )
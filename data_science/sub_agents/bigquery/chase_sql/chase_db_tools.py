@@ -2,14 +2,18 @@
 
 """This code contains the implementation of the tools used for the CHASE-SQL agent."""
 
+import asyncio
 import enum
 import os
 
+from data_science.utils.context_cache import get_context_cache_manager
+from data_science.utils.prompt_budget import SCHEMA_REDUCERS, PromptBuilder
+from data_science.utils.state_budget import state_manager
 from google.adk.tools import ToolContext
 
 # pylint: disable=g-importing-member
 from .dc_prompt_template import DC_PROMPT_TEMPLATE
-from .llm_utils import GeminiModel
+from .llm_utils import get_gemini_model
 from .qp_prompt_template import QP_PROMPT_TEMPLATE
 from .sql_postprocessor import sql_translator
 
@@ -17,6 +21,9 @@ from .sql_postprocessor import sql_translator
 
 BQ_PROJECT_ID = os.getenv("BQ_PROJECT_ID")
 
+# Start of the dynamic part of the ChaseSQL templates.
+QUESTION_SECTION = "**************************\n【Question】"
+
 
 class GenerateSQLType(enum.Enum):
     """Enum for the different types of SQL generation methods.
@@ -67,7 +74,36 @@ def parse_response(response: str) -> str:
     return query.strip()
 
 
-def initial_bq_nl2sql(
+def cache_static_prefix(
+    model_name: str, template: str, fingerprint: str, prompt: str
+) -> tuple[str, str, str | None]:
+    """Splits a ChaseSQL prompt and caches its static prefix.
+
+    Everything before the question (instructions, few-shot examples and the
+    schema) only changes with the template and the schema, so it is served
+    from a context cache keyed by (model, template, schema fingerprint).
+
+    Args:
+      model_name: The model generating the candidates.
+      template: The template identifier, e.g. "dc" or "qp".
+      fingerprint: The schema fingerprint.
+      prompt: The full prompt.
+
+    Returns:
+      tuple: The prefix, the remaining prompt, and the cache name holding the
+      prefix, or None if it is not cached (the caller then sends both parts).
+    """
+    index = prompt.find(QUESTION_SECTION)
+    if index <= 0:
+        return "", prompt, None
+    prefix, suffix = prompt[:index], prompt[index:]
+    cache_name = get_context_cache_manager().get(
+        model_name, template, fingerprint, prefix
+    )
+    return prefix, suffix, cache_name
+
+
+async def initial_bq_nl2sql(
     question: str,
     tool_context: ToolContext,
 ) -> str:
@@ -81,39 +117,54 @@ def initial_bq_nl2sql(
       str: An SQL statement to answer this question.
     """
     print("****** Running agent with ChaseSQL algorithm.")
-    ddl_schema = tool_context.state["database_settings"]["bq_ddl_schema"]
-    project = tool_context.state["database_settings"]["bq_project_id"]
-    db = tool_context.state["database_settings"]["bq_dataset_id"]
-    transpile_to_bigquery = tool_context.state["database_settings"][
-        "transpile_to_bigquery"
-    ]
-    process_input_errors = tool_context.state["database_settings"][
-        "process_input_errors"
-    ]
-    process_tool_output_errors = tool_context.state["database_settings"][
-        "process_tool_output_errors"
-    ]
-    number_of_candidates = tool_context.state["database_settings"][
-        "number_of_candidates"
-    ]
-    model = tool_context.state["database_settings"]["model"]
-    temperature = tool_context.state["database_settings"]["temperature"]
-    generate_sql_type = tool_context.state["database_settings"]["generate_sql_type"]
+    database_settings = await state_manager.load(tool_context, "database_settings")
+    ddl_schema = database_settings["bq_ddl_schema"]
+    project = database_settings["bq_project_id"]
+    db = database_settings["bq_dataset_id"]
+    transpile_to_bigquery = database_settings["transpile_to_bigquery"]
+    process_input_errors = database_settings["process_input_errors"]
+    process_tool_output_errors = database_settings["process_tool_output_errors"]
+    number_of_candidates = database_settings["number_of_candidates"]
+    model = database_settings["model"]
+    temperature = database_settings["temperature"]
+    generate_sql_type = database_settings["generate_sql_type"]
 
     if generate_sql_type == GenerateSQLType.DC.value:
-        prompt = DC_PROMPT_TEMPLATE.format(
-            SCHEMA=ddl_schema, QUESTION=question, BQ_PROJECT_ID=BQ_PROJECT_ID
-        )
+        template = DC_PROMPT_TEMPLATE
     elif generate_sql_type == GenerateSQLType.QP.value:
-        prompt = QP_PROMPT_TEMPLATE.format(
-            SCHEMA=ddl_schema, QUESTION=question, BQ_PROJECT_ID=BQ_PROJECT_ID
-        )
+        template = QP_PROMPT_TEMPLATE
     else:
         raise ValueError(f"Unsupported generate_sql_type: {generate_sql_type}")
-
-    model = GeminiModel(model_name=model, temperature=temperature)
+    prompt = (
+        PromptBuilder("chase_nl2sql", template, SCHEMA_REDUCERS)
+        .build(SCHEMA=ddl_schema, QUESTION=question, BQ_PROJECT_ID=BQ_PROJECT_ID)
+        .text
+    )
+
+    candidate_model = model = get_gemini_model(
+        model_name=model, temperature=temperature
+    )
+    # Cache creation and the model calls block, so they run in threads.
+    if database_settings.get("use_context_cache"):
+        prefix, prompt, cache_name = await asyncio.to_thread(
+            cache_static_prefix,
+            model.model_name,
+            generate_sql_type,
+            database_settings.get("bq_schema_fingerprint", ""),
+            prompt,
+        )
+        if cache_name:
+            candidate_model = get_gemini_model(
+                model_name=model.model_name,
+                temperature=temperature,
+                cache_name=cache_name,
+            )
+        else:
+            prompt = prefix + prompt
     requests = [prompt for _ in range(number_of_candidates)]
-    responses = model.call_parallel(requests, parser_func=parse_response)
+    responses = await asyncio.to_thread(
+        candidate_model.call_parallel, requests, parser_func=parse_response
+    )
     # Take just the first response.
     responses = responses[0]
 
@@ -128,8 +179,12 @@ def initial_bq_nl2sql(
         )
         # pylint: disable=g-bad-todo
         # pylint: enable=g-bad-todo
-        responses: str = translator.translate(
-            responses, ddl_schema=ddl_schema, db=db, catalog=project
+        responses: str = await asyncio.to_thread(
+            translator.translate,
+            responses,
+            ddl_schema=ddl_schema,
+            db=db,
+            catalog=project,
         )
 
     return responses
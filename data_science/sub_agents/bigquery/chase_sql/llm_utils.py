@@ -2,6 +2,7 @@
 
 """This code contains the LLM utils for the CHASE-SQL Agent."""
 
+import contextvars
 import functools
 import os
 import random
@@ -10,22 +11,27 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Callable, List, Optional
 
 import dotenv
-import vertexai
-from google.cloud import aiplatform
-from vertexai.generative_models import (GenerationConfig, HarmBlockThreshold,
-                                        HarmCategory)
-from vertexai.preview import caching
-from vertexai.preview.generative_models import GenerativeModel
 
+from data_science.utils.clients import registry as llm_clients
+from data_science.utils.tracing import record_llm_usage
+
+# Values in .env take precedence over the environment for CHASE-SQL.
 dotenv.load_dotenv(override=True)
 
-SAFETY_FILTER_CONFIG = {
-    HarmCategory.HARM_CATEGORY_UNSPECIFIED: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-}
+
+@functools.lru_cache(maxsize=None)
+def safety_filter_config():
+    """Returns the safety settings used for every Gemini call."""
+    # pylint: disable=import-outside-toplevel
+    from vertexai.generative_models import HarmBlockThreshold, HarmCategory
+
+    return {
+        HarmCategory.HARM_CATEGORY_UNSPECIFIED: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+    }
 
 GCP_PROJECT = os.getenv("GOOGLE_CLOUD_PROJECT")
 GCP_LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION")
@@ -61,13 +67,6 @@ GEMINI_URL = (
     "projects/{GCP_PROJECT}/locations/{region}/publishers/google/models/{model_name}"
 )
 
-aiplatform.init(
-    project=GCP_PROJECT,
-    location=GCP_LOCATION,
-)
-vertexai.init(project=GCP_PROJECT, location=GCP_LOCATION)
-
-
 def retry(max_attempts=8, base_delay=1, backoff_factor=2):
     """Decorator to add retry logic to a function.
 
@@ -127,13 +126,10 @@ class GeminiModel:
                 region=random_region,
                 model_name=self.model_name,
             )
-        if cache_name is not None:
-            cached_content = caching.CachedContent(cached_content_name=cache_name)
-            self.model = GenerativeModel.from_cached_content(
-                cached_content=cached_content
-            )
-        else:
-            self.model = GenerativeModel(model_name=model_name)
+        # The underlying GenerativeModel is shared process-wide per model (and
+        # cached content), so constructing a GeminiModel is cheap. The Vertex AI
+        # SDK is imported and initialized on the first one, not at import time.
+        self.model = llm_clients.generative_model(model_name, cache_name=cache_name)
 
     @retry(max_attempts=12, base_delay=2, backoff_factor=2)
     def call(self, prompt: str, parser_func=None) -> str:
@@ -148,14 +144,21 @@ class GeminiModel:
         Returns:
             str: The processed response from the model.
         """
-        response = self.model.generate_content(
-            prompt,
-            generation_config=GenerationConfig(
-                temperature=self.temperature,
-                **self.arguments,
-            ),
-            safety_settings=SAFETY_FILTER_CONFIG,
-        ).text
+        from vertexai.generative_models import (  # pylint: disable=import-outside-toplevel
+            GenerationConfig,
+        )
+
+        with llm_clients.track(self.model_name) as span:
+            result = self.model.generate_content(
+                prompt,
+                generation_config=GenerationConfig(
+                    temperature=self.temperature,
+                    **self.arguments,
+                ),
+                safety_settings=safety_filter_config(),
+            )
+            record_llm_usage(span, result)
+            response = result.text
         if parser_func:
             return parser_func(response)
         return response
@@ -196,10 +199,14 @@ class GeminiModel:
                     else:
                         return f"Error after retries: {str(e)}"
 
-        # Create and start one thread for each prompt
+        # Create and start one thread for each prompt. Each worker runs in a
+        # copy of the caller's context so that its spans nest under the
+        # caller's span.
         with ThreadPoolExecutor(max_workers=len(prompts)) as executor:
             future_to_index = {
-                executor.submit(worker, i, prompt): i
+                executor.submit(
+                    contextvars.copy_context().run, worker, i, prompt
+                ): i
                 for i, prompt in enumerate(prompts)
             }
 
@@ -219,3 +226,16 @@ class GeminiModel:
                 results[index] = "Timeout"
 
         return results
+
+
+# Bounded: models bound to context caches that were since deleted fall out.
+@functools.lru_cache(maxsize=32)
+def get_gemini_model(
+    model_name: str = "gemini-1.5-flash",
+    temperature: float = 0.01,
+    cache_name: str | None = None,
+) -> GeminiModel:
+    """Returns a shared GeminiModel for the given model, temperature and cache."""
+    return GeminiModel(
+        model_name=model_name, temperature=temperature, cache_name=cache_name
+    )
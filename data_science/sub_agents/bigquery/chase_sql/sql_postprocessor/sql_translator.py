@@ -2,14 +2,16 @@
 
 """Translator from SQLite to BigQuery."""
 
+import logging
 import re
 from typing import Any, Final
 
 import regex
 import sqlglot
 import sqlglot.optimizer
+from data_science.utils.tracing import traced, tracer
 
-from ..llm_utils import GeminiModel  # pylint: disable=g-importing-member
+from ..llm_utils import GeminiModel, get_gemini_model  # pylint: disable=g-importing-member
 from .correction_prompt_template import (
     CORRECTION_PROMPT_TEMPLATE_V1_0,
 )  # pylint: disable=g-importing-member
@@ -121,7 +123,9 @@ class SqlTranslator:
         self._tool_output_errors: str | None = None
         self._temperature: float = temperature
         if isinstance(model, str):
-            self._model = GeminiModel(model_name=model, temperature=self._temperature)
+            self._model = get_gemini_model(
+                model_name=model, temperature=self._temperature
+            )
         else:
             self._model = model
 
@@ -308,29 +312,36 @@ class SqlTranslator:
           tuple of the errors in the SQL query, or None if there are no errors, and
           the SQL query after optimization.
         """
-        try:
-            # First, try to parse the SQL query into a SQLGlot AST.
-            sql_query_ast = sqlglot.parse_one(
-                sql=sql_query,
-                read=sql_dialect.lower(),
-                error_level=sqlglot.ErrorLevel.IMMEDIATE,
-            )
-            # Then add the database and catalog information for each table to the AST.
-            for table in sql_query_ast.find_all(sqlglot.exp.Table):
-                table.set("catalog", sqlglot.exp.Identifier(this=catalog, quoted=True))
-                table.set("db", sqlglot.exp.Identifier(this=db, quoted=True))
-            # Then, try to optimize the SQL query.
-            sql_query_ast = sqlglot.optimizer.optimize(
-                sql_query_ast,
-                dialect=sql_dialect.lower(),
-                schema=schema_dict,
-                db=db,
-                catalog=catalog,
-                error_level=sqlglot.ErrorLevel.IMMEDIATE,
-            )
-            sql_query = sql_query_ast.sql(sql_dialect.lower())
-        except sqlglot.errors.SqlglotError as e:
-            return str(e), sql_query
+        with tracer.span("sqlglot.check_errors", dialect=sql_dialect.lower()) as span:
+            try:
+                # First, try to parse the SQL query into a SQLGlot AST.
+                with tracer.span("sqlglot.parse"):
+                    sql_query_ast = sqlglot.parse_one(
+                        sql=sql_query,
+                        read=sql_dialect.lower(),
+                        error_level=sqlglot.ErrorLevel.IMMEDIATE,
+                    )
+                # Then add the database and catalog information for each table to the AST.
+                for table in sql_query_ast.find_all(sqlglot.exp.Table):
+                    table.set(
+                        "catalog", sqlglot.exp.Identifier(this=catalog, quoted=True)
+                    )
+                    table.set("db", sqlglot.exp.Identifier(this=db, quoted=True))
+                # Then, try to optimize the SQL query.
+                with tracer.span("sqlglot.optimize"):
+                    sql_query_ast = sqlglot.optimizer.optimize(
+                        sql_query_ast,
+                        dialect=sql_dialect.lower(),
+                        schema=schema_dict,
+                        db=db,
+                        catalog=catalog,
+                        error_level=sqlglot.ErrorLevel.IMMEDIATE,
+                    )
+                sql_query = sql_query_ast.sql(sql_dialect.lower())
+            except sqlglot.errors.SqlglotError as e:
+                span.set(has_errors=True)
+                return str(e), sql_query
+            span.set(has_errors=False)
         return None, sql_query
 
     def _fix_errors(
@@ -375,7 +386,7 @@ class SqlTranslator:
         errors, sql_query = errors_and_sql
         responses = sql_query  # Default to the input SQL query after error check.
         if errors:
-            print("Processing input errors")
+            logging.info("Correcting SQL errors: %s", errors)
             if schema_dict:
                 # If the schema is provided, then insert it into the prompt.
                 schema_insert = f"\nThe database schema is:\n{schema_dict}\n"
@@ -403,6 +414,7 @@ class SqlTranslator:
                     responses = responses[0]
         return responses
 
+    @traced("sql_translator.translate")
     def translate(
         self,
         sql_query: str,
@@ -423,7 +435,7 @@ class SqlTranslator:
         Returns:
           The translated SQL query.
         """
-        print("****** sql_query at translator entry:", sql_query)
+        logging.debug("SQL at translator entry: %s", sql_query)
         if self._process_input_errors:
             sql_query = self._fix_errors(
                 sql_query,
@@ -433,16 +445,19 @@ class SqlTranslator:
                 ddl_schema=ddl_schema,
                 apply_heuristics=True,
             )
-        print("****** sql_query after fix_errors:", sql_query)
-        sql_query = sqlglot.transpile(
-            sql=sql_query,
-            read=self.INPUT_DIALECT,
-            write=self.OUTPUT_DIALECT,
-            error_level=sqlglot.ErrorLevel.IMMEDIATE,
-        )[
-            0
-        ]  # Transpile returns a list of strings.
-        print("****** sql_query after transpile:", sql_query)
+        logging.debug("SQL after fix_errors: %s", sql_query)
+        with tracer.span(
+            "sqlglot.transpile", read=self.INPUT_DIALECT, write=self.OUTPUT_DIALECT
+        ):
+            sql_query = sqlglot.transpile(
+                sql=sql_query,
+                read=self.INPUT_DIALECT,
+                write=self.OUTPUT_DIALECT,
+                error_level=sqlglot.ErrorLevel.IMMEDIATE,
+            )[
+                0
+            ]  # Transpile returns a list of strings.
+        logging.debug("SQL after transpile: %s", sql_query)
         if self._tool_output_errors:
             sql_query = self._fix_errors(
                 sql_query,
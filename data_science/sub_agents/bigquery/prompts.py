@@ -25,7 +25,8 @@ def return_instructions_bigquery() -> str:
 
       Use the provided tools to help generate the most accurate SQL:
       1. First, use {db_tool_name} tool to generate initial SQL from the question.
-      2. You should also validate the SQL you have created for syntax and function errors (Use run_bigquery_validation tool). If there are any errors, you should go back and address the error in the SQL. Recreate the SQL based by addressing the error.
+      2. You should also validate the SQL you have created for syntax and function errors (Use run_bigquery_validation tool). If there are any errors, you should go back and address the error in the SQL. Recreate the SQL based by addressing the error. When the result has "fixes" (unknown tables or columns, mismatched join types found before running the query), apply them. When "attempts_left" is 0, do not retry: report that no valid SQL was found, with the last error.
+      3. If run_bigquery_validation returns a "note" that only part of the result is shown, do not answer from the shown rows alone: use aggregate_result (totals, counts, averages over all rows) or fetch_result_page (more rows) with its "result_id", and mention the "result_id" in "nl_results".
       4. Generate the final result in JSON format with four keys: "explain", "sql", "sql_results", "nl_results".
           "explain": "write out step-by-step reasoning to explain how you are generating the query based on the schema, example, and question.",
           "sql": "Output your generated SQL!",
@@ -0,0 +1,200 @@
+#
+
+"""Tools reading stored query results by page or as aggregates.
+
+`run_bigquery_validation` returns the first `MAX_NUM_ROWS` rows of a result
+and stores all of it under a `result_id`. These tools let agents read further
+pages of the result, or compute aggregates over all of its rows, without
+re-running the query or putting the whole result in the prompt.
+"""
+
+import math
+from typing import Optional
+
+from google.adk.tools import ToolContext
+import pyarrow as pa
+import pyarrow.compute as pc
+from data_science.utils.result_files import SCOPE_KEY, open_result
+from data_science.utils.tracing import traced
+
+from .arrow_results import to_rows
+from .tools import MAX_NUM_ROWS
+
+# Aggregate functions by name in `aggregate_result`, as pyarrow hash aggregates.
+AGGREGATES = {
+    "count": "count",
+    "count_distinct": "count_distinct",
+    "sum": "sum",
+    "mean": "mean",
+    "avg": "mean",
+    "min": "min",
+    "max": "max",
+    "stddev": "stddev",
+    "variance": "variance",
+    "median": "approximate_median",
+}
+# Functions that only apply to numeric columns.
+NUMERIC_AGGREGATES = {"sum", "mean", "avg", "stddev", "variance", "median"}
+
+
+def _is_numeric(arrow_type) -> bool:
+    return (
+        pa.types.is_integer(arrow_type)
+        or pa.types.is_floating(arrow_type)
+        or pa.types.is_decimal(arrow_type)
+    )
+
+
+def _open(result_id: str, tool_context: ToolContext):
+    """Opens a result of the session of `tool_context`."""
+    try:
+        return open_result(result_id, tool_context.state.get(SCOPE_KEY) or ""), None
+    except (KeyError, ValueError):
+        return None, {
+            "error_message": f"Unknown result_id {result_id!r}; run the query again."
+        }
+
+
+@traced("result.fetch_page")
+def fetch_result_page(result_id: str, page: int, tool_context: ToolContext) -> dict:
+    """Fetches one page of rows of a stored query result.
+
+    Args:
+        result_id (str): The result_id returned by run_bigquery_validation.
+        page (int): The page number, starting at 1. Page 1 holds the rows
+          already returned with the query.
+        tool_context (ToolContext): The tool context; results are only read
+          from the session's own results.
+
+    Returns:
+        dict: The rows of the page ("rows"), the page number, the number of
+          pages and the total number of rows, or an "error_message".
+    """
+    table, error = _open(result_id, tool_context)
+    if error:
+        return error
+    pages = max(1, math.ceil(table.num_rows / MAX_NUM_ROWS))
+    if not 1 <= page <= pages:
+        return {"error_message": f"Page {page} out of range; there are {pages} pages."}
+    return {
+        "result_id": result_id,
+        "page": page,
+        "pages": pages,
+        "total_rows": table.num_rows,
+        "rows": to_rows(table, MAX_NUM_ROWS, offset=(page - 1) * MAX_NUM_ROWS),
+    }
+
+
+@traced("result.aggregate")
+def aggregate_result(
+    result_id: str,
+    aggregations: list[str],
+    tool_context: ToolContext,
+    group_by: Optional[list[str]] = None,
+    order_by: Optional[str] = None,
+    descending: bool = True,
+) -> dict:
+    """Computes aggregates over all rows of a stored query result.
+
+    Args:
+        result_id (str): The result_id returned by run_bigquery_validation.
+        aggregations (list[str]): Aggregates as "function:column", e.g.
+          "sum:num_sold" or "count_distinct:country"; "count" alone counts
+          rows. Functions: count, count_distinct, sum, mean (avg), min, max,
+          stddev, variance, median; all but count, count_distinct, min and
+          max need a numeric column.
+        tool_context (ToolContext): The tool context; results are only read
+          from the session's own results.
+        group_by (list[str]): Columns to group by; no grouping aggregates
+          the whole result into one row.
+        order_by (str): An output column to sort the groups by, e.g.
+          "sum_num_sold".
+        descending (bool): Whether to sort in descending order.
+
+    Returns:
+        dict: The aggregated rows (at most MAX_NUM_ROWS, "rows") and the
+          number of groups, or an "error_message".
+    """
+    table, error = _open(result_id, tool_context)
+    if error:
+        return error
+    group_by = list(group_by or [])
+    specs, names = [], []
+    for aggregation in aggregations:
+        function, _, column = aggregation.partition(":")
+        function = function.strip().lower()
+        column = column.strip()
+        if function not in AGGREGATES:
+            return {
+                "error_message": f"Unknown aggregate {function!r}; use one of"
+                f" {sorted(AGGREGATES)}."
+            }
+        if function == "count" and column in ("", "*"):
+            spec, name = ([], "count_all"), "count"
+        elif column not in table.column_names:
+            return {
+                "error_message": f"Unknown column {column!r}; columns are"
+                f" {table.column_names}."
+            }
+        elif function in NUMERIC_AGGREGATES and not _is_numeric(
+            table.schema.field(column).type
+        ):
+            return {
+                "error_message": f"{function} needs a numeric column, but"
+                f" {column!r} is {table.schema.field(column).type}; use count,"
+                " count_distinct, min or max."
+            }
+        else:
+            spec, name = (column, AGGREGATES[function]), f"{function}_{column}"
+        # The same aggregate twice (e.g. "avg:x" and "mean:x") is computed once.
+        if spec in specs:
+            continue
+        specs.append(spec)
+        names.append(name)
+    unknown = [c for c in group_by if c not in table.column_names]
+    if unknown or not specs:
+        return {
+            "error_message": f"Unknown group_by columns {unknown}."
+            if unknown
+            else "No aggregations given."
+        }
+
+    try:
+        grouped = table.group_by(group_by).aggregate(specs)
+    except (pa.ArrowException, KeyError) as e:
+        return {"error_message": f"Aggregation failed: {e}"}
+    # pyarrow names the aggregates "<column>_<function>" (and the row count
+    # "count_all"); the column order differs between versions.
+    grouped = pa.table(
+        [grouped.column(c) for c in group_by]
+        + [
+            grouped.column(f"{column}_{function}" if column else function)
+            for column, function in specs
+        ],
+        names=group_by + names,
+    )
+    if order_by:
+        if order_by not in grouped.column_names:
+            return {
+                "error_message": f"Unknown order_by column {order_by!r}; columns"
+                f" are {grouped.column_names}."
+            }
+        grouped = grouped.take(
+            pc.sort_indices(
+                grouped,
+                sort_keys=[(order_by, "descending" if descending else "ascending")],
+            )
+        )
+    rows = to_rows(grouped, MAX_NUM_ROWS)
+    result = {
+        "result_id": result_id,
+        "rows_aggregated": table.num_rows,
+        "groups": grouped.num_rows,
+        "rows": rows,
+    }
+    if len(rows) < grouped.num_rows:
+        result["note"] = (
+            f"Only the first {len(rows)} of {grouped.num_rows} groups are shown;"
+            " use order_by to choose which."
+        )
+    return result
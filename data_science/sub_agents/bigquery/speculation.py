@@ -0,0 +1,254 @@
+"""Speculative NL2SQL while the root agent decides what to do.
+
+For most questions about the data, the root agent's first model call ends in
+`call_db_agent` with a near-verbatim rewrite of the user's question, and only
+then does the database agent generate SQL. In speculative mode
+(`SPECULATIVE_SQL=true`), `speculate_sql`, a `before_model_callback` of the
+root agent, starts generating SQL for the raw question and checking it with a
+BigQuery dry run as soon as the turn's first model call starts, in parallel
+with it.
+
+When `call_db_agent` is then called in the same invocation, it claims the
+speculation: if its question is close enough to the user's
+(`SPECULATIVE_SQL_MIN_SIMILARITY`, 0.8 by default) and the dry run passed,
+the first `initial_bq_nl2sql` call of the database agent returns the
+speculative SQL instead of calling the model. Otherwise the speculation is
+discarded. Questions that mention no table or column of the schema are not
+speculated on. Only the baseline NL2SQL method (`NL2SQL_METHOD=BASELINE`) is
+supported; with CHASE nothing is speculated. A speculation not claimed by
+the end of its invocation is cancelled by `discard_speculative_sql`, an
+`after_agent_callback` of the root agent.
+"""
+
+import asyncio
+import contextlib
+import difflib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from data_science.utils.intent_router import SCHEMA, classify, intent_router, turn_question
+from data_science.utils.state_budget import state_manager
+from data_science.utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# The claimed speculative SQL of the running `call_db_agent`, in a list so that
+# the database agent's tool calls, which run in copies of the context, share it.
+_claimed: ContextVar[Optional[list]] = ContextVar("speculative_sql", default=None)
+
+
+def question_similarity(a: str, b: str) -> float:
+    """Similarity (0 to 1) of two questions, ignoring case and punctuation."""
+    words = lambda text: " ".join(re.findall(r"[a-z0-9_]+", text.lower()))
+    return difflib.SequenceMatcher(None, words(a), words(b)).ratio()
+
+
+def _generate_and_dry_run(question: str, ddl_schema: str) -> dict:
+    from . import tools  # pylint: disable=import-outside-toplevel
+
+    sql = tools.generate_sql(question, ddl_schema)
+    if not sql:
+        return {"sql": sql, "error": "No SQL was generated."}
+    return {"sql": sql, **tools.dry_run_sql(sql)}
+
+
+@dataclass
+class Speculation:
+    """A speculative NL2SQL run for a question."""
+
+    question: str
+    task: asyncio.Future
+    started: float
+
+
+class SpeculativeSql:
+    """Runs NL2SQL ahead of the root agent and hands the result to the DB agent.
+
+    Args:
+        enabled: Whether questions are speculated on. Defaults to the
+          `SPECULATIVE_SQL` environment variable (false unless "true").
+        min_similarity: The similarity of the forwarded question to the
+          user's above which the speculation is used. Defaults to
+          `SPECULATIVE_SQL_MIN_SIMILARITY`, or 0.8.
+        generate: Generates and dry-runs SQL for (question, DDL schema), and
+          returns the "sql" and the dry run's "error". Defaults to the
+          baseline NL2SQL and a BigQuery dry run.
+        wait_seconds: How long a claim waits for a speculation still running.
+        max_pending: The number of unclaimed speculations kept.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        min_similarity: Optional[float] = None,
+        generate: Callable[[str, str], dict] = _generate_and_dry_run,
+        wait_seconds: float = 60.0,
+        max_pending: int = 64,
+    ):
+        self.enabled = enabled
+        self.min_similarity = min_similarity
+        self.generate = generate
+        self.wait_seconds = wait_seconds
+        self.max_pending = max_pending
+        self._pending: OrderedDict[str, Speculation] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ("started", "reused", "mismatched", "invalid", "failed", "unclaimed"), 0
+        )
+
+    def is_enabled(self) -> bool:
+        if self.enabled is not None:
+            return self.enabled
+        return os.getenv("SPECULATIVE_SQL", "false").lower() == "true"
+
+    def similarity_threshold(self) -> float:
+        if self.min_similarity is not None:
+            return self.min_similarity
+        return float(os.getenv("SPECULATIVE_SQL_MIN_SIMILARITY", "0.8"))
+
+    def start(self, key: str, question: str, ddl_schema: str) -> Speculation:
+        """Starts generating SQL for `question` in the background.
+
+        Args:
+            key: The invocation the speculation belongs to.
+            question: The user's question.
+            ddl_schema: The DDL schema of the dataset.
+        """
+        speculation = Speculation(
+            question=question,
+            task=asyncio.ensure_future(
+                asyncio.to_thread(self._run, question, ddl_schema)
+            ),
+            started=time.perf_counter(),
+        )
+        with self._lock:
+            self._stats["started"] += 1
+            previous = self._pending.pop(key, None)
+            self._pending[key] = speculation
+            evicted = [previous] if previous else []
+            while len(self._pending) > self.max_pending:
+                evicted.append(self._pending.popitem(last=False)[1])
+            self._stats["unclaimed"] += len(evicted)
+        for old in evicted:
+            old.task.cancel()
+        return speculation
+
+    def _run(self, question: str, ddl_schema: str) -> Optional[dict]:
+        with tracer.span("speculative_sql.generate") as span:
+            try:
+                result = self.generate(question, ddl_schema)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning("Speculative NL2SQL failed: %r", e)
+                span.set(error=str(e))
+                return None
+            span.set(valid=not result.get("error"))
+        return result
+
+    async def claim(self, key: str, question: str) -> Optional[str]:
+        """Returns the speculative SQL of invocation `key` if it can be used.
+
+        The speculation is removed either way. It is used if `question` is
+        close to the question it was started for and its dry run passed.
+        """
+        with self._lock:
+            speculation = self._pending.pop(key, None)
+        if speculation is None:
+            return None
+
+        with tracer.span("speculative_sql.claim") as span:
+            similarity = question_similarity(speculation.question, question)
+            span.set(similarity=round(similarity, 3))
+            if similarity < self.similarity_threshold():
+                speculation.task.cancel()
+                outcome, sql = "mismatched", None
+            else:
+                try:
+                    result = await asyncio.wait_for(
+                        asyncio.shield(speculation.task), self.wait_seconds
+                    )
+                except asyncio.TimeoutError:
+                    speculation.task.cancel()
+                    result = None
+                if result is None:
+                    outcome, sql = "failed", None
+                elif result.get("error"):
+                    outcome, sql = "invalid", None
+                else:
+                    outcome, sql = "reused", result["sql"]
+            span.set(
+                outcome=outcome,
+                age_ms=round((time.perf_counter() - speculation.started) * 1e3, 1),
+            )
+        with self._lock:
+            self._stats[outcome] += 1
+        logger.info(
+            "Speculative SQL %s (similarity %.2f): %r", outcome, similarity, question[:200]
+        )
+        return sql
+
+    def discard(self, key: str):
+        """Cancels the speculation of invocation `key` if it was not claimed."""
+        with self._lock:
+            speculation = self._pending.pop(key, None)
+            if speculation is not None:
+                self._stats["unclaimed"] += 1
+        if speculation is not None:
+            speculation.task.cancel()
+
+    def stats(self) -> dict:
+        """Returns the number of speculations per outcome."""
+        with self._lock:
+            return dict(self._stats)
+
+
+speculative_sql = SpeculativeSql()
+
+
+@contextlib.contextmanager
+def use_speculative_sql(sql: Optional[str]):
+    """Makes `sql` the result of the next `initial_bq_nl2sql` call in this context."""
+    token = _claimed.set([sql] if sql else [])
+    try:
+        yield
+    finally:
+        _claimed.reset(token)
+
+
+def pop_speculative_sql() -> Optional[str]:
+    """Returns the claimed speculative SQL, once."""
+    claimed = _claimed.get()
+    return claimed.pop() if claimed else None
+
+
+async def speculate_sql(callback_context, llm_request):
+    """`before_model_callback` starting speculative NL2SQL for a new question."""
+    if not speculative_sql.is_enabled():
+        return None
+    # Only the baseline method's `initial_bq_nl2sql` uses the speculation.
+    if os.getenv("NL2SQL_METHOD", "BASELINE") != "BASELINE":
+        return None
+    question = turn_question(llm_request)
+    if question is None:
+        return None
+    tables = await intent_router.tables(callback_context)
+    intent = classify(question, tables)
+    if intent.kind == SCHEMA or not (intent.tables or intent.columns):
+        return None
+    db_settings = await state_manager.load(callback_context, "database_settings")
+    speculative_sql.start(
+        callback_context.invocation_id, question, db_settings["bq_ddl_schema"]
+    )
+    return None
+
+
+async def discard_speculative_sql(callback_context):
+    """`after_agent_callback` cancelling the invocation's unclaimed speculation."""
+    speculative_sql.discard(callback_context.invocation_id)
+    return None
@@ -0,0 +1,146 @@
+#
+
+"""AST-based safety checks for the SQL run by the database agent."""
+
+from dataclasses import dataclass
+from typing import Optional
+
+import sqlglot
+from data_science.utils.tracing import tracer
+
+# Statement classes by sqlglot expression name. Names rather than classes keep
+# this independent of renames across sqlglot versions (e.g. AlterTable/Alter).
+_DML = {"Insert", "Update", "Delete", "Merge"}
+_DDL = {"Create", "Drop", "Alter", "AlterTable", "TruncateTable", "Rename"}
+_KEYWORD_TOKENS = {
+    "INSERT", "UPDATE", "DELETE", "MERGE", "CREATE", "DROP", "ALTER",
+    "TRUNCATE", "GRANT", "REVOKE", "EXECUTE", "CALL", "EXPORT",
+}
+
+
+@dataclass
+class SqlCheck:
+    """Outcome of checking a SQL string.
+
+    Attributes:
+        sql: The SQL to run: the input, with a LIMIT injected or clamped.
+        statement_type: "query", "dml", "ddl", "multiple" or "other".
+        allowed: Whether the SQL is a single read-only query.
+        reason: Why the SQL was rejected.
+        limit_action: "injected", "clamped" or None.
+    """
+
+    sql: str
+    statement_type: str
+    allowed: bool
+    reason: Optional[str] = None
+    limit_action: Optional[str] = None
+
+
+def _classify(expression) -> str:
+    names = {type(node).__name__ for node in expression.walk()}
+    if names & _DML:
+        return "dml"
+    if names & _DDL:
+        return "ddl"
+    if isinstance(expression, sqlglot.exp.Query):
+        return "query"
+    return "other"
+
+
+def _classify_tokens(sql: str, dialect: str) -> str:
+    """Classifies SQL sqlglot cannot parse from its keyword tokens."""
+    try:
+        tokens = sqlglot.Dialect.get_or_raise(dialect).tokenize(sql)
+    except sqlglot.errors.SqlglotError:
+        return "other"
+    names = {token.token_type.name for token in tokens}
+    if names & _KEYWORD_TOKENS:
+        return "other"
+    if tokens and tokens[0].token_type.name in {"SELECT", "WITH", "L_PAREN"}:
+        return "query"
+    return "other"
+
+
+def _strip_semicolons(sql: str, dialect: str) -> str:
+    """Removes the trailing semicolons of `sql`, keeping comments after them."""
+    tokens = sqlglot.tokenize(sql, read=dialect)
+    while tokens and tokens[-1].token_type.name == "SEMICOLON":
+        token = tokens.pop()
+        sql = sql[: token.start] + sql[token.end + 1 :]
+    return sql.rstrip()
+
+
+def _apply_limit(sql: str, expression, max_rows: int, dialect: str):
+    """Injects or clamps the LIMIT of the outermost query."""
+    limit = expression.args.get("limit")
+    if limit is None:
+        # Appending keeps the original text (and formatting) intact; the
+        # newline guards against a trailing line comment.
+        return _strip_semicolons(sql, dialect) + f"\nLIMIT {max_rows}", "injected"
+    value = limit.args.get("expression")
+    if isinstance(value, sqlglot.exp.Literal) and value.is_int:
+        if int(value.this) > max_rows:
+            limit.set("expression", sqlglot.exp.Literal.number(max_rows))
+            return expression.sql(dialect=dialect), "clamped"
+    return sql, None
+
+
+def check_sql(sql: str, max_rows: int, dialect: str = "bigquery") -> SqlCheck:
+    """Checks that `sql` is a single read-only query and bounds its rows.
+
+    The statement type is read from the parsed AST, so identifiers such as
+    `last_updated` or `created_at` are not mistaken for DML/DDL. A LIMIT of
+    `max_rows` is appended to the outermost query when it has none, and a
+    larger literal LIMIT is lowered to `max_rows`; LIMITs of subqueries and
+    CTEs are left alone.
+
+    SQL that sqlglot cannot parse is classified from its keyword tokens and,
+    if it is a query, passed through unchanged for BigQuery to validate.
+
+    Args:
+        sql: The SQL to check.
+        max_rows: The maximum number of rows the query may return.
+        dialect: The sqlglot dialect of `sql`.
+
+    Returns:
+        SqlCheck: The statement type, whether it is allowed and the SQL to run.
+    """
+    with tracer.span("sqlglot.safety_check") as span:
+        try:
+            # A semicolon ending the statement, even with comments after it,
+            # parses as an empty trailing statement.
+            expressions = [
+                e
+                for e in sqlglot.parse(sql, read=dialect)
+                if e is not None and type(e).__name__ != "Semicolon"
+            ]
+        except sqlglot.errors.SqlglotError:
+            statement_type = _classify_tokens(sql, dialect)
+            span.set(statement_type=statement_type, parsed=False)
+            if statement_type != "query":
+                return SqlCheck(
+                    sql, statement_type, False, "Only read-only SELECT queries are allowed."
+                )
+            return SqlCheck(sql, statement_type, True)
+
+        if len(expressions) != 1:
+            span.set(statement_type="multiple")
+            return SqlCheck(
+                sql, "multiple", False, "Only a single SQL statement is allowed."
+            )
+        expression = expressions[0]
+        statement_type = _classify(expression)
+        span.set(statement_type=statement_type, parsed=True)
+        if statement_type != "query":
+            return SqlCheck(
+                sql,
+                statement_type,
+                False,
+                f"Contains disallowed {statement_type.upper()} operations"
+                f" ({type(expression).__name__.upper()}); only read-only SELECT"
+                " queries are allowed.",
+            )
+        sql, limit_action = _apply_limit(sql, expression, max_rows, dialect)
+        span.set(limit_action=limit_action)
+        return SqlCheck(sql, statement_type, True, limit_action=limit_action)
@@ -0,0 +1,382 @@
+#
+
+"""Local pre-validation of the database agent's SQL against the schema.
+
+Every failed `run_bigquery_validation` call costs a BigQuery round trip and
+another model turn. `validate_sql` catches the most common mistakes locally,
+from the sqlglot AST and the tables and columns of the DDL schema:
+
+- tables of the dataset that do not exist,
+- columns that no table (or subquery) in scope has,
+- join conditions comparing columns of incompatible types.
+
+Each issue comes with a precise fix (the closest table or column names, or
+the cast to add). Only what can be resolved with certainty is reported:
+tables of other datasets, struct fields, UNNEST aliases and SQL that sqlglot
+cannot parse are left to BigQuery.
+
+`SqlAttempts` bounds the self-correction loop: once a database agent run has
+had `SQL_MAX_FAILED_ATTEMPTS` failed attempts (4 by default), further ones
+are refused. The time spent in each stage of every attempt is recorded on a
+"sql.attempt" span and in `stats()`.
+"""
+
+import difflib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.optimizer.scope import Scope, traverse_scope
+
+from data_science.utils.intent_router import SchemaTable
+
+_TYPE_FAMILIES = {
+    "INTEGER": "number", "INT64": "number", "FLOAT": "number", "FLOAT64": "number",
+    "NUMERIC": "number", "BIGNUMERIC": "number", "DECIMAL": "number",
+    "BIGDECIMAL": "number", "STRING": "string", "BYTES": "bytes",
+    "BOOLEAN": "bool", "BOOL": "bool", "DATE": "date", "DATETIME": "date",
+    "TIMESTAMP": "timestamp", "TIME": "time",
+}
+
+
+@dataclass
+class SqlIssue:
+    """A problem found in a SQL query before running it.
+
+    Attributes:
+        kind: "unknown_table", "unknown_column" or "join_type".
+        message: What is wrong.
+        fix: How to fix it.
+    """
+
+    kind: str
+    message: str
+    fix: str
+
+
+def _suggest(name: str, candidates: dict[str, str], label: str) -> str:
+    """Suggests the candidates closest to `name`.
+
+    Args:
+        name: The unknown name.
+        candidates: The names to compare with, mapped to the name to suggest.
+        label: What the candidates are, e.g. "columns".
+    """
+    by_lower = {c.lower(): suggestion for c, suggestion in candidates.items()}
+    matches = difflib.get_close_matches(name.lower(), list(by_lower), n=3, cutoff=0.5)
+    if matches:
+        return "Did you mean " + " or ".join(f"`{by_lower[m]}`" for m in matches) + "?"
+    shown = list(dict.fromkeys(candidates.values()))
+    return f"Use one of the {label}: " + ", ".join(f"`{c}`" for c in shown[:20]) + "."
+
+
+class _Schema:
+    """Tables and column types of the schema, by table id and name."""
+
+    def __init__(self, tables: list[SchemaTable]):
+        self.tables = tables
+        self.datasets = {t.table_id.rsplit(".", 1)[0] for t in tables if "." in t.table_id}
+        self.columns = {
+            t.table_id: {name.lower(): field_type for name, field_type in t.columns}
+            for t in tables
+        }
+
+    def resolve(self, table: exp.Table) -> tuple[Optional[SchemaTable], bool]:
+        """Returns the schema table of `table`, and whether it should exist.
+
+        A table is expected in the schema if it names the schema's dataset, or
+        no dataset at all.
+        """
+        parts = [p for p in (table.catalog, table.db, table.name) if p]
+        full = ".".join(parts)
+        for schema_table in self.tables:
+            if schema_table.table_id == full or schema_table.table_id.endswith("." + full):
+                return schema_table, True
+        if "INFORMATION_SCHEMA" in full.upper():
+            return None, False
+        dataset = ".".join(parts[:-1])
+        expected = not dataset or any(
+            d == dataset or d.endswith("." + dataset) for d in self.datasets
+        )
+        return None, expected
+
+    def column_type(self, table: SchemaTable, column: str) -> Optional[str]:
+        return self.columns[table.table_id].get(column.lower())
+
+
+def _outputs(scope: Scope) -> Optional[list[str]]:
+    """The column names a derived table returns, or None if not known."""
+    select = scope.expression
+    if not isinstance(select, exp.Select) or any(
+        isinstance(e, exp.Star) or isinstance(e.unalias(), exp.Star) for e in select.expressions
+    ):
+        return None
+    return list(select.named_selects)
+
+
+def _scope_tables(scope: Scope, schema: _Schema) -> Optional[dict]:
+    """Maps the sources of `scope` to schema tables or derived outputs.
+
+    Returns None if a source cannot be resolved (e.g. another dataset).
+    """
+    sources = {}
+    for alias, source in scope.sources.items():
+        if isinstance(source, exp.Table):
+            table, _ = schema.resolve(source)
+            if table is None:
+                return None
+            sources[alias] = table
+        else:
+            outputs = _outputs(source)
+            if outputs is None:
+                return None
+            sources[alias] = outputs
+    return sources
+
+
+def _has_column(source, column: str, schema: _Schema) -> bool:
+    if isinstance(source, SchemaTable):
+        return schema.column_type(source, column) is not None
+    return column.lower() in {c.lower() for c in source}
+
+
+def _source_columns(source) -> list[str]:
+    if isinstance(source, SchemaTable):
+        return [name for name, _ in source.columns]
+    return source
+
+
+def _column_type(column: exp.Column, sources: dict, schema: _Schema) -> Optional[tuple]:
+    """Returns (name, type) of a column of a schema table, if it resolves to one."""
+    if column.table:
+        candidates = [sources.get(column.table)]
+    else:
+        candidates = [s for s in sources.values() if _has_column(s, column.name, schema)]
+    if len(candidates) != 1 or not isinstance(candidates[0], SchemaTable):
+        return None
+    field_type = schema.column_type(candidates[0], column.name)
+    return (column.sql(dialect="bigquery"), field_type) if field_type else None
+
+
+def _check_tables(expression, schema: _Schema, issues: list[SqlIssue]):
+    ctes = {cte.alias_or_name for cte in expression.find_all(exp.CTE)}
+    for table in expression.find_all(exp.Table):
+        if not table.db and table.name in ctes:
+            continue
+        # Table-valued functions, and the MODEL and TABLE arguments of
+        # functions such as ML.PREDICT, are not tables of the dataset.
+        if isinstance(table.this, exp.Func) or isinstance(table.parent, exp.Func):
+            continue
+        resolved, expected = schema.resolve(table)
+        if resolved is None and expected:
+            name = ".".join(p for p in (table.catalog, table.db, table.name) if p)
+            suggestion = _suggest(
+                table.name, {t.name: t.table_id for t in schema.tables}, "tables"
+            )
+            issues.append(
+                SqlIssue(
+                    "unknown_table",
+                    f"Table `{name}` does not exist in the dataset.",
+                    f"{suggestion} Use the fully qualified table name.",
+                )
+            )
+
+
+def _check_columns(scope: Scope, schema: _Schema, issues: list[SqlIssue]):
+    sources = _scope_tables(scope, schema)
+    if sources is None:
+        return
+    aliases = {
+        e.alias.lower()
+        for e in getattr(scope.expression, "expressions", [])
+        if isinstance(e, exp.Alias)
+    }
+    # Unqualified columns may refer to an enclosing query.
+    outer = scope.parent
+    while outer is not None:
+        outer_sources = _scope_tables(outer, schema)
+        if outer_sources is None:
+            return
+        sources = {**{f"outer:{k}": v for k, v in outer_sources.items()}, **sources}
+        outer = outer.parent
+    reported = set()
+    for column in scope.columns:
+        name = column.name
+        if not name or name.startswith("_") or column.args.get("db"):
+            continue
+        if column.table:
+            source = sources.get(column.table)
+            if source is None or _has_column(source, name, schema):
+                continue
+            label = (
+                f"`{source.table_id}`" if isinstance(source, SchemaTable) else f"`{column.table}`"
+            )
+            candidates = _source_columns(source)
+        else:
+            if name.lower() in aliases or name in sources or any(
+                _has_column(s, name, schema) for s in sources.values()
+            ):
+                continue
+            label = ", ".join(
+                f"`{s.table_id if isinstance(s, SchemaTable) else a}`"
+                for a, s in sources.items()
+                if not a.startswith("outer:")
+            )
+            candidates = [
+                c for a, s in sources.items() if not a.startswith("outer:") for c in _source_columns(s)
+            ]
+            if not candidates:
+                continue
+        key = (column.table, name.lower())
+        if key in reported:
+            continue
+        reported.add(key)
+        issues.append(
+            SqlIssue(
+                "unknown_column",
+                f"Column `{column.sql(dialect='bigquery')}` does not exist in {label}.",
+                _suggest(name, {c: c for c in candidates}, "columns"),
+            )
+        )
+
+
+def _check_joins(scope: Scope, schema: _Schema, issues: list[SqlIssue]):
+    select = scope.expression
+    if not isinstance(select, exp.Select):
+        return
+    sources = {}
+    for alias, source in scope.sources.items():
+        table = schema.resolve(source)[0] if isinstance(source, exp.Table) else None
+        if table is not None:
+            sources[alias] = table
+    for join in select.args.get("joins") or []:
+        condition = join.args.get("on")
+        if condition is None:
+            continue
+        for eq in condition.find_all(exp.EQ):
+            if not (isinstance(eq.left, exp.Column) and isinstance(eq.right, exp.Column)):
+                continue
+            left = _column_type(eq.left, sources, schema)
+            right = _column_type(eq.right, sources, schema)
+            if left is None or right is None:
+                continue
+            families = (_TYPE_FAMILIES.get(left[1]), _TYPE_FAMILIES.get(right[1]))
+            if None in families or families[0] == families[1]:
+                continue
+            issues.append(
+                SqlIssue(
+                    "join_type",
+                    f"Join condition `{eq.sql(dialect='bigquery')}` compares"
+                    f" {left[1]} `{left[0]}` with {right[1]} `{right[0]}`.",
+                    f"Join on columns of the same type, or cast one side, e.g."
+                    f" `CAST({left[0]} AS {right[1]}) = {right[0]}`.",
+                )
+            )
+
+
+def validate_sql(sql: str, tables: list[SchemaTable], dialect: str = "bigquery") -> list[SqlIssue]:
+    """Checks `sql` against the schema's tables without running it.
+
+    Args:
+        sql: The SQL query.
+        tables: The tables of the schema (see `intent_router.schema_tables`).
+        dialect: The sqlglot dialect of `sql`.
+
+    Returns:
+        list[SqlIssue]: The issues found; empty if none were found, if the
+        schema is unknown or if sqlglot cannot parse the query.
+    """
+    if not tables:
+        return []
+    try:
+        expression = sqlglot.parse_one(sql, read=dialect)
+        scopes = traverse_scope(expression)
+    except (sqlglot.errors.SqlglotError, RecursionError):
+        return []
+    schema = _Schema(tables)
+    issues: list[SqlIssue] = []
+    _check_tables(expression, schema, issues)
+    if issues:
+        # Columns cannot be checked against a table that does not exist.
+        return issues
+    for scope in scopes:
+        _check_columns(scope, schema, issues)
+        _check_joins(scope, schema, issues)
+    return issues
+
+
+class SqlAttempts:
+    """Counts the SQL attempts of each database agent run.
+
+    Args:
+        max_failures: The failed attempts after which a run's attempts are
+          refused. Defaults to `SQL_MAX_FAILED_ATTEMPTS`, or 4.
+        max_runs: The number of runs tracked.
+    """
+
+    def __init__(self, max_failures: Optional[int] = None, max_runs: int = 256):
+        self.max_failures = max_failures
+        self.max_runs = max_runs
+        self._failures: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            (
+                "attempts", "succeeded", "rejected_locally", "failed_in_bigquery",
+                "refused", "prevalidation_ms", "bigquery_ms",
+            ),
+            0,
+        )
+
+    def budget(self) -> int:
+        if self.max_failures is not None:
+            return self.max_failures
+        return int(os.getenv("SQL_MAX_FAILED_ATTEMPTS", "4"))
+
+    def failures(self, run: str) -> int:
+        with self._lock:
+            return self._failures.get(run, 0)
+
+    def exhausted(self, run: str) -> bool:
+        """Whether run `run` has no attempts left; counted as a refusal if so."""
+        exhausted = self.failures(run) >= self.budget()
+        if exhausted:
+            with self._lock:
+                self._stats["refused"] += 1
+        return exhausted
+
+    def record(
+        self, run: str, outcome: str, prevalidation_ms: float, bigquery_ms: float = 0.0
+    ) -> int:
+        """Records an attempt of `run` and returns its failed attempts so far.
+
+        Args:
+            run: The database agent run (its invocation id).
+            outcome: "succeeded", "rejected_locally" or "failed_in_bigquery".
+            prevalidation_ms: The time of the local checks.
+            bigquery_ms: The time of the BigQuery query, if it was run.
+        """
+        with self._lock:
+            self._stats["attempts"] += 1
+            self._stats[outcome] += 1
+            self._stats["prevalidation_ms"] += prevalidation_ms
+            self._stats["bigquery_ms"] += bigquery_ms
+            failures = self._failures.pop(run, 0) + (outcome != "succeeded")
+            self._failures[run] = failures
+            while len(self._failures) > self.max_runs:
+                self._failures.popitem(last=False)
+            return failures
+
+    def stats(self) -> dict:
+        """Returns the attempts per outcome and the time spent per stage."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["prevalidation_ms"] = round(stats["prevalidation_ms"], 1)
+        stats["bigquery_ms"] = round(stats["bigquery_ms"], 1)
+        return stats
+
+
+sql_attempts = SqlAttempts()
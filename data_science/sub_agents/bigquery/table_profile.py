@@ -0,0 +1,341 @@
+#
+
+"""Sample rows and column profiles of BigQuery tables, as shown to the model."""
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Optional
+
+from data_science.utils.tracing import tracer
+
+# Rows fetched per table to choose the representative ones from.
+SAMPLE_POOL_SIZE = 50
+# Bytes a sampling query may scan per table; larger tables are block-sampled.
+SAMPLE_SCAN_BYTES = 64 * 1024 * 1024
+# Bytes a profiling query may scan per table; larger tables are block-sampled.
+PROFILE_SCAN_BYTES = 1024 * 1024 * 1024
+
+
+def sample_rows_query(tables: Iterable, pool_size: int = SAMPLE_POOL_SIZE) -> str:
+    """Builds one query returning up to `pool_size` rows of every table.
+
+    Each row comes back as a JSON string next to its table id. Tables larger
+    than `SAMPLE_SCAN_BYTES` are read with `TABLESAMPLE SYSTEM` so the query
+    scans about that many bytes per table regardless of the table size.
+
+    Args:
+        tables: `bigquery.Table` objects.
+        pool_size: The maximum number of rows per table.
+
+    Returns:
+        str: The sampling query.
+    """
+    selects = []
+    for table in tables:
+        table_id = str(table.reference)
+        selects.append(
+            f"(SELECT '{table_id}' AS table_id, TO_JSON_STRING(t) AS row_json"
+            f" FROM `{table_id}` AS t{_tablesample(table, SAMPLE_SCAN_BYTES)}"
+            f" LIMIT {pool_size})"
+        )
+    return "\nUNION ALL\n".join(selects)
+
+
+def _tablesample(table, max_bytes: int) -> str:
+    """Returns a TABLESAMPLE clause reading about `max_bytes` of `table`."""
+    if table.num_bytes and table.num_bytes > max_bytes:
+        percent = max(0.001, 100 * max_bytes / table.num_bytes)
+        return f" TABLESAMPLE SYSTEM ({percent:.3f} PERCENT)"
+    return ""
+
+
+def pick_representative_rows(rows: list[dict], k: int) -> list[dict]:
+    """Picks up to `k` rows that together cover the most distinct values.
+
+    Rows are chosen greedily: each pick is the row adding the most (column,
+    value) pairs not seen in the rows picked so far, so near-duplicate rows
+    are skipped in favor of rows showing other values of each column.
+    """
+    picked, seen = [], set()
+    remaining = [(row, _cells(row)) for row in rows]
+    while remaining and len(picked) < k:
+        gains = [len(cells - seen) for _, cells in remaining]
+        best = max(range(len(remaining)), key=lambda i: (gains[i], -i))
+        if picked and gains[best] == 0:
+            break
+        row, cells = remaining.pop(best)
+        picked.append(row)
+        seen |= cells
+    return picked
+
+
+def _cells(row: dict) -> set:
+    return {(c, json.dumps(v, sort_keys=True, default=str)) for c, v in row.items()}
+
+
+def sample_tables(
+    client, tables: list, rows_per_table: int = 3, pool_size: int = SAMPLE_POOL_SIZE
+) -> dict[str, list[dict]]:
+    """Samples representative rows of all `tables` with a single query.
+
+    Falls back to reading the first rows of each table with `list_rows` if the
+    query fails (e.g. without permission to run jobs).
+
+    Args:
+        client: A `bigquery.Client`.
+        tables: `bigquery.Table` objects.
+        rows_per_table: The number of representative rows to keep per table.
+        pool_size: The number of rows fetched per table to pick from.
+
+    Returns:
+        dict: Representative rows per table id ("project.dataset.table").
+    """
+    pools: dict[str, list[dict]] = {str(t.reference): [] for t in tables}
+    if not pools or rows_per_table <= 0:
+        return pools
+    with tracer.span("bigquery.sample_rows", tables=len(pools)) as span:
+        try:
+            job = client.query(sample_rows_query(tables, pool_size))
+            for row in job.result():
+                pools[row["table_id"]].append(json.loads(row["row_json"]))
+            span.set(
+                bytes_processed=getattr(job, "total_bytes_processed", None),
+                cache_hit=getattr(job, "cache_hit", None),
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.warning("Batched row sampling failed, reading tables: %r", e)
+            span.set(fallback=True)
+            for table in tables:
+                pools[str(table.reference)] = [
+                    dict(row.items())
+                    for row in client.list_rows(table, max_results=pool_size)
+                ]
+        span.set(rows_returned=sum(len(rows) for rows in pools.values()))
+    return {
+        table_id: pick_representative_rows(rows, rows_per_table)
+        for table_id, rows in pools.items()
+    }
+
+
+def render_value(value: Any, max_chars: int = 40) -> str:
+    """Renders a value as a SQL literal, truncating long values."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (dict, list)):
+        text = json.dumps(value, default=str)
+    else:
+        text = str(value)
+    if len(text) > max_chars:
+        text = text[: max_chars - 3] + "..."
+    text = text.replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n")
+    return f"'{text}'"
+
+
+def render_sample_rows(table_id: str, rows: list[dict], max_chars: int = 40) -> str:
+    """Renders sample rows as `INSERT INTO` statements for the DDL schema."""
+    if not rows:
+        return ""
+    rendered = f"-- Example values for table `{table_id}`:\n"
+    for row in rows:
+        values = ",".join(render_value(v, max_chars) for v in row.values())
+        rendered += f"INSERT INTO `{table_id}` VALUES\n({values});\n\n"
+    return rendered
+
+
+# Column profiles.
+
+_RANGE_TYPES = {
+    "INTEGER", "INT64", "FLOAT", "FLOAT64", "NUMERIC", "BIGNUMERIC",
+    "DATE", "DATETIME", "TIMESTAMP", "TIME",
+}
+_TOP_K_TYPES = {"STRING", "BOOLEAN", "BOOL"}
+_UNPROFILED_TYPES = {"RECORD", "STRUCT", "JSON", "GEOGRAPHY", "BYTES", "RANGE"}
+
+
+@dataclass
+class ColumnProfile:
+    """Statistics of one column."""
+
+    name: str
+    field_type: str
+    distinct: Optional[int] = None
+    null_rate: Optional[float] = None
+    min: Any = None
+    max: Any = None
+    top_values: list = field(default_factory=list)  # (value, count) pairs
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "type": self.field_type,
+            "distinct": self.distinct,
+            "null_rate": self.null_rate,
+            "min": None if self.min is None else str(self.min),
+            "max": None if self.max is None else str(self.max),
+            "top_values": [[str(v), c] for v, c in self.top_values],
+        }
+
+    def render(self) -> str:
+        parts = [f"`{self.name}` {self.field_type}:"]
+        if self.distinct is not None:
+            parts.append(f"~{self.distinct} distinct")
+        if self.min is not None:
+            parts.append(f"range {self.min} .. {self.max}")
+        if self.null_rate:
+            parts.append(f"{self.null_rate:.0%} null")
+        if self.top_values:
+            parts.append(
+                "top: "
+                + ", ".join(f"{render_value(v)} ({c})" for v, c in self.top_values)
+            )
+        return " ".join(parts)
+
+
+@dataclass
+class TableProfile:
+    """Column statistics of one table."""
+
+    table_id: str
+    rows: int
+    sampled: bool
+    columns: list[ColumnProfile]
+
+    def to_dict(self) -> dict:
+        return {
+            "table_id": self.table_id,
+            "rows": self.rows,
+            "sampled": self.sampled,
+            "columns": [c.to_dict() for c in self.columns],
+        }
+
+    def render(self) -> str:
+        """Renders the profile as SQL comments for the DDL schema."""
+        note = ", from a sample" if self.sampled else ""
+        lines = [f"-- Column profile ({self.rows} rows{note}):"]
+        lines += [f"--   {column.render()}" for column in self.columns]
+        return "\n".join(lines) + "\n\n"
+
+
+def _profiled_fields(table) -> list:
+    return [
+        f
+        for f in table.schema
+        if f.mode != "REPEATED" and f.field_type.upper() not in _UNPROFILED_TYPES
+    ]
+
+
+def column_profile_query(table, top_k: int = 5) -> str:
+    """Builds one aggregated query computing the profile of every column.
+
+    Per column: approximate distinct count and null count, min/max for
+    numeric and temporal columns, and the `top_k` most frequent values of
+    string and boolean columns. Repeated, nested and binary columns are skipped.
+    """
+    table_id = str(table.reference)
+    selects = ["COUNT(*) AS row_count"]
+    for i, f in enumerate(_profiled_fields(table)):
+        column = f"`{f.name}`"
+        kind = f.field_type.upper()
+        selects.append(f"APPROX_COUNT_DISTINCT({column}) AS c{i}_distinct")
+        selects.append(f"COUNTIF({column} IS NULL) AS c{i}_nulls")
+        if kind in _RANGE_TYPES:
+            selects.append(f"MIN({column}) AS c{i}_min")
+            selects.append(f"MAX({column}) AS c{i}_max")
+        if kind in _TOP_K_TYPES:
+            selects.append(f"APPROX_TOP_COUNT({column}, {top_k}) AS c{i}_top")
+    return (
+        "SELECT\n  "
+        + ",\n  ".join(selects)
+        + f"\nFROM `{table_id}`{_tablesample(table, PROFILE_SCAN_BYTES)}"
+    )
+
+
+def profile_table(client, table, top_k: int = 5) -> TableProfile:
+    """Computes the column profile of `table` with a single query."""
+    job = client.query(column_profile_query(table, top_k))
+    row = next(iter(job.result()))
+    scanned = row["row_count"] or 0
+    sampled = bool(_tablesample(table, PROFILE_SCAN_BYTES))
+    columns = []
+    for i, f in enumerate(_profiled_fields(table)):
+        top = row.get(f"c{i}_top") or []
+        columns.append(
+            ColumnProfile(
+                name=f.name,
+                field_type=f.field_type,
+                distinct=row[f"c{i}_distinct"],
+                null_rate=round(row[f"c{i}_nulls"] / scanned, 4) if scanned else None,
+                min=row.get(f"c{i}_min"),
+                max=row.get(f"c{i}_max"),
+                top_values=[(t["value"], t["count"]) for t in top],
+            )
+        )
+    return TableProfile(
+        table_id=str(table.reference),
+        rows=table.num_rows if sampled and table.num_rows else scanned,
+        sampled=sampled,
+        columns=columns,
+    )
+
+
+# Profiles by (table id, last modification time); a table is only profiled
+# again after it changes.
+_profiles: dict[tuple, TableProfile] = {}
+_profiles_lock = threading.Lock()
+
+
+def profile_tables(
+    client, tables: list, top_k: int = 5, max_workers: int = 8
+) -> dict[str, TableProfile]:
+    """Returns the column profiles of `tables`, computing the missing ones.
+
+    Profiles are cached per table until the table is modified. Tables are
+    profiled concurrently; a table whose query fails is left out.
+
+    Args:
+        client: A `bigquery.Client`.
+        tables: `bigquery.Table` objects.
+        top_k: The number of most frequent values kept per column.
+        max_workers: The maximum number of concurrent profiling queries.
+
+    Returns:
+        dict: Profiles per table id ("project.dataset.table").
+    """
+    keys = {str(t.reference): (str(t.reference), t.modified, top_k) for t in tables}
+    with _profiles_lock:
+        missing = [t for t in tables if keys[str(t.reference)] not in _profiles]
+
+    def run(table):
+        try:
+            return profile_table(client, table, top_k)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.warning("Profiling %s failed: %r", table.reference, e)
+            return None
+
+    with tracer.span(
+        "bigquery.profile", tables=len(tables), cache_hits=len(tables) - len(missing)
+    ):
+        if missing:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for table, profile in zip(missing, executor.map(run, missing)):
+                    if profile is None:
+                        continue
+                    key = keys[str(table.reference)]
+                    with _profiles_lock:
+                        # Drop the profiles of earlier versions of the table.
+                        for old in [k for k in _profiles if k[0] == key[0]]:
+                            del _profiles[old]
+                        _profiles[key] = profile
+    with _profiles_lock:
+        return {
+            table_id: _profiles[key]
+            for table_id, key in keys.items()
+            if key in _profiles
+        }
@@ -2,25 +2,34 @@
 
 """This file contains the tools used by the database agent."""
 
-import datetime
+import asyncio
+import hashlib
 import logging
 import os
-import re
-
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from data_science.utils.clients import registry as llm_clients
+from data_science.utils.intent_router import intent_router
+from data_science.utils.prompt_budget import SCHEMA_REDUCERS, PromptBuilder
+from data_science.utils.result_files import STATE_KEY, result_scope, write_result_file
+from data_science.utils.state_budget import state_manager
+from data_science.utils.tracing import tracer
 from data_science.utils.utils import get_env_var
 from google.adk.tools import ToolContext
 from google.cloud import bigquery
-from google.genai import Client
 
+from .arrow_results import fetch_arrow, to_rows
 from .chase_sql import chase_constants
+from .speculation import pop_speculative_sql
+from .sql_safety import check_sql
+from .sql_validation import sql_attempts, validate_sql
+from .table_profile import profile_tables, render_sample_rows, sample_tables
 
-# Assume that `BQ_PROJECT_ID` is set in the environment. See the
-# `data_agent` README for more details.
-project = os.getenv("BQ_PROJECT_ID", None)
-location = os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1")
-llm_client = Client(vertexai=True, project=project, location=location)
-
+# Rows of a result returned to the model; further rows are fetched by page.
 MAX_NUM_ROWS = 80
+# Rows of a result kept for paging, aggregation and analysis.
+MAX_RESULT_ROWS = 100_000
 
 
 database_settings = None
@@ -43,31 +52,97 @@ def get_database_settings():
     return database_settings
 
 
+def schema_fingerprint(ddl_schema: str) -> str:
+    """Returns a short, stable fingerprint of a DDL schema string."""
+    return hashlib.sha256(ddl_schema.encode("utf-8")).hexdigest()[:16]
+
+
 def update_database_settings():
-    """Update database settings."""
+    """Update database settings.
+
+    The returned settings carry a `bq_schema_fingerprint`; consumers that derive
+    data from the schema (e.g. the root agent instruction) compare it to detect
+    a schema change instead of rebuilding on every turn.
+
+    Unless `BQ_COLUMN_PROFILE` is "false", the column profile of every table
+    is rendered into the DDL schema and kept in `bq_column_profile`.
+    """
     global database_settings
+    client = get_bq_client()
+    project_id = get_env_var("BQ_PROJECT_ID")
+    dataset_id = get_env_var("BQ_DATASET_ID")
+    # The table metadata is fetched once, for the profiles and the schema.
+    tables = get_tables(dataset_id, client=client, project_id=project_id)
+    profiles = {}
+    if os.getenv("BQ_COLUMN_PROFILE", "true").lower() == "true":
+        profiles = profile_tables(client, tables)
     ddl_schema = get_bigquery_schema(
-        get_env_var("BQ_DATASET_ID"),
-        client=get_bq_client(),
-        project_id=get_env_var("BQ_PROJECT_ID"),
+        dataset_id,
+        client=client,
+        project_id=project_id,
+        profiles=profiles,
+        tables=tables,
     )
     database_settings = {
-        "bq_project_id": get_env_var("BQ_PROJECT_ID"),
-        "bq_dataset_id": get_env_var("BQ_DATASET_ID"),
+        "bq_project_id": project_id,
+        "bq_dataset_id": dataset_id,
         "bq_ddl_schema": ddl_schema,
+        "bq_schema_fingerprint": schema_fingerprint(ddl_schema),
+        "bq_column_profile": {
+            table_id: profile.to_dict() for table_id, profile in profiles.items()
+        },
         # Include ChaseSQL-specific constants.
         **chase_constants.chase_sql_constants_dict,
     }
     return database_settings
 
 
-def get_bigquery_schema(dataset_id, client=None, project_id=None):
+def get_tables(dataset_id, client=None, project_id=None):
+    """Returns the metadata of the tables (not views) of a dataset.
+
+    Args:
+        dataset_id (str): The ID of the BigQuery dataset.
+        client (bigquery.Client): A BigQuery client.
+        project_id (str): The ID of your Google Cloud Project.
+
+    Returns:
+        list: `bigquery.Table` objects, fetched concurrently.
+    """
+    if client is None:
+        client = bigquery.Client(project=project_id)
+    dataset_ref = bigquery.DatasetReference(project_id, dataset_id)
+    table_refs = [
+        dataset_ref.table(table.table_id) for table in client.list_tables(dataset_ref)
+    ]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        table_objs = list(executor.map(client.get_table, table_refs))
+    return [t for t in table_objs if t.table_type == "TABLE"]
+
+
+def get_bigquery_schema(
+    dataset_id,
+    client=None,
+    project_id=None,
+    sample_rows=3,
+    profiles=None,
+    tables=None,
+):
     """Retrieves schema and generates DDL with example values for a BigQuery dataset.
 
+    Table metadata is fetched concurrently, and the example rows of all tables
+    come from a single sampling query. The rows shown are the most
+    representative ones (covering distinct values of each column), with long
+    values truncated.
+
     Args:
         dataset_id (str): The ID of the BigQuery dataset (e.g., 'my_dataset').
         client (bigquery.Client): A BigQuery client.
         project_id (str): The ID of your Google Cloud Project.
+        sample_rows (int): The number of example rows per table.
+        profiles (dict): Optional column profiles per table id (see
+          `table_profile.profile_tables`), rendered after each table.
+        tables (list): The dataset's tables as returned by `get_tables`, if
+          already fetched.
 
     Returns:
         str: A string containing the generated DDL statements.
@@ -76,65 +151,43 @@ def get_bigquery_schema(dataset_id, client=None, project_id=None):
     if client is None:
         client = bigquery.Client(project=project_id)
 
-    # dataset_ref = client.dataset(dataset_id)
-    dataset_ref = bigquery.DatasetReference(project_id, dataset_id)
-
     ddl_statements = ""
 
-    for table in client.list_tables(dataset_ref):
-        table_ref = dataset_ref.table(table.table_id)
-        table_obj = client.get_table(table_ref)
-
-        # Check if table is a view
-        if table_obj.table_type != "TABLE":
-            continue
-
-        ddl_statement = f"CREATE OR REPLACE TABLE `{table_ref}` (\n"
-
-        for field in table_obj.schema:
-            ddl_statement += f"  `{field.name}` {field.field_type}"
-            if field.mode == "REPEATED":
-                ddl_statement += " ARRAY"
-            if field.description:
-                ddl_statement += f" COMMENT '{field.description}'"
-            ddl_statement += ",\n"
-
-        ddl_statement = ddl_statement[:-2] + "\n);\n\n"
-
-        # Add example values if available (limited to first row)
-        rows = client.list_rows(table_ref, max_results=5).to_dataframe()
-        if not rows.empty:
-            ddl_statement += f"-- Example values for table `{table_ref}`:\n"
-            for _, row in rows.iterrows():  # Iterate over DataFrame rows
-                ddl_statement += f"INSERT INTO `{table_ref}` VALUES\n"
-                example_row_str = "("
-                for value in row.values:  # Now row is a pandas Series and has values
-                    if isinstance(value, str):
-                        example_row_str += f"'{value}',"
-                    elif value is None:
-                        example_row_str += "NULL,"
-                    else:
-                        example_row_str += f"{value},"
-                example_row_str = (
-                    example_row_str[:-1] + ");\n\n"
-                )  # remove trailing comma
-                ddl_statement += example_row_str
-
-        ddl_statements += ddl_statement
+    with tracer.span("bigquery.schema", dataset=dataset_id) as span:
+        table_objs = tables
+        if table_objs is None:
+            table_objs = get_tables(dataset_id, client=client, project_id=project_id)
+        samples = sample_tables(client, table_objs, rows_per_table=sample_rows)
+
+        for table_obj in table_objs:
+            table_ref = str(table_obj.reference)
+            ddl_statement = f"CREATE OR REPLACE TABLE `{table_ref}` (\n"
+
+            for field in table_obj.schema:
+                ddl_statement += f"  `{field.name}` {field.field_type}"
+                if field.mode == "REPEATED":
+                    ddl_statement += " ARRAY"
+                if field.description:
+                    ddl_statement += f" COMMENT '{field.description}'"
+                ddl_statement += ",\n"
+
+            ddl_statement = ddl_statement[:-2] + "\n);\n\n"
+            if profiles and table_ref in profiles:
+                ddl_statement += profiles[table_ref].render()
+            ddl_statement += render_sample_rows(table_ref, samples[table_ref])
+
+            ddl_statements += ddl_statement
+        span.set(tables=len(table_objs), ddl_chars=len(ddl_statements))
 
     return ddl_statements
 
 
-def initial_bq_nl2sql(
-    question: str,
-    tool_context: ToolContext,
-) -> str:
-    """Generates an initial SQL query from a natural language question.
+def generate_sql(question: str, ddl_schema: str) -> str:
+    """Generates SQL for a natural language question with one model call.
 
     Args:
         question (str): Natural language question.
-        tool_context (ToolContext): The tool context to use for generating the SQL
-          query.
+        ddl_schema (str): The DDL schema of the dataset.
 
     Returns:
         str: An SQL statement to answer this question.
@@ -151,7 +204,8 @@ You are a BigQuery SQL expert tasked with answering user's questions about BigQu
 - **SQL Syntax:** Return syntactically and semantically correct SQL for BigQuery with proper relation mapping (i.e., project_id, owner, table, and column relation). Use SQL `AS` statement to assign a new name temporarily to a table column or even a table wherever needed. Always enclose subqueries and union queries in parentheses.
 - **Column Usage:** Use *ONLY* the column names (column_name) mentioned in the Table Schema. Do *NOT* use any other column names. Associate `column_name` mentioned in the Table Schema only to the `table_name` specified under Table Schema.
 - **FILTERS:** You should write query effectively  to reduce and minimize the total rows to be returned. For example, you can use filters (like `WHERE`, `HAVING`, etc. (like 'COUNT', 'SUM', etc.) in the SQL query.
-- **LIMIT ROWS:**  The maximum number of rows returned should be less than {MAX_NUM_ROWS}.
+- **LIMIT ROWS:**  Aggregate in SQL when the question asks for totals, counts or rankings, and only add a LIMIT when the question asks for a number of rows. Only the first {MAX_NUM_ROWS} rows of a result are shown; the rest are stored for paging and aggregation.
+- **VALUES:** The `Column profile` comments in the schema list value ranges and the most frequent values of each column. Use them for filter literals and ranges instead of guessing.
 
 **Schema:**
 
@@ -171,30 +225,114 @@ The database structure is defined by the following table schemas (possibly with
 
    """
 
-    ddl_schema = tool_context.state["database_settings"]["bq_ddl_schema"]
-
-    prompt = prompt_template.format(
-        MAX_NUM_ROWS=MAX_NUM_ROWS, SCHEMA=ddl_schema, QUESTION=question
+    # Sample rows and unrelated tables are dropped from the schema if the
+    # prompt would exceed the stage's token budget.
+    prompt = (
+        PromptBuilder("baseline_nl2sql", prompt_template, SCHEMA_REDUCERS)
+        .build(MAX_NUM_ROWS=MAX_NUM_ROWS, SCHEMA=ddl_schema, QUESTION=question)
+        .text
     )
 
-    response = llm_client.models.generate_content(
-        model=os.getenv("BASELINE_NL2SQL_MODEL"),
-        contents=prompt,
-        config={"temperature": 0.1},
-    )
+    # The shared client uses `BQ_PROJECT_ID`, which is assumed to be set in the
+    # environment. See the `data_agent` README for more details.
+    response = llm_clients.generate_content("baseline_nl2sql", prompt)
 
     sql = response.text
     if sql:
         sql = sql.replace("```sql", "").replace("```", "").strip()
 
-    print("\n sql:", sql)
+    logging.info("Baseline NL2SQL: %s", sql)
+
+    return sql
+
+
+async def initial_bq_nl2sql(
+    question: str,
+    tool_context: ToolContext,
+) -> str:
+    """Generates an initial SQL query from a natural language question.
+
+    The SQL generated speculatively for the user's question (see
+    `speculation`) is used instead when the root agent forwarded a question
+    close enough to it.
+
+    Args:
+        question (str): Natural language question.
+        tool_context (ToolContext): The tool context to use for generating the SQL
+          query.
+
+    Returns:
+        str: An SQL statement to answer this question.
+    """
+    sql = pop_speculative_sql()
+    if sql is None:
+        database_settings = await state_manager.load(tool_context, "database_settings")
+        sql = await asyncio.to_thread(
+            generate_sql, question, database_settings["bq_ddl_schema"]
+        )
 
     tool_context.state["sql_query"] = sql
 
     return sql
 
 
-def run_bigquery_validation(
+def dry_run_sql(sql: str) -> dict:
+    """Checks SQL with a BigQuery dry run, without running the query.
+
+    Args:
+        sql (str): The SQL statement.
+
+    Returns:
+        dict: The "error" message or None, and the "bytes_processed" by the
+        query.
+    """
+    check = check_sql(sql, MAX_RESULT_ROWS + 1)
+    if not check.allowed:
+        return {"error": check.reason, "bytes_processed": None}
+    with tracer.span("bigquery.dry_run") as span:
+        try:
+            job = get_bq_client().query(
+                check.sql,
+                job_config=bigquery.QueryJobConfig(dry_run=True, use_query_cache=False),
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            span.set(error=str(e))
+            return {"error": str(e), "bytes_processed": None}
+        span.set(bytes_processed=job.total_bytes_processed)
+    return {"error": None, "bytes_processed": job.total_bytes_processed}
+
+
+def result_page_info(
+    total_rows: int, rows_shown: int, capped: bool, result_file=None
+) -> dict:
+    """Describes which part of a result is shown and how to get the rest."""
+    info = {"total_rows": total_rows, "rows_shown": rows_shown}
+    if result_file is not None:
+        info["result_id"] = result_file.result_id
+    notes = []
+    if capped:
+        notes.append(
+            f"The query returned more than {MAX_RESULT_ROWS} rows; only the first"
+            f" {MAX_RESULT_ROWS} were kept. Add filters or aggregate in SQL for"
+            " exact answers over all rows."
+        )
+    if rows_shown < total_rows:
+        notes.append(
+            f"Only the first {rows_shown} of {total_rows} rows are shown."
+            + (
+                " Use aggregate_result with this result_id for totals, counts"
+                " or averages over all rows, or fetch_result_page for more rows,"
+                " instead of re-running the query."
+                if result_file is not None
+                else ""
+            )
+        )
+    if notes:
+        info["note"] = " ".join(notes)
+    return info
+
+
+async def run_bigquery_validation(
     sql_string: str,
     tool_context: ToolContext,
 ) -> str:
@@ -205,14 +343,23 @@ def run_bigquery_validation(
 
     1. **SQL Cleanup:**  Preprocesses the SQL string using a `cleanup_sql`
     function
-    2. **DML/DDL Restriction:**  Rejects any SQL queries containing DML or DDL
-       statements (e.g., UPDATE, DELETE, INSERT, CREATE, ALTER) to ensure
-       read-only operations.
-    3. **Syntax and Execution:** Sends the cleaned SQL to BigQuery for validation.
+    2. **DML/DDL Restriction:**  Parses the SQL and rejects anything but a
+       single read-only query (e.g., UPDATE, DELETE, INSERT, CREATE, ALTER
+       statements) to ensure read-only operations. The outermost query gets a
+       LIMIT of at most `MAX_RESULT_ROWS` (plus one, to detect larger results).
+    3. **Pre-validation:** Checks the tables, columns and join types against
+       the schema locally (see `sql_validation`). Issues are returned with
+       their fixes in "fixes", without a BigQuery call. After
+       `SQL_MAX_FAILED_ATTEMPTS` failed attempts in a database agent run,
+       further attempts are refused.
+    4. **Syntax and Execution:** Sends the cleaned SQL to BigQuery for validation.
        If the query is syntactically correct and executable, it retrieves the
        results.
-    4. **Result Analysis:**  Checks if the query produced any results. If so, it
-       formats the first few rows of the result set for inspection.
+    5. **Result Analysis:**  Checks if the query produced any results. If so, it
+       formats the first `MAX_NUM_ROWS` rows of the result set for inspection
+       and stores the whole result under a `result_id`, for
+       `fetch_result_page` and `aggregate_result`. A `note` tells when the
+       rows shown are not the whole result.
 
     Args:
         sql_string (str): The SQL query string to validate.
@@ -224,7 +371,7 @@ def run_bigquery_validation(
              - "Valid SQL. Query executed successfully (no results)." if the query
                 is valid but returns no data.
              - "Invalid SQL: ..." if the query is invalid, along with the error
-                message from BigQuery.
+                message from the local checks or from BigQuery.
     """
 
     def cleanup_sql(sql_string):
@@ -242,60 +389,118 @@ def run_bigquery_validation(
         # 4. Replace escaped newlines (those not preceded by a backslash)
         sql_string = sql_string.replace("\\n", "\n")
 
-        # 5. Add limit clause if not present
-        if "limit" not in sql_string.lower():
-            sql_string = sql_string + " limit " + str(MAX_NUM_ROWS)
-
         return sql_string
 
     logging.info("Validating SQL: %s", sql_string)
     sql_string = cleanup_sql(sql_string)
-    logging.info("Validating SQL (after cleanup): %s", sql_string)
 
     final_result = {"query_result": None, "error_message": None}
 
-    # More restrictive check for BigQuery - disallow DML and DDL
-    if re.search(
-        r"(?i)(update|delete|drop|insert|create|alter|truncate|merge)", sql_string
-    ):
+    # Attempts are counted per database agent run, never across runs.
+    run = tool_context.invocation_id
+    if sql_attempts.exhausted(run):
         final_result["error_message"] = (
-            "Invalid SQL: Contains disallowed DML/DDL operations."
+            f"Invalid SQL: the budget of {sql_attempts.budget()} failed attempts"
+            " is used up. Do not retry; report that no valid SQL was found, with"
+            " the last error."
         )
         return final_result
 
+    with tracer.span("sql.attempt") as span:
+        start = time.perf_counter()
+        # Only a single read-only query is allowed; its outermost LIMIT is
+        # injected or clamped to one row more than is kept.
+        check = check_sql(sql_string, MAX_RESULT_ROWS + 1)
+        issues = []
+        if check.allowed:
+            tables = await intent_router.tables(tool_context)
+            issues = validate_sql(check.sql, tables)
+        prevalidation_ms = (time.perf_counter() - start) * 1e3
+        span.set(prevalidation_ms=round(prevalidation_ms, 1), issues=len(issues))
+
+        if not check.allowed or issues:
+            failures = sql_attempts.record(run, "rejected_locally", prevalidation_ms)
+            span.set(outcome="rejected_locally", failures=failures)
+            if not check.allowed:
+                final_result["error_message"] = f"Invalid SQL: {check.reason}"
+            else:
+                final_result["error_message"] = "Invalid SQL: " + " ".join(
+                    issue.message for issue in issues
+                )
+                final_result["fixes"] = [issue.fix for issue in issues]
+            final_result["attempts_left"] = max(0, sql_attempts.budget() - failures)
+            logging.info("run_bigquery_validation result: %s", final_result)
+            return final_result
+
+        start = time.perf_counter()
+        # The query, Arrow fetch and result file write block for seconds.
+        await asyncio.to_thread(_run_query, check.sql, tool_context, final_result)
+        bigquery_ms = (time.perf_counter() - start) * 1e3
+        outcome = (
+            "failed_in_bigquery"
+            if (final_result["error_message"] or "").startswith("Invalid SQL")
+            else "succeeded"
+        )
+        failures = sql_attempts.record(run, outcome, prevalidation_ms, bigquery_ms)
+        span.set(outcome=outcome, bigquery_ms=round(bigquery_ms, 1), failures=failures)
+        if outcome != "succeeded":
+            final_result["attempts_left"] = max(0, sql_attempts.budget() - failures)
+
+    logging.info("run_bigquery_validation result: %s", final_result)
+
+    return final_result
+
+
+def _run_query(sql_string: str, tool_context: ToolContext, final_result: dict):
+    """Runs a checked query and fills `final_result` with its rows or error."""
+    logging.info("Validating SQL (after cleanup): %s", sql_string)
+
     try:
-        query_job = get_bq_client().query(sql_string)
-        results = query_job.result()  # Get the query results
-
-        if results.schema:  # Check if query returned data
-            rows = [
-                {
-                    key: (
-                        value
-                        if not isinstance(value, datetime.date)
-                        else value.strftime("%Y-%m-%d")
-                    )
-                    for (key, value) in row.items()
-                }
-                for row in results
-            ][
-                :MAX_NUM_ROWS
-            ]  # Convert BigQuery RowIterator to list of dicts
-            # return f"Valid SQL. Results: {rows}"
-            final_result["query_result"] = rows
-
-            tool_context.state["query_result"] = rows
-
-        else:
-            final_result["error_message"] = (
-                "Valid SQL. Query executed successfully (no results)."
+        with tracer.span("bigquery.query") as span:
+            query_job = get_bq_client().query(sql_string)
+            results = query_job.result()  # Get the query results
+            span.set(
+                job_id=query_job.job_id,
+                bytes_processed=query_job.total_bytes_processed,
+                bytes_billed=query_job.total_bytes_billed,
+                cache_hit=query_job.cache_hit,
+                total_rows=results.total_rows,
             )
 
+            if results.schema:  # Check if query returned data
+                # Read column-wise into Arrow; only the rows returned to the
+                # model become Python values.
+                table = fetch_arrow(results, max_rows=MAX_RESULT_ROWS + 1)
+                capped = table.num_rows > MAX_RESULT_ROWS
+                table = table.slice(0, MAX_RESULT_ROWS)
+                rows = to_rows(table, MAX_NUM_ROWS)
+                final_result["query_result"] = rows
+                span.set(rows_returned=table.num_rows, capped=capped)
+
+                tool_context.state["query_result"] = rows
+                # The whole result is stored for paging and aggregation, and
+                # the analysis kernel memory-maps it instead of reading it
+                # from the prompt.
+                try:
+                    result_file = write_result_file(
+                        table,
+                        result_id=query_job.job_id,
+                        scope=result_scope(tool_context.state),
+                    )
+                    tool_context.state[STATE_KEY] = result_file.to_state()
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logging.warning("Writing the result file failed: %r", e)
+                    tool_context.state[STATE_KEY] = result_file = None
+                final_result.update(
+                    result_page_info(table.num_rows, len(rows), capped, result_file)
+                )
+
+            else:
+                final_result["error_message"] = (
+                    "Valid SQL. Query executed successfully (no results)."
+                )
+
     except (
         Exception
     ) as e:  # Catch generic exceptions from BigQuery  # pylint: disable=broad-exception-caught
         final_result["error_message"] = f"Invalid SQL: {e}"
-
-    print("\n run_bigquery_validation final_result: \n", final_result)
-
-    return final_result
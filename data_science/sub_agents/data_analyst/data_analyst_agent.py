@@ -1,10 +1,10 @@
 import os
 # import vertexai
 from google.adk.agents import Agent
-from data_science.utils.LLMManager import LLMManager
+# from data_science.utils.LLMManager import LLMManager
 from data_science.sub_agents.data_analyst.prompts import return_instructions_data_analyst
 
-from langchain_google_genai import ChatGoogleGenerativeAI
+# from langchain_google_genai import ChatGoogleGenerativeAI
 from data_science.utils.config import config, load_env_variables
 
 # Load environment variables and get the API key for Google
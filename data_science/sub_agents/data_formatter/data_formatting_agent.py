@@ -8,8 +8,9 @@ from google.genai import types
 from data_science.sub_agents.data_formatter.tools import *
 from .prompts import return_instructions_data_formatting
 
-from langchain_google_genai import ChatGoogleGenerativeAI
+# from langchain_google_genai import ChatGoogleGenerativeAI
 from data_science.utils.config import config, load_env_variables
+from data_science.utils.tracing import model_call_tracer
 
 # Load environment variables and get the API key for Google
 env_name = load_env_variables()
@@ -55,6 +56,9 @@ class DataFormattingAgentFactory:
                 format_generic_visualization,
             ],
             before_agent_callback=setup_before_agent_call,
+            before_model_callback=model_call_tracer.before_model,
+            after_model_callback=model_call_tracer.after_model,
+            on_model_error_callback=model_call_tracer.on_model_error,
             generate_content_config=types.GenerateContentConfig(temperature=0.01),
         )
         
@@ -56,6 +56,10 @@ Use the following tools to format data for specific visualization types:
    - Uses advanced formatting instructions
    - Handles custom visualization requirements
 
+**Input Data:**
+Pass `results="query_result"` to format the latest SQL query result as is; the tools then read it
+directly instead of from a copy of the rows. Only pass the rows as text when they differ from the query result.
+
 **Workflow:**
 1. Analyze the input data structure and visualization requirements
 2. Select the appropriate formatting tool based on the chart type
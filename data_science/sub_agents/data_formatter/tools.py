@@ -1,22 +1,32 @@
 """Data formatting tools for use with Google ADK agents."""
 
 import json
-import os
 import re
 from decimal import Decimal
 
 from google.adk.tools import ToolContext
-from google.genai import Client
+from data_science.utils.clients import registry as llm_clients
+from data_science.utils.result_files import STATE_KEY, read_result_file
+from data_science.utils.tracing import traced
 from .graph_instructions import graph_instructions
 
-# Initialize the LLM client
-project = os.getenv("BQ_PROJECT_ID", None)
-location = os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1")
-llm_client = Client(vertexai=True, project=project, location=location)
 
+# `results` value selecting the latest query result of the session.
+LATEST_QUERY_RESULT = "query_result"
+
+
+def safe_parse_results(results, tool_context=None):
+    """Safely parse results string into a list of tuples.
+
+    "query_result" (or no results) reads the latest query result from its
+    Arrow result file, column by column, instead of parsing text.
+    """
+    if tool_context is not None and results in ("", LATEST_QUERY_RESULT):
+        handoff = tool_context.state.get(STATE_KEY)
+        if handoff:
+            table = read_result_file(handoff["path"])
+            return list(zip(*(column.to_pylist() for column in table.columns)))
 
-def safe_parse_results(results):
-    """Safely parse results string into a list of tuples"""
     if isinstance(results, list):
         return results
     
@@ -80,13 +90,14 @@ def convert_decimal_values(data):
         return data
 
 
+@traced("formatter.scatter")
 def format_scatter_data(
     results: str,
     tool_context: ToolContext,
 ) -> str:
-    """Format data for scatter plot visualization. Results should be a string representation of list of tuples."""
+    """Format data for scatter plot visualization. Results should be a string representation of list of tuples, or "query_result" for the latest query result."""
     try:
-        parsed_results = safe_parse_results(results)
+        parsed_results = safe_parse_results(results, tool_context)
         parsed_results = convert_decimal_values(parsed_results)
         
         if not parsed_results:
@@ -153,14 +164,15 @@ def format_scatter_data(
         return json.dumps({"error": f"Error formatting scatter data: {str(e)}"})
 
 
+@traced("formatter.bar")
 def format_bar_data(
     results: str,
     question: str,
     tool_context: ToolContext,
 ) -> str:
-    """Format data for bar chart visualization. Results should be a string representation of list of tuples."""
+    """Format data for bar chart visualization. Results should be a string representation of list of tuples, or "query_result" for the latest query result."""
     try:
-        parsed_results = safe_parse_results(results)
+        parsed_results = safe_parse_results(results, tool_context)
         parsed_results = convert_decimal_values(parsed_results)
             
         if not parsed_results:
@@ -189,11 +201,7 @@ Question: {question}
 Data sample: {str(parsed_results[:2])}
 Provide a short label for the y-axis."""
                 
-                response = llm_client.models.generate_content(
-                    model=os.getenv("DATA_FORMATTING_MODEL", "gemini-1.5-flash"),
-                    contents=prompt,
-                    config={"temperature": 0.1},
-                )
+                response = llm_clients.generate_content("data_formatting", prompt)
                 label = response.text.strip() if response.text else "Value"
             except Exception as llm_error:
                 label = "Value"  # Default fallback
@@ -243,14 +251,15 @@ Provide a short label for the y-axis."""
         return json.dumps({"error": f"Error formatting bar data: {str(e)}"})
 
 
+@traced("formatter.line")
 def format_line_data(
     results: str,
     question: str,
     tool_context: ToolContext,
 ) -> str:
-    """Format data for line chart visualization. Results should be a string representation of list of tuples."""
+    """Format data for line chart visualization. Results should be a string representation of list of tuples, or "query_result" for the latest query result."""
     try:
-        parsed_results = safe_parse_results(results)
+        parsed_results = safe_parse_results(results, tool_context)
         parsed_results = convert_decimal_values(parsed_results)
             
         if not parsed_results:
@@ -279,11 +288,7 @@ Question: {question}
 Data sample: {str(parsed_results[:2])}
 Provide a short label for the y-axis."""
                 
-                response = llm_client.models.generate_content(
-                    model=os.getenv("DATA_FORMATTING_MODEL", "gemini-1.5-flash"),
-                    contents=prompt,
-                    config={"temperature": 0.1},
-                )
+                response = llm_clients.generate_content("data_formatting", prompt)
                 label = response.text.strip() if response.text else "Value"
             except Exception as llm_error:
                 label = "Value"  # Default fallback
@@ -330,13 +335,14 @@ Provide a short label for the y-axis."""
         return json.dumps({"error": f"Error formatting line data: {str(e)}"})
 
 
+@traced("formatter.pie")
 def format_pie_data(
     results: str,
     tool_context: ToolContext,
 ) -> str:
-    """Format data for pie chart visualization. Results should be a string representation of list of tuples."""
+    """Format data for pie chart visualization. Results should be a string representation of list of tuples, or "query_result" for the latest query result."""
     try:
-        parsed_results = safe_parse_results(results)
+        parsed_results = safe_parse_results(results, tool_context)
         parsed_results = convert_decimal_values(parsed_results)
             
         if not parsed_results:
@@ -373,6 +379,7 @@ def format_pie_data(
         return json.dumps({"error": f"Error formatting pie data: {str(e)}"})
 
 
+@traced("formatter.generic")
 def format_generic_visualization(
     visualization_type: str,
     results: str,
@@ -380,7 +387,7 @@ def format_generic_visualization(
     tool_context: ToolContext,
     sql_query: str = "",
 ) -> str:
-    """Format data for any visualization type using LLM when specific formatters are not available."""
+    """Format data for any visualization type using LLM when specific formatters are not available. Results may be "query_result" for the latest query result."""
     try:
         if visualization_type not in graph_instructions:
             visualization_type = "bar"  # Default fallback
@@ -388,7 +395,7 @@ def format_generic_visualization(
         instructions = graph_instructions[visualization_type]
         
         # Parse results first
-        parsed_results = safe_parse_results(results)
+        parsed_results = safe_parse_results(results, tool_context)
         parsed_results = convert_decimal_values(parsed_results)
         
         if not parsed_results:
@@ -407,11 +414,7 @@ Use this format: {instructions}
 Return only valid JSON with no additional text."""
         
         try:
-            response = llm_client.models.generate_content(
-                model=os.getenv("DATA_FORMATTING_MODEL", "gemini-1.5-flash"),
-                contents=prompt,
-                config={"temperature": 0.1},
-            )
+            response = llm_clients.generate_content("data_formatting", prompt)
             response_text = response.text if response.text else ""
         except Exception as llm_error:
             # Fallback to simple formatting if LLM fails
@@ -4,11 +4,61 @@
 -- then, it use data formatting, data analysis, and report generation agents for comprehensive data processing
 """
 
+import logging
+
 from google.adk.tools import ToolContext
 from google.adk.tools.agent_tool import AgentTool
 
 from .sub_agents import db_agent, ds_agent, da_agent, rs_agent
-
+from .sub_agents.bigquery.speculation import speculative_sql, use_speculative_sql
+from .utils.agent_streaming import get_session_stream, run_agent_streaming
+from .utils.pipeline import PipelineExecutor, PipelineStage
+from .utils.prompt_budget import analysis_prompt
+from .utils.result_files import (
+    STATE_KEY,
+    ResultFile,
+    describe_result_file,
+    is_readable,
+)
+from .utils.state_budget import state_manager
+from .utils.tracing import tracer
+
+
+# AgentTool wrappers are stateless across calls (each run_async builds its own
+# runner and session), so one instance per sub-agent is built on first use and
+# shared by every subsequent tool call.
+_AGENTS = {
+    "db": db_agent,
+    "ds": ds_agent,
+    "da": da_agent,
+    "rs": rs_agent,
+}
+_agent_tools: dict[str, AgentTool] = {}
+
+
+def get_agent_tool(name: str) -> AgentTool:
+    """Returns the shared AgentTool for the sub-agent registered as `name`."""
+    agent_tool = _agent_tools.get(name)
+    if agent_tool is None:
+        agent_tool = _agent_tools[name] = AgentTool(agent=_AGENTS[name])
+    return agent_tool
+
+
+async def _run_agent(name: str, request: str, tool_context: ToolContext):
+    """Runs a sub-agent, streaming its partial output if the client streams."""
+    stream = get_session_stream(tool_context)
+    with tracer.span(f"agent.{_AGENTS[name].name}", streaming=stream is not None):
+        if stream is not None:
+            return await run_agent_streaming(
+                _AGENTS[name],
+                request,
+                tool_context,
+                stream,
+                include_plugins=get_agent_tool(name).include_plugins,
+            )
+        return await get_agent_tool(name).run_async(
+            args={"request": request}, tool_context=tool_context
+        )
 
 
 async def call_db_agent(
@@ -21,11 +71,13 @@ async def call_db_agent(
         f' {tool_context.state["all_db_settings"]["use_database"]}'
     )
 
-    agent_tool = AgentTool(agent=db_agent)
-
-    db_agent_output = await agent_tool.run_async(
-        args={"request": question}, tool_context=tool_context
+    # SQL generated for the user's question while the root agent was deciding
+    # is used if `question` is close to it (see `speculation`).
+    speculative_sql_query = await speculative_sql.claim(
+        tool_context.invocation_id, question
     )
+    with use_speculative_sql(speculative_sql_query):
+        db_agent_output = await _run_agent("db", question, tool_context)
     tool_context.state["db_agent_output"] = db_agent_output
     return db_agent_output
 
@@ -37,23 +89,28 @@ async def call_ds_agent(
     """Tool to call data science (nl2py) agent."""
 
     if question == "N/A":
-        return tool_context.state["db_agent_output"]
-
-    input_data = tool_context.state["query_result"]
-
-    question_with_data = f"""
-  Question to answer: {question}
-
-  Actual data to analyze prevoius quesiton is already in the following:
-  {input_data}
-
-  """
-
-    agent_tool = AgentTool(agent=ds_agent)
+        return await state_manager.load(tool_context, "db_agent_output")
+
+    handoff = tool_context.state.get(STATE_KEY)
+    result_file = ResultFile.from_state(handoff) if handoff else None
+    if result_file is not None and not is_readable(result_file):
+        logging.warning(
+            "Result file %s is gone; passing the rows in the prompt.", result_file.path
+        )
+        result_file = None
+    if result_file is not None and getattr(
+        ds_agent.code_executor, "loads_result_files", False
+    ):
+        # The executor loads the result as `df`; only its shape goes in the prompt.
+        question_with_data = f"{question}\n\n{describe_result_file(result_file)}"
+    else:
+        question_with_data = analysis_prompt(
+            question,
+            await state_manager.load(tool_context, "query_result"),
+            "Actual data to analyze prevoius quesiton is already in the following:",
+        ).text
 
-    ds_agent_output = await agent_tool.run_async(
-        args={"request": question_with_data}, tool_context=tool_context
-    )
+    ds_agent_output = await _run_agent("ds", question_with_data, tool_context)
     tool_context.state["ana_agent_output"] = ds_agent_output
     return ds_agent_output
 
@@ -65,24 +122,16 @@ async def call_da_agent(
     """Tool to call data analysis agent."""
 
     if question == "N/A":
-        return tool_context.state["db_agent_output"]
+        return await state_manager.load(tool_context, "db_agent_output")
 
     # Use output from DB agent as input for data analysis
-    input_data = tool_context.state["db_agent_output"]
-
-    question_with_data = f"""
-  Question to answer: {question}
-
-  Data from database query to analyze:
-  {input_data}
+    input_data = await state_manager.load(tool_context, "db_agent_output")
 
-  """
+    question_with_data = analysis_prompt(
+        question, input_data, "Data from database query to analyze:"
+    ).text
 
-    agent_tool = AgentTool(agent=da_agent)
-
-    da_agent_output = await agent_tool.run_async(
-        args={"request": question_with_data}, tool_context=tool_context
-    )
+    da_agent_output = await _run_agent("da", question_with_data, tool_context)
     tool_context.state["da_agent_output"] = da_agent_output
     return da_agent_output
 
@@ -94,24 +143,16 @@ async def call_rs_agent(
     """Tool to call report generation agent."""
 
     if question == "N/A":
-        return tool_context.state["db_agent_output"]
+        return await state_manager.load(tool_context, "db_agent_output")
 
     # Use output from DA agent as input for report generation
-    input_data = tool_context.state["db_agent_output"]
-
-    question_with_data = f"""
-  Question to answer: {question}
-
-  Analysis results to generate report from:
-  {input_data}
+    input_data = await state_manager.load(tool_context, "db_agent_output")
 
-  """
+    question_with_data = analysis_prompt(
+        question, input_data, "Analysis results to generate report from:"
+    ).text
 
-    agent_tool = AgentTool(agent=rs_agent)
-
-    rs_agent_output = await agent_tool.run_async(
-        args={"request": question_with_data}, tool_context=tool_context
-    )
+    rs_agent_output = await _run_agent("rs", question_with_data, tool_context)
     tool_context.state["rs_agent_output"] = rs_agent_output
     return rs_agent_output
 
@@ -126,39 +167,47 @@ async def process_data_pipeline(
 ):
     """
     Orchestrate the complete data processing pipeline.
-    
+
+    The database agent runs first. The analysis and report agents only consume
+    the database output, so they run concurrently once it is available. Stage
+    timings and the critical path are stored in `tool_context.state["pipeline_timings"]`.
+
     Args:
         question: The user's question/request
         tool_context: Tool context containing state and settings
         use_ds_agent: Whether to use data science agent (alternative to DA agent)
         use_da_agent: Whether to use data analysis agent
         use_rs_agent: Whether to use report generation agent
-    
+
     Returns:
         Final processed output from the pipeline
     """
-    
-    # Step 1: Get data from database
-    db_output = await call_db_agent(question, tool_context)
-    
+
+    def stage(name, call_agent, inputs=("db",)):
+        async def run(*_):
+            return await call_agent(question, tool_context)
+
+        return PipelineStage(name=name, func=run, inputs=inputs)
+
+    stages = [stage("db", call_db_agent, inputs=())]
     if use_ds_agent:
         # Alternative path: Use data science agent
-        final_output = await call_ds_agent(question, tool_context)
+        stages.append(stage("ds", call_ds_agent))
+        final_stage = "ds"
     else:
         # Standard path: Use DA and RS agents
-        final_output = db_output
-        
+        final_stage = "db"
         if use_da_agent:
-            # Step 2: Analyze data
-            da_output = await call_da_agent(question, tool_context)
-            final_output = da_output
-            
+            stages.append(stage("da", call_da_agent))
+            final_stage = "da"
             if use_rs_agent:
-                # Step 3: Generate report
-                rs_output = await call_rs_agent(question, tool_context)
-                final_output = rs_output
-    
-    return final_output
+                stages.append(stage("rs", call_rs_agent))
+                final_stage = "rs"
+
+    result = await PipelineExecutor(stages).run()
+    tool_context.state["pipeline_timings"] = result.to_dict()
+
+    return result.outputs[final_stage]
 
 # async def call_data_analyst_agent(
 #     question: str,
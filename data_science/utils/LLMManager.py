@@ -1,8 +1,8 @@
 import os
-import vertexai
-from langchain_google_genai import ChatGoogleGenerativeAI
+from data_science.utils.clients import registry as llm_clients
 from data_science.utils.config import config, load_env_variables
-from langchain.callbacks.base import BaseCallbackHandler
+from data_science.utils.streaming import StreamClosed, TokenStream
+from langchain.callbacks.base import AsyncCallbackHandler, BaseCallbackHandler
 from typing import Any, Dict, List, Optional
 import json
 import asyncio
@@ -17,123 +17,260 @@ import asyncio
 env_name = load_env_variables()
 api_key = getattr(config[env_name], 'GOOGLE_API_KEY', os.getenv('GOOGLE_API_KEY'))
 
-class StreamingCallbackHandler(BaseCallbackHandler):
-    """Custom callback handler for streaming responses"""
-    
-    def __init__(self, websocket=None, queue=None):
+class _StreamEvents:
+    """Event construction and token buffering shared by the streaming handlers.
+
+    Events go to a bounded, coalescing `TokenStream` (which applies
+    backpressure or drops with accounting, see `data_science.utils.streaming`)
+    and/or to a caller-provided queue. The token buffer is capped at
+    `max_buffer_chars`; the `llm_end` event carries the model's final text.
+
+    The stream is started on the event loop running when the handler is
+    created (or `set_stream_function` is called), which is where the sink,
+    e.g. the websocket, lives. It is flushed and closed when the generation
+    ends or fails, and a fresh stream to the same sink serves the next one.
+    """
+
+    # Stop generating when the stream is closed (e.g. the client went away)
+    # instead of silently discarding tokens.
+    raise_error = True
+
+    def __init__(self, websocket=None, queue=None, token_stream=None,
+                 max_buffer_chars=1_000_000):
         self.websocket = websocket
         self.queue = queue
+        if token_stream is None and websocket is not None:
+            token_stream = TokenStream(
+                lambda frame: websocket.send_text(json.dumps(frame))
+            )
+        self.loop = None  # The event loop the stream runs on
+        self.token_stream = token_stream
+        self._bind_stream()
         self.current_agent = None
         self.current_task = None
-        self.buffer = []  # Add buffer to collect tokens
-        self.stream_func = None  # Function to handle streaming
-    
+        self.max_buffer_chars = max_buffer_chars
+        self.buffer = []  # Tokens of the current generation, capped
+        self.buffer_chars = 0
+        self.buffer_truncated = False
+
     def set_stream_function(self, stream_func):
-        """Set the streaming function for async operations"""
-        self.stream_func = stream_func
-    
+        """Stream events through `stream_func` (sync or async, called per frame).
+
+        Call it from the event loop `stream_func` runs on.
+        """
+        self.token_stream = TokenStream(stream_func)
+        self._bind_stream()
+
+    def _bind_stream(self):
+        """Starts the stream on the running event loop, if there is one."""
+        if self.token_stream is None:
+            return
+        try:
+            self.loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self.token_stream.start()
+
+    def _renew_stream(self):
+        """Replaces a closed stream by a fresh one with the same sink and settings."""
+        old = self.token_stream
+        if old is None or not old.closed:
+            return None
+        self.token_stream = TokenStream(
+            old.sink,
+            max_queue=old.max_queue,
+            frame_chars=old.frame_chars,
+            frame_interval=old.frame_interval,
+            overflow=old.overflow,
+        )
+        return self.token_stream
+
     def reset_buffer(self):
         """Reset the token buffer"""
         self.buffer = []
+        self.buffer_chars = 0
+        self.buffer_truncated = False
     
     def get_buffer_content(self):
         """Get accumulated buffer content"""
         return ''.join(self.buffer)
-    
+
+    def set_current_context(self, agent=None, task=None):
+        """Set the current agent and task context"""
+        self.current_agent = agent
+        self.current_task = task
+
+    def _buffer_token(self, token: str):
+        if self.buffer_chars + len(token) > self.max_buffer_chars:
+            self.buffer_truncated = True
+            return
+        self.buffer.append(token)
+        self.buffer_chars += len(token)
+
+    def _start_event(self) -> dict:
+        return {
+            "type": "llm_start",
+            "agent": self.current_agent,
+            "task": self.current_task,
+        }
+
+    def _token_event(self, token: str) -> dict:
+        return {
+            "type": "token",
+            "content": token,
+            "agent": self.current_agent,
+            "task": self.current_task,
+        }
+
+    def _end_event(self, response) -> dict:
+        content = None
+        try:
+            content = "".join(
+                generation.text for generation in response.generations[0]
+            )
+        except (AttributeError, IndexError, TypeError):
+            pass
+        if content is None:
+            content = self.get_buffer_content()
+        return {
+            "type": "llm_end",
+            "agent": self.current_agent,
+            "task": self.current_task,
+            "content": content,
+        }
+
+    def _action_event(self, action) -> dict:
+        return {
+            "type": "agent_action",
+            "action": str(action.tool),
+            "agent": self.current_agent,
+        }
+
+
+async def _start(stream: TokenStream):
+    stream.start()
+
+
+class StreamingCallbackHandler(_StreamEvents, BaseCallbackHandler):
+    """Custom callback handler for streaming responses.
+
+    Runs in the thread calling the LLM (e.g. `LLMManager.stream` in a worker
+    thread) and blocks it while the stream applies backpressure. From async
+    code use `AsyncStreamingCallbackHandler` with `LLMManager.astream`.
+    """
+
+    def _on_loop(self, coro):
+        """Runs `coro` on the stream's event loop and waits for its result.
+
+        Raises:
+            RuntimeError: If there is no loop, or if called on the loop's own
+              thread, where waiting would deadlock (see `TokenStream.push`).
+        """
+        if self.loop is None:
+            coro.close()
+            raise RuntimeError(
+                "StreamingCallbackHandler must be created (or given its stream"
+                " function) on the event loop of its sink"
+            )
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            coro.close()
+            raise RuntimeError(
+                "StreamingCallbackHandler called on the event loop thread of its"
+                " stream; use AsyncStreamingCallbackHandler with"
+                " LLMManager.astream instead"
+            )
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def _emit(self, event: dict):
+        if self.token_stream is not None:
+            self.token_stream.push(event)
+        if self.queue is not None:
+            self.queue.put(event)
+
+    def _close_stream(self):
+        if self.token_stream is not None and self.loop is not None:
+            self._on_loop(self.token_stream.aclose())
+
     def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
         """Called when LLM starts generating"""
         self.reset_buffer()  # Reset buffer at start
-        
-        if self.websocket:
-            try:
-                message = {
-                    "type": "llm_start",
-                    "agent": self.current_agent,
-                    "task": self.current_task
-                }
-                self.websocket.send_text(json.dumps(message))
-            except:
-                pass
-    
+        stream = self._renew_stream()
+        if stream is not None:
+            self._on_loop(_start(stream))
+        self._emit(self._start_event())
+
     def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
         """Called when a new token is generated"""
-        # Add token to buffer
-        self.buffer.append(token)
-        
-        # Handle websocket streaming
-        if self.websocket:
-            try:
-                message = {
-                    "type": "token",
-                    "content": token,
-                    "agent": self.current_agent,
-                    "task": self.current_task
-                }
-                self.websocket.send_text(json.dumps(message))
-            except:
-                pass
-        
-        # Handle queue streaming
-        if self.queue:
-            try:
-                self.queue.put({
-                    "type": "token",
-                    "content": token,
-                    "agent": self.current_agent,
-                    "task": self.current_task
-                })
-            except:
-                pass
-        
-        # Handle async function streaming
-        if self.stream_func:
-            try:
-                # Create the streaming data
-                token_data = {
-                    'type': 'token', 
-                    'data': {
-                        'token': token, 
-                        'agent': self.current_agent or "Unknown",
-                        'task': self.current_task or "Unknown"
-                    }
-                }
-                # Note: We can't directly await here since this might not be in async context
-                # The streaming crew will handle this appropriately
-                pass
-            except Exception as e:
-                print(f"Stream function error: {e}")
-    
+        self._buffer_token(token)
+        self._emit(self._token_event(token))
+
     def on_llm_end(self, response, **kwargs: Any) -> None:
         """Called when LLM finishes generating"""
-        if self.websocket:
-            try:
-                message = {
-                    "type": "llm_end",
-                    "agent": self.current_agent,
-                    "task": self.current_task,
-                    "content": self.get_buffer_content()
-                }
-                self.websocket.send_text(json.dumps(message))
-            except:
-                pass
-    
+        try:
+            self._emit(self._end_event(response))
+        finally:
+            self._close_stream()
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        """Called when LLM fails; flushes and closes the stream"""
+        try:
+            self._close_stream()
+        except StreamClosed:
+            pass  # The sink failed too; the model's error is the one raised.
+
     def on_agent_action(self, action, **kwargs: Any) -> None:
         """Called when agent takes an action"""
-        if self.websocket:
+        self._emit(self._action_event(action))
+
+
+class AsyncStreamingCallbackHandler(_StreamEvents, AsyncCallbackHandler):
+    """Async counterpart of `StreamingCallbackHandler`, awaited by the model's
+    async streaming path so backpressure suspends generation without blocking
+    the event loop."""
+
+    async def _emit(self, event: dict):
+        if self.token_stream is not None:
+            await self.token_stream.put(event)
+        if self.queue is not None:
+            result = self.queue.put(event)
+            if asyncio.iscoroutine(result):
+                await result
+
+    async def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        """Called when LLM starts generating"""
+        self.reset_buffer()
+        self._renew_stream()
+        self._bind_stream()
+        await self._emit(self._start_event())
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        """Called when a new token is generated"""
+        self._buffer_token(token)
+        await self._emit(self._token_event(token))
+
+    async def on_llm_end(self, response, **kwargs: Any) -> None:
+        """Called when LLM finishes generating"""
+        try:
+            await self._emit(self._end_event(response))
+        finally:
+            if self.token_stream is not None:
+                await self.token_stream.aclose()
+
+    async def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        """Called when LLM fails; flushes and closes the stream"""
+        if self.token_stream is not None:
             try:
-                message = {
-                    "type": "agent_action",
-                    "action": str(action.tool),
-                    "agent": self.current_agent
-                }
-                self.websocket.send_text(json.dumps(message))
-            except:
-                pass
-    
-    def set_current_context(self, agent=None, task=None):
-        """Set the current agent and task context"""
-        self.current_agent = agent
-        self.current_task = task
+                await self.token_stream.aclose()
+            except StreamClosed:
+                pass  # The sink failed too; the model's error is the one raised.
+
+    async def on_agent_action(self, action, **kwargs: Any) -> None:
+        """Called when agent takes an action"""
+        await self._emit(self._action_event(action))
 
 class LLMManager:
     """
@@ -153,30 +290,36 @@ class LLMManager:
         
         if not hasattr(self, 'initialized'):
             self.api_key = api_key  # Store the API key
-            # Initialize the ChatGoogleGenerativeAI LLM with desired parameters
-            self.llm = ChatGoogleGenerativeAI(
+            self._llm = None  # Created on first use, see `llm`
+            self.streaming_callback = None
+            self.initialized = True  # Mark as initialized
+
+    @property
+    def llm(self):
+        """The ChatGoogleGenerativeAI LLM, constructed on first access."""
+        if self._llm is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            self._llm = ChatGoogleGenerativeAI(
                 model="gemini-1.5-flash-001",  # Use Gemini 1.5 Flash model
                 temperature=0, 
                 google_api_key=self.api_key,
                 disabled_streaming=False,
             )
-            self.streaming_callback = None
-            self.initialized = True  # Mark as initialized
+        return self._llm
     
     def set_streaming_callback(self, callback_handler):
         """Set the streaming callback handler"""
         self.streaming_callback = callback_handler
     
     def get_streaming_llm(self, callback_handler=None):
-        """Get LLM instance configured for streaming"""
+        """Get LLM instance configured for streaming.
+
+        The callback handler is bound to the shared LLM for this use only, so
+        no new client is created per call.
+        """
         if callback_handler:
-            return ChatGoogleGenerativeAI(
-                model="gemini-1.5-flash-001", 
-                temperature=0, 
-                google_api_key=self.api_key,
-                streaming=True,
-                callbacks=[callback_handler]
-            )
+            return self.llm.with_config(callbacks=[callback_handler])
         return self.llm
     
     def invoke(self, prompt, **kwargs):
@@ -189,7 +332,8 @@ class LLMManager:
             str: The content of the LLM's response
         """
         chain = prompt | self.llm  # Create a chain with the prompt and LLM
-        response = chain.invoke(kwargs)  # Invoke the chain with arguments
+        with llm_clients.track(self.llm.model):
+            response = chain.invoke(kwargs)  # Invoke the chain with arguments
         return response.content  # Return only the content part of the response
     
     def stream(self, prompt, callback_handler=None, **kwargs):
@@ -205,12 +349,52 @@ class LLMManager:
         streaming_llm = self.get_streaming_llm(callback_handler)
         chain = prompt | streaming_llm
         
-        for chunk in chain.stream(kwargs):
-            if hasattr(chunk, 'content'):
-                yield chunk.content
-            else:
-                yield str(chunk)
+        # Not `track`: its span would stay current in the caller between yields.
+        span = llm_clients.start_call(self.llm.model)
+        error = None
+        try:
+            for chunk in chain.stream(kwargs):
+                if hasattr(chunk, 'content'):
+                    yield chunk.content
+                else:
+                    yield str(chunk)
+        except GeneratorExit:
+            raise  # The caller stopped reading; not a failed request.
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            llm_clients.end_call(span, error)
     
+    async def astream(self, prompt, callback_handler=None, **kwargs):
+        """
+        Asynchronously stream the LLM response with a callback handler.
+        Args:
+            prompt: A prompt template (e.g., from langchain)
+            callback_handler: Typically an `AsyncStreamingCallbackHandler`
+            **kwargs: Arguments to fill the prompt template
+        Returns:
+            Async generator yielding tokens
+        """
+        streaming_llm = self.get_streaming_llm(callback_handler)
+        chain = prompt | streaming_llm
+
+        span = llm_clients.start_call(self.llm.model)
+        error = None
+        try:
+            async for chunk in chain.astream(kwargs):
+                if hasattr(chunk, 'content'):
+                    yield chunk.content
+                else:
+                    yield str(chunk)
+        except GeneratorExit:
+            raise  # The caller stopped reading; not a failed request.
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            llm_clients.end_call(span, error)
+
     def get_llm(self):
         """
         Return the LLM instance for use in other components.
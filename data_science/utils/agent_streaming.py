@@ -0,0 +1,229 @@
+"""End-to-end streaming of agent responses.
+
+`stream_query` runs the root agent with SSE streaming and yields frames as
+they arrive, including the partial output of the sub-agents that the root
+agent calls through the `call_*_agent` tools. Sub-agent tools find the stream
+of their session with `get_session_stream` and run the sub-agent with
+`run_agent_streaming` instead of `AgentTool.run_async`, which only returns the
+final text.
+
+Frames are dicts:
+
+- {"type": "token", "content": ..., "agent": ...}: partial model text.
+- {"type": "agent_start" | "agent_end", "agent": ...}: sub-agent boundaries;
+  "agent_end" carries the sub-agent's time to first token and duration.
+- {"type": "agent_action", "action": ..., "agent": ...}: a tool call.
+- {"type": "done", "ttft": ..., "total": ...}: last frame of a query.
+"""
+
+import asyncio
+import logging
+import time
+from typing import AsyncGenerator, Optional
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.memory import InMemoryMemoryService
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.adk.tools import ToolContext
+from google.genai import types
+
+from .streaming import TokenStream
+
+logger = logging.getLogger(__name__)
+
+# Streams of the sessions currently served by `stream_query`, by session id.
+_session_streams: dict[str, TokenStream] = {}
+
+_SSE = RunConfig(streaming_mode=StreamingMode.SSE)
+
+
+def get_session_stream(tool_context: ToolContext) -> Optional[TokenStream]:
+    """Returns the stream of the tool's session, if a client is streaming it."""
+    return _session_streams.get(tool_context._invocation_context.session.id)  # pylint: disable=protected-access
+
+
+def _event_text(event) -> str:
+    if not event.content or not event.content.parts:
+        return ""
+    return "".join(part.text for part in event.content.parts if part.text and not part.thought)
+
+
+async def _forward(event, stream: TokenStream, clock: dict):
+    """Puts the streamable parts of an ADK event into `stream`."""
+    text = _event_text(event)
+    if event.partial:
+        clock["partial_seen"] = True
+    elif clock.pop("partial_seen", False):
+        # The final event repeats the text already streamed as partials.
+        text = ""
+    if text:
+        if clock.get("first_token") is None:
+            clock["first_token"] = time.perf_counter()
+        await stream.put({"type": "token", "content": text, "agent": event.author})
+    if event.partial:
+        return
+    for call in event.get_function_calls():
+        await stream.put(
+            {"type": "agent_action", "action": call.name, "agent": event.author}
+        )
+
+
+async def run_agent_streaming(
+    agent: BaseAgent,
+    request: str,
+    tool_context: ToolContext,
+    stream: TokenStream,
+    include_plugins: bool = True,
+) -> str:
+    """Runs `agent` as a tool, forwarding its partial events to `stream`.
+
+    Equivalent to `AgentTool(agent).run_async(args={"request": request}, ...)`:
+    the sub-agent runs in its own in-memory session seeded with the parent
+    state, with the parent's plugins, state changes are forwarded to the
+    parent, and the final text is returned.
+
+    Args:
+        agent: The sub-agent to run.
+        request: The request passed to the sub-agent.
+        tool_context: The calling tool's context.
+        stream: The stream partial output is forwarded to.
+        include_plugins: Whether the parent runner's plugins also run for the
+          sub-agent, as `AgentTool.include_plugins`.
+
+    Returns:
+        str: The final text of the sub-agent.
+    """
+    # pylint: disable=import-outside-toplevel,protected-access
+    from google.adk.tools._forwarding_artifact_service import (
+        ForwardingArtifactService,
+    )
+
+    invocation_context = tool_context._invocation_context
+    runner = Runner(
+        app_name=invocation_context.app_name or agent.name,
+        agent=agent,
+        artifact_service=ForwardingArtifactService(tool_context),
+        session_service=InMemorySessionService(),
+        memory_service=InMemoryMemoryService(),
+        credential_service=invocation_context.credential_service,
+        plugins=(
+            invocation_context.plugin_manager.plugins if include_plugins else None
+        ),
+    )
+    state = {
+        k: v
+        for k, v in tool_context.state.to_dict().items()
+        if not k.startswith("_adk")
+    }
+    session = await runner.session_service.create_session(
+        app_name=runner.app_name, user_id=invocation_context.user_id, state=state
+    )
+    content = types.Content(role="user", parts=[types.Part.from_text(text=request)])
+
+    clock = {"start": time.perf_counter(), "first_token": None}
+    await stream.put({"type": "agent_start", "agent": agent.name})
+    last_content = None
+    try:
+        async for event in runner.run_async(
+            user_id=session.user_id,
+            session_id=session.id,
+            new_message=content,
+            run_config=_SSE,
+        ):
+            if event.actions.state_delta:
+                tool_context.state.update(event.actions.state_delta)
+            await _forward(event, stream, clock)
+            if event.content and not event.partial:
+                last_content = event.content
+    finally:
+        await runner.close()
+
+    end = time.perf_counter()
+    ttft = clock["first_token"] - clock["start"] if clock["first_token"] else None
+    await stream.put(
+        {
+            "type": "agent_end",
+            "agent": agent.name,
+            "ttft": round(ttft, 4) if ttft is not None else None,
+            "duration": round(end - clock["start"], 4),
+        }
+    )
+    logger.info(
+        "Streamed agent %s: ttft=%s duration=%.3fs", agent.name, ttft, end - clock["start"]
+    )
+
+    if last_content is None or not last_content.parts:
+        return ""
+    return "\n".join(
+        part.text for part in last_content.parts if part.text and not part.thought
+    )
+
+
+async def stream_query(
+    runner: Runner,
+    user_id: str,
+    session_id: str,
+    query: str,
+    **stream_kwargs,
+) -> AsyncGenerator[dict, None]:
+    """Runs a user query and yields response frames as they are produced.
+
+    Args:
+        runner: The runner of the root agent.
+        user_id: The user id of the session.
+        session_id: The id of an existing session.
+        query: The user's message.
+        **stream_kwargs: Passed to `TokenStream` (queue size, framing, overflow).
+
+    Yields:
+        dict: Response frames, see the module docstring. The last frame has
+        type "done" and carries the time to first token of the whole query.
+    """
+    frames: asyncio.Queue = asyncio.Queue(maxsize=stream_kwargs.get("max_queue", 256))
+    stream = TokenStream(frames.put, **stream_kwargs).start()
+    clock = {"start": time.perf_counter(), "first_token": None}
+    message = types.Content(role="user", parts=[types.Part(text=query)])
+
+    async def run():
+        _session_streams[session_id] = stream
+        try:
+            async for event in runner.run_async(
+                user_id=user_id,
+                session_id=session_id,
+                new_message=message,
+                run_config=_SSE,
+            ):
+                await _forward(event, stream, clock)
+        finally:
+            _session_streams.pop(session_id, None)
+            try:
+                await stream.aclose()
+            finally:
+                # Even if the sink failed, the consumer below must stop.
+                await frames.put(None)
+
+    task = asyncio.create_task(run())
+    first_token = None
+    try:
+        while True:
+            frame = await frames.get()
+            if frame is None:
+                break
+            if first_token is None and frame.get("type") == "token":
+                first_token = time.perf_counter()
+            yield frame
+        await task  # Surface errors from the run.
+    finally:
+        if not task.done():
+            task.cancel()
+
+    end = time.perf_counter()
+    ttft = first_token - clock["start"] if first_token else None
+    logger.info("Query streamed: ttft=%s total=%.3fs", ttft, end - clock["start"])
+    yield {
+        "type": "done",
+        "ttft": round(ttft, 4) if ttft is not None else None,
+        "total": round(end - clock["start"], 4),
+    }
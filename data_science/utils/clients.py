@@ -0,0 +1,289 @@
+"""Process-wide registry of lazily initialized LLM clients.
+
+Importing the agent package must stay cheap (cold starts on serverless
+deployments pay for every import-time side effect), so SDK initialization and
+client construction happen here on first use, exactly once per configuration.
+Every agent and tool goes through the same registry, which:
+
+- reuses one `google.genai.Client` (and its HTTP connection pool) per
+  (project, location), and one Vertex AI `GenerativeModel` per model,
+- holds per-model generation settings, keyed by the role that uses them,
+- counts in-flight, completed and failed requests per model, and records
+  every request as an "llm.call" tracing span.
+"""
+
+import contextlib
+import functools
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from .tracing import Span, record_llm_usage, tracer
+
+_init_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _init_vertexai(project, location):
+    # pylint: disable=import-outside-toplevel
+    import vertexai
+    from google.cloud import aiplatform
+
+    aiplatform.init(project=project, location=location)
+    vertexai.init(project=project, location=location)
+
+
+def init_vertexai(project: str | None = None, location: str | None = None):
+    """Initializes the Vertex AI SDKs once per (project, location).
+
+    Args:
+        project: The Google Cloud project. Defaults to `GOOGLE_CLOUD_PROJECT`.
+        location: The Google Cloud location. Defaults to `GOOGLE_CLOUD_LOCATION`.
+    """
+    project = project or os.getenv("GOOGLE_CLOUD_PROJECT")
+    location = location or os.getenv("GOOGLE_CLOUD_LOCATION")
+    with _init_lock:
+        _init_vertexai(project, location)
+
+
+@dataclass
+class ModelConfig:
+    """Generation settings for one role (e.g. baseline NL2SQL).
+
+    Attributes:
+        model_env: Environment variable holding the model name, read at call
+          time so that `.env` changes apply without re-registering.
+        default_model: Model name used when `model_env` is unset.
+        generation_config: Settings passed as `config` to `generate_content`.
+    """
+
+    model_env: Optional[str] = None
+    default_model: Optional[str] = None
+    generation_config: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def model(self) -> Optional[str]:
+        if self.model_env:
+            return os.getenv(self.model_env, self.default_model)
+        return self.default_model
+
+
+@dataclass
+class RequestStats:
+    """Request counters for a single model."""
+
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    completed: int = 0
+    errors: int = 0
+    total_latency: float = 0.0
+
+    def to_dict(self) -> dict:
+        finished = self.completed + self.errors
+        return {
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "completed": self.completed,
+            "errors": self.errors,
+            "mean_latency": (
+                round(self.total_latency / finished, 4) if finished else None
+            ),
+        }
+
+
+class ClientRegistry:
+    """Shared LLM clients, per-role model settings and request counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._genai_clients: dict[tuple, Any] = {}
+        self._generative_models: dict[tuple, Any] = {}
+        self._models: dict[str, ModelConfig] = {}
+        self._stats: dict[str, RequestStats] = {}
+
+    def genai_client(self, project: str | None = None, location: str | None = None):
+        """Returns the shared `google.genai.Client` for Vertex AI.
+
+        Args:
+            project: The Google Cloud project. Defaults to `BQ_PROJECT_ID`.
+            location: The Google Cloud location. Defaults to
+              `GOOGLE_CLOUD_LOCATION` or `us-central1`.
+        """
+        project = project or os.getenv("BQ_PROJECT_ID", None)
+        location = location or os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1")
+        key = (project, location)
+        with self._lock:
+            client = self._genai_clients.get(key)
+            if client is None:
+                from google.genai import Client  # pylint: disable=import-outside-toplevel
+
+                client = self._genai_clients[key] = Client(
+                    vertexai=True, project=project, location=location
+                )
+            return client
+
+    def generative_model(self, model_name: str, cache_name: str | None = None):
+        """Returns a shared Vertex AI `GenerativeModel`.
+
+        Args:
+            model_name: The model name or full model resource URL.
+            cache_name: Optional name of a cached content to bind the model to.
+        """
+        key = (model_name, cache_name)
+        with self._lock:
+            model = self._generative_models.get(key)
+        if model is not None:
+            return model
+
+        # pylint: disable=import-outside-toplevel
+        from vertexai.preview import caching
+        from vertexai.preview.generative_models import GenerativeModel
+
+        init_vertexai()
+        if cache_name is not None:
+            model = GenerativeModel.from_cached_content(
+                cached_content=caching.CachedContent(cached_content_name=cache_name)
+            )
+        else:
+            model = GenerativeModel(model_name=model_name)
+        with self._lock:
+            return self._generative_models.setdefault(key, model)
+
+    def evict_cached_content(self, cache_name: str):
+        """Forgets the models bound to a cached content that is being deleted."""
+        with self._lock:
+            for key in [k for k in self._generative_models if k[1] == cache_name]:
+                del self._generative_models[key]
+
+    def configure_model(
+        self,
+        role: str,
+        model_env: str | None = None,
+        default_model: str | None = None,
+        **generation_config,
+    ) -> ModelConfig:
+        """Registers (or replaces) the model settings used for `role`."""
+        config = ModelConfig(model_env, default_model, dict(generation_config))
+        with self._lock:
+            self._models[role] = config
+        return config
+
+    def model_config(self, role: str) -> ModelConfig:
+        """Returns the model settings registered for `role`."""
+        with self._lock:
+            try:
+                return self._models[role]
+            except KeyError:
+                raise ValueError(f"No model configured for role: {role}") from None
+
+    def _started(self, key: str) -> RequestStats:
+        with self._lock:
+            stats = self._stats.setdefault(key, RequestStats())
+            stats.in_flight += 1
+            stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        return stats
+
+    def _finished(self, stats: RequestStats, latency: float, failed: bool):
+        with self._lock:
+            if failed:
+                stats.errors += 1
+            else:
+                stats.completed += 1
+            stats.in_flight -= 1
+            stats.total_latency += latency
+
+    @contextlib.contextmanager
+    def track(self, model: str | None, **attributes):
+        """Counts a request to `model` as in flight for the duration of the block.
+
+        Not for generators that yield inside the block: the span would stay the
+        current span of the caller between `yield`s. Use `start_call` and
+        `end_call` there.
+
+        Yields:
+            Span: The "llm.call" span of the request; pass the response to
+            `record_llm_usage` to attach its token counts.
+        """
+        key = model or "unknown"
+        stats = self._started(key)
+        start = time.perf_counter()
+        try:
+            with tracer.span("llm.call", model=key, **attributes) as span:
+                yield span
+        except BaseException:
+            self._finished(stats, time.perf_counter() - start, failed=True)
+            raise
+        self._finished(stats, time.perf_counter() - start, failed=False)
+
+    def start_call(self, model: str | None, **attributes) -> Span:
+        """Counts a request to `model` as in flight until `end_call`.
+
+        Unlike `track`, the "llm.call" span does not become the current span,
+        so the request can span the `yield`s of a streaming generator.
+
+        Returns:
+            Span: The "llm.call" span of the request, to pass to `end_call`.
+        """
+        key = model or "unknown"
+        self._started(key)
+        return tracer.start_span("llm.call", model=key, **attributes)
+
+    def end_call(self, span: Span, error: Optional[BaseException] = None):
+        """Finishes a request started with `start_call`.
+
+        Args:
+            span: The span returned by `start_call`.
+            error: The exception the request failed with, if any.
+        """
+        tracer.end_span(span, error)
+        with self._lock:
+            stats = self._stats[span.attributes["model"]]
+        self._finished(stats, span.duration, failed=error is not None)
+
+    def generate_content(self, role: str, contents, **overrides):
+        """Calls `generate_content` with the model and settings of `role`.
+
+        Args:
+            role: A role registered with `configure_model`.
+            contents: The prompt contents.
+            **overrides: Generation settings overriding the role's defaults.
+
+        Returns:
+            The `google.genai` response.
+        """
+        config = self.model_config(role)
+        model = config.model
+        with self.track(model, role=role) as span:
+            response = self.genai_client().models.generate_content(
+                model=model,
+                contents=contents,
+                config={**config.generation_config, **overrides},
+            )
+            record_llm_usage(span, response)
+            return response
+
+    def stats(self) -> dict[str, dict]:
+        """Returns a snapshot of the request counters, per model."""
+        with self._lock:
+            return {model: s.to_dict() for model, s in self._stats.items()}
+
+
+registry = ClientRegistry()
+
+# Roles used by the agent tools.
+registry.configure_model(
+    "baseline_nl2sql", model_env="BASELINE_NL2SQL_MODEL", temperature=0.1
+)
+registry.configure_model(
+    "data_formatting",
+    model_env="DATA_FORMATTING_MODEL",
+    default_model="gemini-1.5-flash",
+    temperature=0.1,
+)
+
+
+def get_genai_client(project: str | None = None, location: str | None = None):
+    """Returns the shared `google.genai.Client`. See `ClientRegistry.genai_client`."""
+    return registry.genai_client(project, location)
@@ -1,3 +1,4 @@
+import functools
 import os
 from dotenv import load_dotenv
 
@@ -33,8 +34,9 @@ config = {
 }
 
 
+@functools.lru_cache(maxsize=None)
 def load_env_variables():
-    """Load environment variables from .env file."""
+    """Load environment variables from .env file (once per process)."""
 
     load_dotenv(dotenv_path=".env")
     env_name = os.getenv("FLASK_ENV", "development")
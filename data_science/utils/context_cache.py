@@ -0,0 +1,322 @@
+"""Context caching of static prompt prefixes.
+
+Prompts such as the ChaseSQL templates start with a long static part (the
+instructions, hundreds of lines of few-shot examples and the schema) followed
+by a short dynamic part (the question). `ContextCacheManager` stores the
+static prefix once as a Vertex AI cached content and hands out its name, so
+each call only sends, and pays prefill for, the dynamic suffix.
+
+Cached prefixes are keyed by (model, template, schema fingerprint) plus a hash
+of the prefix text, and are:
+
+- created on first use, if the prefix is large enough to be cacheable,
+- reused while they are fresh,
+- refreshed (their TTL extended) when used shortly before they expire,
+- expired and deleted once stale,
+- retired when a newer schema fingerprint replaces them for the same model
+  and template, and deleted after a grace period, so that calls already
+  using them from other sessions can finish.
+
+Remote calls are made outside the manager's lock; concurrent misses on the
+same prefix wait for the one creation in flight.
+
+The remote side is a small `CacheService` interface, implemented for Vertex AI
+by `VertexCacheService`; tests use a local stand-in.
+"""
+
+import datetime
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from .prompt_budget import estimate_tokens
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class CacheService:
+    """Remote store of cached prompt prefixes."""
+
+    def create(self, model: str, contents: str, ttl_seconds: float) -> str:
+        """Caches `contents` for `model` and returns the cache name."""
+        raise NotImplementedError
+
+    def refresh(self, name: str, ttl_seconds: float):
+        """Extends the lifetime of a cache to `ttl_seconds` from now."""
+        raise NotImplementedError
+
+    def delete(self, name: str):
+        """Deletes a cache."""
+        raise NotImplementedError
+
+
+class VertexCacheService(CacheService):
+    """`CacheService` backed by Vertex AI context caching."""
+
+    def create(self, model: str, contents: str, ttl_seconds: float) -> str:
+        # pylint: disable=import-outside-toplevel
+        from vertexai.generative_models import Content, Part
+        from vertexai.preview import caching
+
+        from .clients import init_vertexai
+
+        init_vertexai()
+        cached = caching.CachedContent.create(
+            model_name=model,
+            contents=[Content(role="user", parts=[Part.from_text(contents)])],
+            ttl=datetime.timedelta(seconds=ttl_seconds),
+        )
+        return cached.resource_name
+
+    def refresh(self, name: str, ttl_seconds: float):
+        from vertexai.preview import caching  # pylint: disable=import-outside-toplevel
+
+        caching.CachedContent(cached_content_name=name).update(
+            ttl=datetime.timedelta(seconds=ttl_seconds)
+        )
+
+    def delete(self, name: str):
+        # pylint: disable=import-outside-toplevel
+        from vertexai.preview import caching
+
+        from .clients import registry
+
+        registry.evict_cached_content(name)
+        caching.CachedContent(cached_content_name=name).delete()
+
+
+@dataclass
+class CachedPrefix:
+    """A cached prompt prefix."""
+
+    name: str
+    model: str
+    template: str
+    fingerprint: str
+    tokens: int
+    expires_at: float
+    hits: int = 0
+    refreshing: bool = False
+
+
+class ContextCacheManager:
+    """Creates, reuses, refreshes and expires cached prompt prefixes.
+
+    Args:
+        service: The remote cache store. Defaults to Vertex AI.
+        ttl_seconds: Lifetime of a cache after creation or refresh.
+        refresh_margin_seconds: A cache used within this many seconds of its
+          expiry is refreshed rather than left to expire.
+        min_tokens: Prefixes shorter than this are not cached (the service
+          rejects them and the saving would be negligible). Defaults to
+          `CONTEXT_CACHE_MIN_TOKENS` or 4096.
+        clock: Returns the current time in seconds.
+        retire_grace_seconds: How long a superseded cache is kept before it
+          is deleted.
+    """
+
+    def __init__(
+        self,
+        service: Optional[CacheService] = None,
+        ttl_seconds: float = 3600,
+        refresh_margin_seconds: float = 300,
+        min_tokens: Optional[int] = None,
+        clock: Callable[[], float] = time.time,
+        retire_grace_seconds: float = 300,
+    ):
+        self.service = service or VertexCacheService()
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.min_tokens = (
+            min_tokens
+            if min_tokens is not None
+            else int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "4096"))
+        )
+        self.clock = clock
+        self.retire_grace_seconds = retire_grace_seconds
+        self._lock = threading.Lock()
+        self._entries: dict[tuple, CachedPrefix] = {}
+        self._creating: dict[tuple, Future] = {}
+        self._retired: list[CachedPrefix] = []
+        self._stats = dict.fromkeys(
+            ("hits", "misses", "creates", "refreshes", "expired", "errors", "skipped"), 0
+        )
+
+    def get(
+        self, model: str, template: str, fingerprint: str, prefix: str
+    ) -> Optional[str]:
+        """Returns the name of a live cache holding `prefix`, creating it if needed.
+
+        Returns None when the prefix is too short to cache or the service
+        fails; callers then send the full prompt uncached.
+
+        Args:
+            model: The model the cache is created for.
+            template: An identifier of the prompt template.
+            fingerprint: The schema fingerprint the prefix was rendered with.
+            prefix: The static prompt prefix.
+        """
+        key = (
+            model,
+            template,
+            fingerprint,
+            hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16],
+        )
+        with tracer.span("context_cache.get", model=model, template=template) as span:
+            now = self.clock()
+            with self._lock:
+                stale = self._take_stale(now)
+                entry = self._entries.get(key)
+                refresh = owner = False
+                if entry is not None:
+                    entry.hits += 1
+                    self._stats["hits"] += 1
+                    if (
+                        entry.expires_at - now <= self.refresh_margin_seconds
+                        and not entry.refreshing
+                    ):
+                        entry.refreshing = refresh = True
+                else:
+                    self._stats["misses"] += 1
+                    creating = self._creating.get(key)
+                    if creating is None:
+                        creating = self._creating[key] = Future()
+                        owner = True
+            self._delete(stale)
+
+            if entry is not None:
+                span.set(cache_hit=True, cached_tokens=entry.tokens)
+                if refresh:
+                    self._refresh(entry, now)
+                return entry.name
+
+            span.set(cache_hit=False)
+            if not owner:
+                # Another call is creating this cache; use its result.
+                return creating.result()
+            name = None
+            try:
+                name = self._create(key, prefix, now, span)
+            finally:
+                with self._lock:
+                    self._creating.pop(key, None)
+                creating.set_result(name)
+            return name
+
+    def expire(self) -> int:
+        """Deletes every cache that has expired. Returns how many were deleted."""
+        with self._lock:
+            stale = self._take_stale(self.clock())
+        self._delete(stale)
+        return len(stale)
+
+    def clear(self):
+        """Deletes every cache."""
+        with self._lock:
+            names = [e.name for e in self._entries.values()]
+            names += [e.name for e in self._retired]
+            self._stats["expired"] += len(names)
+            self._entries.clear()
+            self._retired.clear()
+        self._delete(names)
+
+    def stats(self) -> dict:
+        """Returns the manager counters and the number of live and retired caches."""
+        with self._lock:
+            return dict(self._stats, live=len(self._entries), retired=len(self._retired))
+
+    def _create(self, key: tuple, prefix: str, now: float, span) -> Optional[str]:
+        model, template, fingerprint, _ = key
+        tokens = estimate_tokens(prefix)
+        if tokens < self.min_tokens:
+            with self._lock:
+                self._stats["skipped"] += 1
+            return None
+        try:
+            name = self.service.create(model, prefix, self.ttl_seconds)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning("Creating a context cache for %s failed: %r", template, e)
+            with self._lock:
+                self._stats["errors"] += 1
+            return None
+        with self._lock:
+            self._stats["creates"] += 1
+            self._entries[key] = CachedPrefix(
+                name=name,
+                model=model,
+                template=template,
+                fingerprint=fingerprint,
+                tokens=tokens,
+                expires_at=now + self.ttl_seconds,
+            )
+            # A new schema (or template text) supersedes the older caches of
+            # the same model and template.
+            for other in [k for k in self._entries if k[:2] == key[:2] and k != key]:
+                retired = self._entries.pop(other)
+                retired.expires_at = min(
+                    retired.expires_at, now + self.retire_grace_seconds
+                )
+                self._retired.append(retired)
+        span.set(created=True, cached_tokens=tokens)
+        return name
+
+    def _refresh(self, entry: CachedPrefix, now: float):
+        try:
+            self.service.refresh(entry.name, self.ttl_seconds)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # The cache is still live; it is recreated once it expires.
+            logger.warning("Refreshing context cache %s failed: %r", entry.name, e)
+            with self._lock:
+                self._stats["errors"] += 1
+                entry.refreshing = False
+            return
+        with self._lock:
+            entry.expires_at = now + self.ttl_seconds
+            entry.refreshing = False
+            self._stats["refreshes"] += 1
+
+    def _take_stale(self, now: float) -> list[str]:
+        """Removes the expired and retired caches due for deletion; lock held."""
+        names = []
+        for key in [k for k, e in self._entries.items() if now >= e.expires_at]:
+            names.append(self._entries.pop(key).name)
+        due = [e for e in self._retired if now >= e.expires_at]
+        if due:
+            self._retired = [e for e in self._retired if now < e.expires_at]
+            names += [e.name for e in due]
+        self._stats["expired"] += len(names)
+        return names
+
+    def _delete(self, names: list[str]):
+        for name in names:
+            try:
+                self.service.delete(name)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # Caches expire on the service side anyway.
+                logger.info("Deleting context cache %s failed: %r", name, e)
+
+
+_manager: Optional[ContextCacheManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_context_cache_manager() -> ContextCacheManager:
+    """Returns the process-wide manager, backed by Vertex AI."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ContextCacheManager()
+        return _manager
+
+
+def set_context_cache_manager(manager: Optional[ContextCacheManager]):
+    """Replaces the process-wide manager, e.g. with one using a local service."""
+    global _manager
+    with _manager_lock:
+        _manager = manager
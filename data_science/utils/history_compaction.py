@@ -0,0 +1,229 @@
+"""Compaction of the conversation history sent to the model.
+
+Every turn of the root agent replays the session, including the outputs of
+earlier tool calls (query results, analyses, reports), so its requests grow
+with the conversation. `compact_history` is a `before_model_callback` that
+keeps a request within the "root_history" budget of `prompt_budget` (set
+`PROMPT_TOKEN_BUDGET_ROOT_HISTORY` to change it). When a request is over
+budget, the tool outputs of the turns before the last `keep_turns` user turns
+are replaced, oldest first, by a summary and a reference to the full output:
+
+- results with a `result_id` point to `fetch_result_page`,
+- other outputs are saved once as an artifact, which the model can read back
+  with `load_artifacts`.
+
+Only the request is changed; the session keeps the full events. Summaries are
+built once per function call and cached. The size of each request before and
+after compaction is logged and recorded on a "history.compact" span.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from google.genai import types
+
+from .prompt_budget import estimate_tokens, stage_budget, summarize_rows, truncate_text
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def _json(value: Any) -> str:
+    return json.dumps(value, default=str)
+
+
+def part_tokens(part: types.Part) -> int:
+    """Estimates the tokens of a content part (text, function call or response)."""
+    if part.text:
+        return estimate_tokens(part.text)
+    if part.function_call:
+        return estimate_tokens(
+            f"{part.function_call.name} {_json(part.function_call.args or {})}"
+        )
+    if part.function_response:
+        return estimate_tokens(_json(part.function_response.response or {}))
+    return 0
+
+
+def request_tokens(llm_request) -> int:
+    """Estimates the tokens of an `LlmRequest`: its instruction and contents."""
+    tokens = 0
+    instruction = llm_request.config.system_instruction if llm_request.config else None
+    if isinstance(instruction, str):
+        tokens += estimate_tokens(instruction)
+    elif isinstance(instruction, types.Content):
+        tokens += sum(part_tokens(p) for p in instruction.parts or [])
+    for content in llm_request.contents:
+        tokens += sum(part_tokens(p) for p in content.parts or [])
+    return tokens
+
+
+def _is_user_turn(content: types.Content) -> bool:
+    return content.role == "user" and any(p.text for p in content.parts or [])
+
+
+class HistoryCompactor:
+    """Replaces old tool outputs in model requests with summaries.
+
+    Args:
+        budget: The token budget of a request. Defaults to the "root_history"
+          stage budget.
+        keep_turns: The number of latest user turns whose tool outputs are
+          never compacted (the current turn and the ones before it).
+        summary_tokens: The size of the summary of one tool output.
+        cache_size: The number of summaries kept.
+    """
+
+    def __init__(
+        self,
+        budget: Optional[int] = None,
+        keep_turns: int = 2,
+        summary_tokens: int = 150,
+        cache_size: int = 256,
+    ):
+        self.budget = budget
+        self.keep_turns = keep_turns
+        self.summary_tokens = summary_tokens
+        self.cache_size = cache_size
+        self._summaries: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ("requests", "compacted_requests", "compacted_outputs", "tokens_before", "tokens_after"),
+            0,
+        )
+
+    async def compact(self, callback_context, llm_request) -> dict:
+        """Compacts the history of `llm_request` in place to fit the budget.
+
+        Returns:
+            dict: The estimated tokens of the request before and after, the
+            budget and the number of compacted tool outputs.
+        """
+        budget = self.budget if self.budget is not None else stage_budget("root_history")
+        with tracer.span("history.compact", budget=budget) as span:
+            before = tokens = request_tokens(llm_request)
+            compacted = 0
+            if budget is not None and tokens > budget:
+                for part, part_size in self._candidates(llm_request.contents):
+                    if tokens <= budget:
+                        break
+                    summary = await self._summary(callback_context, part)
+                    part.function_response.response = summary
+                    tokens -= part_size - estimate_tokens(_json(summary))
+                    compacted += 1
+            report = {
+                "tokens_before": before,
+                "tokens_after": tokens,
+                "budget": budget,
+                "compacted_outputs": compacted,
+            }
+            span.set(**report)
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["compacted_requests"] += bool(compacted)
+            self._stats["compacted_outputs"] += compacted
+            self._stats["tokens_before"] += before
+            self._stats["tokens_after"] += tokens
+        logger.info(
+            "Request of %s: %d tokens, %d before history compaction (budget %s,"
+            " %d tool outputs compacted)",
+            getattr(callback_context, "agent_name", "agent"),
+            tokens,
+            before,
+            budget,
+            compacted,
+        )
+        return report
+
+    def stats(self) -> dict:
+        """Returns the request counters and token totals."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _candidates(self, contents: list[types.Content]) -> list[tuple[types.Part, int]]:
+        """Returns the compactable tool outputs, oldest first, with their size."""
+        user_turns = [i for i, content in enumerate(contents) if _is_user_turn(content)]
+        if len(user_turns) < self.keep_turns:
+            return []
+        protected_from = user_turns[-self.keep_turns] if self.keep_turns else len(contents)
+        candidates = []
+        for content in contents[:protected_from]:
+            for part in content.parts or []:
+                response = part.function_response
+                if response is None or (response.response or {}).get("compacted"):
+                    continue
+                size = part_tokens(part)
+                if size > 2 * self.summary_tokens:
+                    candidates.append((part, size))
+        return candidates
+
+    async def _summary(self, callback_context, part: types.Part) -> dict:
+        response = part.function_response
+        digest = hashlib.sha256(_json(response.response).encode("utf-8")).hexdigest()
+        key = response.id or f"{response.name}-{digest[:16]}"
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+                return summary
+
+        output = (response.response or {}).get("result", response.response)
+        summary = {"compacted": True, "tool": response.name}
+        if isinstance(output, dict) and isinstance(output.get("rows"), list):
+            summary.update({k: v for k, v in output.items() if k != "rows"})
+            summary["rows"] = truncate_text(
+                summarize_rows(output["rows"], head=3), self.summary_tokens
+            )
+        else:
+            text = output if isinstance(output, str) else _json(output)
+            summary["summary"] = truncate_text(text, self.summary_tokens)
+
+        if isinstance(output, dict) and output.get("result_id"):
+            summary["reference"] = (
+                "Older output; read its rows again with fetch_result_page"
+                f" (result_id {output['result_id']!r})."
+            )
+        else:
+            artifact = await self._save_output(callback_context, key, response.response)
+            summary["reference"] = (
+                f"Older output; the full output is the artifact {artifact!r}"
+                " (load_artifacts)."
+                if artifact
+                else "Older output; call the tool again for the full output."
+            )
+
+        with self._lock:
+            self._summaries[key] = summary
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+        return summary
+
+    async def _save_output(self, callback_context, key: str, output: Any) -> Optional[str]:
+        invocation_context = callback_context._invocation_context  # pylint: disable=protected-access
+        if invocation_context.artifact_service is None:
+            return None
+        filename = f"tool_output_{re.sub(r'[^A-Za-z0-9_.-]', '_', key)}.json"
+        try:
+            await callback_context.save_artifact(
+                filename,
+                types.Part.from_bytes(
+                    data=_json(output).encode("utf-8"), mime_type="application/json"
+                ),
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning("Could not save tool output %s: %s", filename, e)
+            return None
+        return filename
+
+
+history_compactor = HistoryCompactor()
+
+
+async def compact_history(callback_context, llm_request):
+    """`before_model_callback` compacting old tool outputs to fit the budget."""
+    await history_compactor.compact(callback_context, llm_request)
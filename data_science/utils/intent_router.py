@@ -0,0 +1,289 @@
+"""Local intent routing of the root agent's questions.
+
+Every question used to go through a root agent model call, with the whole
+schema in its instruction, before anything else happened. Two kinds of
+questions do not need that call:
+
+- schema questions ("what tables are there?", "which columns does train
+  have?") are answered directly from the structured schema in
+  `database_settings` (the tables and columns of the DDL schema, with the row
+  counts of the column profiles),
+- obvious SQL-only questions ("how many rows are in train?", "top 5
+  countries by num_sold") are forwarded to `call_db_agent` as is; the root
+  agent's model is only called once, to present the result.
+
+`route_intent` is a `before_model_callback` of the root agent. It classifies
+the question of a turn with a few rules over the question's words and the
+schema's identifiers, and only acts on the first model call of the turn.
+Anything else (analysis, charts, BQML, follow-ups that refer to earlier
+results, questions that mention no table or column) goes to the model as
+before. Set `INTENT_ROUTER=false` to send every question to the model.
+"""
+
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+
+from google.adk.models import LlmResponse
+from google.genai import types
+
+from .prompt_budget import _TABLE_NAME, split_schema
+from .state_budget import is_spilled, state_manager
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = "schema"
+SQL = "sql"
+AGENT = "agent"
+
+_WORD = re.compile(r"[a-z0-9_]+")
+_COLUMN = re.compile(r"^\s+`([^`]+)`\s+(\w+)", re.MULTILINE)
+
+# The schema noun must be what is asked for ("which columns ...", "list the
+# tables"), not just mentioned ("show me the data in the test table").
+_SCHEMA_QUESTION = re.compile(
+    r"^(?:(?:can you |please )?(?:what|which|list|show(?: me)?|describe|tell me about"
+    r"|give me|how many)(?: (?:is|are|the|all|of|available|different|kinds?|sorts?))*"
+    r" (?:tables|columns?|fields?|schemas?|datasets)\b"
+    r"|what (?:kind of |sort of )?data\b.*\b(?:have|available|access|contain)\b)"
+)
+_SQL_QUESTION = re.compile(
+    r"^(?:(?:can you |please )?(?:how many|how much|count|list|show(?: me)?|give me|find|get)\b"
+    r"|(?:what|which) (?:is|are|was|were) the (?:total|average|sum|number|count|max(?:imum)?"
+    r"|min(?:imum)?|top|highest|lowest|largest|smallest|distinct|unique)\b"
+    r"|(?:what|which) \w+(?: \w+)? (?:has|had|have|sold|sells) the (?:most|least|highest|lowest)\b"
+    r"|top \d+\b)"
+)
+# Words that call for more than a query, or depend on the conversation.
+_NEEDS_AGENT = re.compile(
+    r"\b(?:plot|chart|graph|visuali[sz]\w*|analy[sz]\w*|report|predict\w*|forecast\w*"
+    r"|bqml|ml|machine learning|train (?:a|the) model|model(?:s|ing)?|correlat\w*|trends?"
+    r"|why|explain|insights?|recommend\w*|compare|regression|cluster\w*|anomal\w*"
+    r"|it|its|that|those|these|them|they|previous|above|again|same|also|instead"
+    r"|earlier|last (?:query|result|answer))\b"
+)
+# Questions about the tables themselves rather than about their rows.
+_DATA_WORDS = re.compile(
+    r"\b(?:most|least|highest|lowest|top|sum|total|average|max\w*|min\w*|per|by|where"
+    r"|rows?|values?|records?|entries|samples?|data|unique|distinct|different)\b"
+)
+
+
+@dataclass
+class SchemaTable:
+    """A table of the schema with its columns and, if profiled, its row count."""
+
+    table_id: str
+    columns: list[tuple[str, str]]
+    rows: Optional[int] = None
+
+    @property
+    def name(self) -> str:
+        return self.table_id.rsplit(".", 1)[-1]
+
+
+@dataclass
+class Intent:
+    """The route of a question and the tables and columns it mentions."""
+
+    kind: str
+    tables: list[SchemaTable] = field(default_factory=list)
+    columns: list[str] = field(default_factory=list)
+
+
+def schema_tables(db_settings: dict) -> list[SchemaTable]:
+    """Returns the tables of the DDL schema in `db_settings`.
+
+    Row counts come from the column profiles (`bq_column_profile`) if the
+    tables were profiled.
+    """
+    profiles = db_settings.get("bq_column_profile") or {}
+    tables = []
+    for chunk in split_schema(db_settings.get("bq_ddl_schema") or ""):
+        name = _TABLE_NAME.search(chunk)
+        if name is None:
+            continue
+        statement = chunk.split(");", 1)[0]
+        table_id = name.group(1)
+        tables.append(
+            SchemaTable(
+                table_id=table_id,
+                columns=_COLUMN.findall(statement),
+                rows=(profiles.get(table_id) or {}).get("rows"),
+            )
+        )
+    return tables
+
+
+def _variants(identifier: str) -> set[str]:
+    identifier = identifier.lower()
+    variants = {identifier, identifier.replace("_", " ")}
+    variants |= {v[:-1] for v in variants if v.endswith("s") and len(v) > 3}
+    variants |= {v[:-1] + "ies" for v in variants if v.endswith("y")}
+    variants |= {v + "s" for v in set(variants)}
+    return variants
+
+
+def _mentions(question: str, identifier: str) -> bool:
+    return any(
+        re.search(rf"(?<![a-z0-9_]){re.escape(v)}(?![a-z0-9_])", question)
+        for v in _variants(identifier)
+    )
+
+
+def classify(question: str, tables: list[SchemaTable]) -> Intent:
+    """Classifies `question` as a schema question, a SQL-only one or neither.
+
+    Args:
+        question: The user's question.
+        tables: The tables of the schema (see `schema_tables`).
+
+    Returns:
+        Intent: `SCHEMA`, `SQL` or `AGENT` (send it to the model), with the
+        tables and columns the question mentions.
+    """
+    text = " ".join(_WORD.findall(question.lower()))
+    if not text or not tables:
+        return Intent(AGENT)
+    mentioned = [t for t in tables if _mentions(text, t.name)]
+    columns = sorted(
+        {c for t in tables for c, _ in t.columns if _mentions(text, c)}
+    )
+
+    schema = _SCHEMA_QUESTION.search(text)
+    # Words after the question's head that ask for rows make it a data question.
+    if schema and not _DATA_WORDS.search(text, schema.end()):
+        return Intent(SCHEMA, mentioned, columns)
+    if _NEEDS_AGENT.search(text) or not (mentioned or columns):
+        return Intent(AGENT, mentioned, columns)
+    if _SQL_QUESTION.search(text):
+        return Intent(SQL, mentioned, columns)
+    return Intent(AGENT, mentioned, columns)
+
+
+def _table_line(table: SchemaTable) -> str:
+    rows = f", {table.rows:,} rows" if table.rows is not None else ""
+    return f"`{table.table_id}` ({len(table.columns)} columns{rows})"
+
+
+def describe_schema(intent: Intent, tables: list[SchemaTable]) -> str:
+    """Answers a schema question from the schema's tables."""
+    shown = intent.tables or tables
+    if intent.tables or len(tables) == 1:
+        lines = []
+        for table in shown:
+            lines.append(f"* {_table_line(table)}:")
+            lines += [f"    * `{name}` {field_type}" for name, field_type in table.columns]
+        result = "\n".join(lines)
+    else:
+        result = "\n".join(
+            f"* {_table_line(t)}: {', '.join(f'`{c}`' for c, _ in t.columns)}"
+            for t in shown
+        )
+    return (
+        f"**Result:** The dataset has {len(tables)}"
+        f" table{'s' if len(tables) != 1 else ''}"
+        f"{'; the ones you asked about' if intent.tables else ''}:\n\n{result}\n\n"
+        "**Explanation:** Answered from the database schema, without querying"
+        " the data."
+    )
+
+
+def turn_question(llm_request) -> Optional[str]:
+    """Returns the user's text if the request is the first model call of a turn."""
+    if not llm_request.contents:
+        return None
+    last = llm_request.contents[-1]
+    parts = last.parts or []
+    if last.role != "user" or any(p.function_response for p in parts):
+        return None
+    text = "".join(p.text or "" for p in parts if not p.thought).strip()
+    return text or None
+
+
+class IntentRouter:
+    """Answers schema questions and forwards SQL-only questions locally.
+
+    Args:
+        enabled: Whether questions are routed. Defaults to the
+          `INTENT_ROUTER` environment variable (true unless "false").
+        db_tool: The name of the tool SQL-only questions are forwarded to.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None, db_tool: str = "call_db_agent"):
+        self.enabled = enabled
+        self.db_tool = db_tool
+        self._tables: dict[str, list[SchemaTable]] = {}
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys((SCHEMA, SQL, AGENT), 0)
+
+    def is_enabled(self) -> bool:
+        if self.enabled is not None:
+            return self.enabled
+        return os.getenv("INTENT_ROUTER", "true").lower() != "false"
+
+    async def route(self, callback_context, llm_request) -> Optional[LlmResponse]:
+        """Returns the response replacing the model call, or None to call it."""
+        if not self.is_enabled():
+            return None
+        question = turn_question(llm_request)
+        if question is None:
+            return None
+        tables = await self.tables(callback_context)
+        if not tables:
+            return None
+
+        with tracer.span("intent.route") as span:
+            intent = classify(question, tables)
+            span.set(
+                intent=intent.kind,
+                tables=[t.name for t in intent.tables],
+                columns=len(intent.columns),
+            )
+        with self._lock:
+            self._stats[intent.kind] += 1
+        logger.info("Question routed to %s: %r", intent.kind, question[:200])
+
+        if intent.kind == SCHEMA:
+            part = types.Part(text=describe_schema(intent, tables))
+        elif intent.kind == SQL:
+            part = types.Part.from_function_call(
+                name=self.db_tool, args={"question": question}
+            )
+        else:
+            return None
+        return LlmResponse(content=types.Content(role="model", parts=[part]))
+
+    def stats(self) -> dict:
+        """Returns the number of questions per route."""
+        with self._lock:
+            return dict(self._stats)
+
+    async def tables(self, callback_context) -> list[SchemaTable]:
+        """Returns the schema's tables, parsed once per schema fingerprint."""
+        db_settings = callback_context.state.get("database_settings")
+        if not db_settings or not (
+            "bq_ddl_schema" in db_settings or is_spilled(db_settings)
+        ):
+            return []
+        fingerprint = db_settings.get("bq_schema_fingerprint")
+        tables = self._tables.get(fingerprint) if fingerprint else None
+        if tables is None:
+            db_settings = await state_manager.load(callback_context, "database_settings")
+            tables = schema_tables(db_settings)
+            if fingerprint:
+                with self._lock:
+                    self._tables[fingerprint] = tables
+        return tables
+
+
+intent_router = IntentRouter()
+
+
+async def route_intent(callback_context, llm_request):
+    """`before_model_callback` answering or forwarding questions locally."""
+    return await intent_router.route(callback_context, llm_request)
@@ -0,0 +1,159 @@
+"""DAG-based executor for the multi-agent data pipeline.
+
+Each stage declares the stages whose outputs it consumes. Stages whose inputs
+are satisfied run concurrently with `asyncio.gather`, and the executor records
+per-stage timings so the critical path of a run can be inspected.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+
+@dataclass
+class PipelineStage:
+    """A single stage of the pipeline.
+
+    Attributes:
+        name: Unique name of the stage.
+        func: Coroutine function called with the outputs of `inputs`, in order.
+        inputs: Names of the stages this stage depends on.
+    """
+
+    name: str
+    func: Callable[..., Awaitable[Any]]
+    inputs: tuple[str, ...] = ()
+
+
+@dataclass
+class StageTiming:
+    """Wall-clock timing of a stage, relative to the start of the run."""
+
+    name: str
+    start: float
+    end: float
+    inputs: tuple[str, ...] = ()
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "start": round(self.start, 4),
+            "end": round(self.end, 4),
+            "duration": round(self.duration, 4),
+            "inputs": list(self.inputs),
+        }
+
+
+@dataclass
+class PipelineResult:
+    """Outputs and timings of a pipeline run."""
+
+    outputs: dict[str, Any] = field(default_factory=dict)
+    timings: dict[str, StageTiming] = field(default_factory=dict)
+    total: float = 0.0
+
+    def critical_path(self) -> list[str]:
+        """Returns the chain of stages that determined the end-to-end latency.
+
+        Walks back from the stage that finished last, each time following the
+        input that finished last (the one the stage actually waited for).
+        """
+        if not self.timings:
+            return []
+        current = max(self.timings.values(), key=lambda t: t.end)
+        path = [current.name]
+        while current.inputs:
+            current = max(
+                (self.timings[name] for name in current.inputs),
+                key=lambda t: t.end,
+            )
+            path.append(current.name)
+        return path[::-1]
+
+    def to_dict(self) -> dict:
+        return {
+            "total": round(self.total, 4),
+            "critical_path": self.critical_path(),
+            "stages": [t.to_dict() for t in self.timings.values()],
+        }
+
+
+class PipelineExecutor:
+    """Runs a DAG of `PipelineStage`s, starting every stage as soon as its
+    inputs are available."""
+
+    def __init__(self, stages: list[PipelineStage]):
+        self.stages = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate pipeline stage: {stage.name}")
+            self.stages[stage.name] = stage
+        self._check_graph()
+
+    def _check_graph(self):
+        """Validates that all inputs exist and that the graph is acyclic."""
+        visiting, done = set(), set()
+
+        def visit(name, trail):
+            if name in done:
+                return
+            if name in visiting:
+                cycle = " -> ".join(trail + [name])
+                raise ValueError(f"Cycle in pipeline stages: {cycle}")
+            visiting.add(name)
+            for dep in self.stages[name].inputs:
+                if dep not in self.stages:
+                    raise ValueError(
+                        f"Stage '{name}' depends on unknown stage '{dep}'"
+                    )
+                visit(dep, trail + [name])
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name, [])
+
+    async def run(self) -> PipelineResult:
+        """Runs all stages and returns their outputs and timings.
+
+        If a stage raises, the exception propagates once every stage has
+        settled; stages depending on the failed one are not started.
+        """
+        result = PipelineResult()
+        loop = asyncio.get_running_loop()
+        futures = {name: loop.create_future() for name in self.stages}
+        t0 = time.perf_counter()
+
+        async def run_stage(stage: PipelineStage):
+            try:
+                args = [await futures[dep] for dep in stage.inputs]
+                start = time.perf_counter() - t0
+                output = await stage.func(*args)
+                end = time.perf_counter() - t0
+            except BaseException as e:  # pylint: disable=broad-exception-caught
+                futures[stage.name].set_exception(e)
+                raise
+            result.outputs[stage.name] = output
+            result.timings[stage.name] = StageTiming(
+                stage.name, start, end, stage.inputs
+            )
+            futures[stage.name].set_result(output)
+
+        settled = await asyncio.gather(
+            *(run_stage(stage) for stage in self.stages.values()),
+            return_exceptions=True,
+        )
+        # Retrieve every future's exception so none is reported as unhandled.
+        for future in futures.values():
+            if future.done() and not future.cancelled():
+                future.exception()
+        result.total = time.perf_counter() - t0
+        for outcome in settled:
+            if isinstance(outcome, BaseException):
+                raise outcome
+        return result
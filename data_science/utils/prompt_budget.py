@@ -0,0 +1,330 @@
+"""Token-budgeted prompt building.
+
+Prompts are assembled from a template and variable fields (schema, question,
+data). `PromptBuilder` counts the tokens of the result with a local estimator
+and, when a stage's budget is exceeded, applies the stage's reducers in order
+until the prompt fits:
+
+- `sample_row_levels`: keeps fewer example rows per table in a DDL schema,
+- `schema_pruning_levels`: drops the tables least related to the question,
+- `data_summary_levels`: replaces query results by a head plus a summary.
+
+As a last resort the last reduced field is cut to the remaining budget. The
+final token count of every built prompt is logged and recorded on a
+"prompt.build" tracing span.
+
+Budgets are per stage, in tokens, and can be overridden with
+`PROMPT_TOKEN_BUDGET_<STAGE>` (e.g. `PROMPT_TOKEN_BUDGET_BASELINE_NL2SQL`).
+The "root_history" budget bounds the root agent's requests, whose history is
+compacted by `history_compaction`.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional
+
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Default token budgets per prompt stage.
+STAGE_BUDGETS = {
+    "baseline_nl2sql": 24_000,
+    "chase_nl2sql": 48_000,
+    "analysis": 16_000,
+    "root_history": 32_000,
+}
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of LLM tokens of `text` without a tokenizer call.
+
+    Words and punctuation marks count as one token each, long words as one
+    token per 4 characters, which tracks SentencePiece/BPE counts of SQL,
+    DDL and English prose closely enough for budgeting.
+    """
+    if not text:
+        return 0
+    return sum(
+        max(1, math.ceil(len(piece) / 4)) for piece in _TOKEN_RE.findall(text)
+    )
+
+
+def stage_budget(stage: str) -> Optional[int]:
+    """Returns the token budget of `stage`, or None if it is unbounded."""
+    override = os.getenv(f"PROMPT_TOKEN_BUDGET_{stage.upper()}")
+    if override:
+        return int(override)
+    return STAGE_BUDGETS.get(stage)
+
+
+def truncate_text(text: str, max_tokens: int, marker: str = "\n...[truncated]...\n") -> str:
+    """Cuts the middle out of `text` so that it fits in `max_tokens`.
+
+    The head and tail are kept, since both usually carry information (column
+    headers, last rows, closing statements).
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= estimate_tokens(marker):
+        return ""
+    low, high = 0, len(text) // 2
+    while low < high:
+        keep = (low + high + 1) // 2
+        if estimate_tokens(text[:keep] + marker + text[-keep:]) <= max_tokens:
+            low = keep
+        else:
+            high = keep - 1
+    return text[:low] + marker + text[-low:] if low else ""
+
+
+# Schema reducers. The DDL schema is a series of `CREATE ... TABLE` statements,
+# each optionally followed by `-- Example values` and `INSERT INTO` sample rows.
+
+_TABLE_START = re.compile(r"^CREATE (?:OR REPLACE )?TABLE", re.MULTILINE)
+_TABLE_NAME = re.compile(r"TABLE\s+`?([^`\s(]+)`?")
+
+
+def split_schema(ddl_schema: str) -> list[str]:
+    """Splits a DDL schema into one chunk per table."""
+    starts = [m.start() for m in _TABLE_START.finditer(ddl_schema)]
+    if not starts:
+        return [ddl_schema] if ddl_schema.strip() else []
+    bounds = starts + [len(ddl_schema)]
+    return [ddl_schema[bounds[i] : bounds[i + 1]] for i in range(len(starts))]
+
+
+def _limit_sample_rows(table_ddl: str, max_rows: int) -> str:
+    lines = table_ddl.split("\n")
+    kept, rows = [], 0
+    skipping = False
+    for line in lines:
+        if line.startswith("INSERT INTO"):
+            rows += 1
+            skipping = rows > max_rows
+        elif line.startswith("-- Example values") and max_rows == 0:
+            continue
+        elif line and not line.startswith("("):
+            skipping = False
+        if not skipping:
+            kept.append(line)
+    return "\n".join(kept)
+
+
+def sample_row_levels(ddl_schema: str, _fields: dict) -> Iterator[str]:
+    """Yields the schema with 3, 1 and then no example rows per table."""
+    for max_rows in (3, 1, 0):
+        yield "".join(
+            _limit_sample_rows(table, max_rows) for table in split_schema(ddl_schema)
+        )
+
+
+def _relevance(table_ddl: str, question: str) -> int:
+    """Number of question words that appear in the table's name or columns."""
+    words = {w for w in re.findall(r"[a-z0-9]+", question.lower()) if len(w) > 2}
+    identifiers = set(re.findall(r"[a-z0-9]+", table_ddl.lower()))
+    return len(words & identifiers)
+
+
+def schema_pruning_levels(ddl_schema: str, fields: dict) -> Iterator[str]:
+    """Yields the schema without its least relevant tables, one more each time.
+
+    Relevance is the overlap between the question (`fields["QUESTION"]`) and
+    the table's identifiers. The most relevant table is always kept.
+    """
+    tables = split_schema(ddl_schema)
+    question = str(fields.get("QUESTION", ""))
+    ranked = sorted(
+        range(len(tables)), key=lambda i: _relevance(tables[i], question), reverse=True
+    )
+    for keep in range(len(tables) - 1, 0, -1):
+        kept = set(ranked[:keep])
+        yield "".join(table for i, table in enumerate(tables) if i in kept)
+
+
+# Data reducers.
+
+
+def _column_summary(rows: list[dict]) -> dict[str, Any]:
+    summary = {}
+    for column in rows[0]:
+        values = [row.get(column) for row in rows]
+        present = [v for v in values if v is not None]
+        numbers = [
+            v for v in present if isinstance(v, (int, float)) and not isinstance(v, bool)
+        ]
+        if numbers and len(numbers) == len(present):
+            summary[column] = {
+                "min": min(numbers),
+                "max": max(numbers),
+                "mean": round(sum(numbers) / len(numbers), 4),
+                "nulls": len(values) - len(present),
+            }
+        else:
+            distinct = {str(v) for v in present}
+            summary[column] = {
+                "distinct": len(distinct),
+                "examples": sorted(distinct)[:5],
+                "nulls": len(values) - len(present),
+            }
+    return summary
+
+
+def summarize_rows(rows: list[dict], head: int) -> str:
+    """Renders the first `head` rows plus per-column statistics of all rows."""
+    parts = [f"{len(rows)} rows in total."]
+    if head:
+        parts.append(
+            f"First {min(head, len(rows))} rows:\n"
+            + json.dumps(rows[:head], default=str)
+        )
+    if rows and isinstance(rows[0], dict):
+        parts.append(
+            "Column summary over all rows:\n"
+            + json.dumps(_column_summary(rows), default=str)
+        )
+    return "\n".join(parts)
+
+
+def data_summary_levels(data: Any, _fields: dict) -> Iterator[str]:
+    """Yields smaller renderings of query results.
+
+    Lists of row dicts are reduced to a head of 50, 20, 5 and then 0 rows plus
+    a column summary over all rows; text is cut to half its tokens, repeatedly.
+    """
+    if isinstance(data, list) and data and isinstance(data[0], dict):
+        for head in (50, 20, 5, 0):
+            if head < len(data):
+                yield summarize_rows(data, head)
+        return
+    text = data if isinstance(data, str) else json.dumps(data, default=str)
+    tokens = estimate_tokens(text)
+    while tokens > 64:
+        tokens //= 2
+        yield truncate_text(text, tokens)
+
+
+Reducer = Callable[[Any, dict], Iterator[Any]]
+
+
+@dataclass
+class BuiltPrompt:
+    """A prompt and how it was fitted into its budget."""
+
+    text: str
+    tokens: int
+    original_tokens: int
+    budget: Optional[int]
+    reductions: list[str] = field(default_factory=list)
+
+    @property
+    def within_budget(self) -> bool:
+        return self.budget is None or self.tokens <= self.budget
+
+
+class PromptBuilder:
+    """Formats a template and fits the result into a per-stage token budget.
+
+    Args:
+        stage: The stage name, used to look up the budget and in logs.
+        template: A `str.format` template.
+        reducers: (field name, reducer) pairs, applied in order. A reducer
+          takes the current field value and all fields and yields progressively
+          smaller values for the field.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        template: str,
+        reducers: list[tuple[str, Reducer]] = (),
+    ):
+        self.stage = stage
+        self.template = template
+        self.reducers = list(reducers)
+
+    def _render(self, fields: dict) -> tuple[str, int]:
+        text = self.template.format(**fields)
+        return text, estimate_tokens(text)
+
+    def build(self, budget: Optional[int] = None, **fields) -> BuiltPrompt:
+        """Formats the template with `fields`, reducing them to fit the budget.
+
+        Args:
+            budget: The token budget. Defaults to the stage budget.
+            **fields: The template fields.
+
+        Returns:
+            BuiltPrompt: The prompt, its estimated token count and the
+            reductions applied.
+        """
+        budget = budget if budget is not None else stage_budget(self.stage)
+        with tracer.span("prompt.build", stage=self.stage, budget=budget) as span:
+            text, tokens = self._render(fields)
+            prompt = BuiltPrompt(text, tokens, tokens, budget)
+            if budget is not None and tokens > budget:
+                self._reduce(prompt, dict(fields), budget)
+            span.set(
+                tokens=prompt.tokens,
+                original_tokens=prompt.original_tokens,
+                reductions=",".join(prompt.reductions),
+            )
+        log = logger.info if prompt.within_budget else logger.warning
+        log(
+            "Prompt for %s: %d tokens (budget %s, before reduction %d)%s",
+            self.stage,
+            prompt.tokens,
+            budget,
+            prompt.original_tokens,
+            f", reduced by {', '.join(prompt.reductions)}" if prompt.reductions else "",
+        )
+        return prompt
+
+    def _reduce(self, prompt: BuiltPrompt, fields: dict, budget: int):
+        last_field = None
+        for name, reducer in self.reducers:
+            if name not in fields:
+                continue
+            for level, value in enumerate(reducer(fields[name], fields), start=1):
+                fields[name] = value
+                last_field = name
+                prompt.text, prompt.tokens = self._render(fields)
+                if prompt.tokens <= budget:
+                    prompt.reductions.append(f"{reducer.__name__}:{name}:{level}")
+                    return
+            prompt.reductions.append(f"{reducer.__name__}:{name}")
+        if last_field is None:
+            return
+        # Still over budget: cut the last reduced field to what is left.
+        value = str(fields[last_field])
+        fixed = prompt.tokens - estimate_tokens(value)
+        fields[last_field] = truncate_text(value, max(0, budget - fixed))
+        prompt.text, prompt.tokens = self._render(fields)
+        prompt.reductions.append(f"truncate:{last_field}")
+
+
+# Builders shared by the agent tools.
+
+SCHEMA_REDUCERS = [
+    ("SCHEMA", sample_row_levels),
+    ("SCHEMA", schema_pruning_levels),
+]
+
+
+def analysis_prompt(question: str, data: Any, heading: str) -> BuiltPrompt:
+    """Builds the request sent to an analysis sub-agent within its budget.
+
+    Args:
+        question: The question to answer.
+        data: The query results or upstream agent output.
+        heading: The line introducing the data.
+    """
+    template = "\n  Question to answer: {QUESTION}\n\n  {HEADING}\n  {DATA}\n\n  "
+    builder = PromptBuilder("analysis", template, [("DATA", data_summary_levels)])
+    return builder.build(QUESTION=question, HEADING=heading, DATA=data)
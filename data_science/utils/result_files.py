@@ -0,0 +1,255 @@
+"""Query results handed to the analysis kernel as memory-mapped Arrow files.
+
+Instead of pasting a query result into the analysis prompt, where the model
+has to re-type it into a DataFrame, the result is written once to an Arrow
+IPC file. The kernel memory-maps the file and binds it as `df`, and the
+prompt only carries the row count, the column types and the first rows, so
+large results never pass through the token stream.
+
+Result files also form a paged result store: each is named after its result
+id (the BigQuery job id), so later tool calls can read further pages of, or
+aggregate over, a result with `open_result` instead of re-running the query.
+
+Every session writes to its own directory under `RESULT_FILES_DIR` (a
+temporary directory by default), named after a random scope id kept in the
+session state (`SCOPE_KEY`, shared with the sub-agents' sessions), and only
+reads results from it. A session keeps its latest `MAX_RESULT_FILES` results;
+the directories of sessions that have not written or read a result for
+`RESULT_FILES_TTL_SECONDS` (a day by default) are removed.
+"""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import pyarrow as pa
+
+# Result files kept on disk per session; the oldest are removed beyond this many.
+MAX_RESULT_FILES = 50
+# Session state key of the latest query result file.
+STATE_KEY = "query_result_file"
+# Session state key of the id of the session's result directory.
+SCOPE_KEY = "result_files_scope"
+_RESULT_ID = re.compile(r"[A-Za-z0-9_-]{1,128}")
+
+
+@dataclass
+class ResultFile:
+    """A query result stored as an Arrow IPC file.
+
+    Attributes:
+        result_id: The id the result is stored under.
+        scope: The id of the result directory of the session.
+        path: The path of the file.
+        num_rows: The number of rows.
+        columns: (name, Arrow type) of every column.
+        head: The first rows, as JSON-compatible dicts.
+    """
+
+    result_id: str
+    scope: str
+    path: str
+    num_rows: int
+    columns: list
+    head: list
+
+    def to_state(self) -> dict:
+        """Returns the result as a JSON-serializable session state value."""
+        return {
+            "result_id": self.result_id,
+            "scope": self.scope,
+            "path": self.path,
+            "num_rows": self.num_rows,
+            "columns": [list(c) for c in self.columns],
+            "head": self.head,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "ResultFile":
+        return cls(
+            result_id=state["result_id"],
+            scope=state.get("scope", ""),
+            path=state["path"],
+            num_rows=state["num_rows"],
+            columns=[tuple(c) for c in state["columns"]],
+            head=state["head"],
+        )
+
+
+def result_files_dir(scope: Optional[str] = None) -> str:
+    """Returns the result directory of session `scope`, or the root directory.
+
+    Raises:
+        ValueError: If `scope` is not a valid scope id.
+    """
+    directory = os.getenv("RESULT_FILES_DIR") or os.path.join(
+        tempfile.gettempdir(), "ds_results"
+    )
+    if scope is not None:
+        if not _RESULT_ID.fullmatch(scope):
+            raise ValueError(f"Invalid result scope: {scope!r}")
+        directory = os.path.join(directory, scope)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def result_scope(state) -> str:
+    """Returns the session's result scope id, creating it on first use.
+
+    Args:
+        state: The session state (e.g. `tool_context.state`).
+    """
+    scope = state.get(SCOPE_KEY)
+    if not scope:
+        scope = uuid.uuid4().hex
+        state[SCOPE_KEY] = scope
+    return scope
+
+
+def result_path(result_id: str, scope: str) -> str:
+    """Returns the path of the file of a result of session `scope`.
+
+    Raises:
+        ValueError: If `result_id` or `scope` is not a valid id.
+    """
+    if not _RESULT_ID.fullmatch(result_id or ""):
+        raise ValueError(f"Invalid result id: {result_id!r}")
+    return os.path.join(result_files_dir(scope), f"result_{result_id}.arrow")
+
+
+def write_result_file(
+    data: Union[pa.Table, list[dict]],
+    head_rows: int = 5,
+    result_id: Optional[str] = None,
+    scope: Optional[str] = None,
+) -> ResultFile:
+    """Writes a query result to an uncompressed Arrow IPC file.
+
+    Uncompressed IPC files can be memory-mapped and read without copying.
+
+    Args:
+        data: The result, as an Arrow table or a list of row dicts.
+        head_rows: The number of rows kept in `ResultFile.head`.
+        result_id: The id to store the result under, e.g. the BigQuery job
+          id. Defaults to a random id.
+        scope: The session's result scope id (see `result_scope`). Defaults
+          to a new scope of its own.
+
+    Returns:
+        ResultFile: The written file.
+    """
+    table = data if isinstance(data, pa.Table) else pa.Table.from_pylist(data)
+    result_id = result_id or uuid.uuid4().hex
+    scope = scope or uuid.uuid4().hex
+    path = result_path(result_id, scope)
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    _remove_old_files(os.path.dirname(path))
+    _remove_expired_scopes(result_files_dir())
+    return ResultFile(
+        result_id=result_id,
+        scope=scope,
+        path=path,
+        num_rows=table.num_rows,
+        columns=[(f.name, str(f.type)) for f in table.schema],
+        head=json.loads(
+            json.dumps(table.slice(0, head_rows).to_pylist(), default=str)
+        ),
+    )
+
+
+def read_result_file(path: str) -> pa.Table:
+    """Reads a result file, memory-mapped."""
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def is_readable(result: ResultFile) -> bool:
+    """Whether the file of `result` still exists and holds a valid result."""
+    try:
+        with pa.memory_map(result.path) as source:
+            pa.ipc.open_file(source)
+    except (OSError, pa.ArrowInvalid):
+        return False
+    return True
+
+
+def open_result(result_id: str, scope: str) -> pa.Table:
+    """Reads a stored result of session `scope` by id, memory-mapped.
+
+    Raises:
+        KeyError: If the session has no such result (or it was removed).
+        ValueError: If `result_id` or `scope` is not a valid id.
+    """
+    path = result_path(result_id, scope)
+    if not os.path.exists(path):
+        raise KeyError(result_id)
+    # Reading keeps the session's results from expiring.
+    os.utime(os.path.dirname(path))
+    return read_result_file(path)
+
+
+def load_code(result: ResultFile, name: str = "df") -> str:
+    """Returns kernel code binding the result, memory-mapped, as DataFrame `name`.
+
+    `split_blocks` keeps one block per column, so numeric columns without
+    nulls stay views of the mapped file instead of being copied.
+    """
+    return (
+        "import pyarrow as pa\n"
+        f"{name} = pa.ipc.open_file(pa.memory_map({result.path!r}))"
+        ".read_all().to_pandas(split_blocks=True)\n"
+    )
+
+
+def describe_result_file(result: ResultFile, name: str = "df") -> str:
+    """Describes a result bound in the kernel, for the analysis prompt."""
+    lines = [
+        f"The query result ({result.num_rows} rows) is already loaded in the"
+        f" Python environment as the pandas DataFrame `{name}`. Use `{name}`"
+        " directly; do not re-create it from the rows below.",
+        "",
+        "Columns:",
+    ]
+    lines += [f"  - {column}: {arrow_type}" for column, arrow_type in result.columns]
+    if result.head:
+        lines += ["", f"First {len(result.head)} rows:"]
+        lines += [json.dumps(row) for row in result.head]
+    return "\n".join(lines)
+
+
+def _remove_old_files(directory: str):
+    files = [
+        entry
+        for entry in os.scandir(directory)
+        if entry.name.startswith("result_") and entry.name.endswith(".arrow")
+    ]
+    if len(files) <= MAX_RESULT_FILES:
+        return
+    files.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in files[: len(files) - MAX_RESULT_FILES]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def _remove_expired_scopes(directory: str):
+    ttl = float(os.getenv("RESULT_FILES_TTL_SECONDS", str(24 * 3600)))
+    expired = time.time() - ttl
+    for entry in os.scandir(directory):
+        try:
+            if entry.stat().st_mtime >= expired:
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            elif entry.name.startswith("result_") and entry.name.endswith(".arrow"):
+                os.remove(entry.path)
+        except OSError:
+            pass
@@ -0,0 +1,593 @@
+"""A persistent ADK session service on SQLite in WAL mode.
+
+`InMemorySessionService` loses sessions on restart and keeps every event of
+every session in memory. `SqliteSessionService` keeps them in one SQLite
+file instead:
+
+- State is stored per key: an event's state delta upserts only the keys it
+  changed, so appending an event never rewrites the whole session state,
+  and events keep their deltas, not snapshots.
+- Events are stored as JSON without empty fields, zlib-compressed above
+  `COMPRESS_MIN_BYTES`, under a small integer session id.
+- Writes go through one writer thread, which commits every append queued
+  while the previous commit ran in the same transaction (group commit);
+  reads run on their own connections, which WAL mode lets run concurrently
+  with the writer.
+- A `RetentionPolicy` bounds the events kept per session and their age, and
+  removes idle sessions. The writer applies it every
+  `compact_interval_seconds`, or call `compact` yourself.
+
+Usage:
+
+    runner = Runner(
+        app_name="data_science",
+        agent=root_agent,
+        session_service=SqliteSessionService("sessions.db"),
+    )
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+import pydantic_core
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session, State
+from google.adk.sessions.base_session_service import (
+    GetSessionConfig,
+    ListSessionsResponse,
+)
+
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Events larger than this (as JSON) are stored zlib-compressed.
+COMPRESS_MIN_BYTES = 512
+# Writes committed in one transaction at most.
+MAX_BATCH = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid INTEGER PRIMARY KEY,
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    create_time REAL NOT NULL,
+    update_time REAL NOT NULL,
+    last_seq INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (app_name, user_id, id)
+);
+CREATE INDEX IF NOT EXISTS sessions_by_update_time ON sessions (update_time);
+CREATE TABLE IF NOT EXISTS session_state (
+    sid INTEGER NOT NULL REFERENCES sessions (sid) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (sid, key)
+);
+CREATE TABLE IF NOT EXISTS user_state (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS app_state (
+    app_name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (app_name, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS events (
+    sid INTEGER NOT NULL REFERENCES sessions (sid) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (sid, seq)
+);
+CREATE INDEX IF NOT EXISTS events_by_timestamp ON events (timestamp);
+"""
+
+_STOP = object()
+
+
+@dataclass
+class RetentionPolicy:
+    """What `SqliteSessionService.compact` removes.
+
+    Session state is stored apart from the events, so removing events never
+    changes the state of a session.
+
+    Attributes:
+        max_events_per_session: Keep only this many of the latest events of
+          each session.
+        event_ttl_seconds: Remove events older than this.
+        session_ttl_seconds: Remove sessions (with their state and events)
+          not updated for this long.
+        compact_interval_seconds: How often the writer thread compacts;
+          None to only compact on `compact` calls.
+    """
+
+    max_events_per_session: Optional[int] = None
+    event_ttl_seconds: Optional[float] = None
+    session_ttl_seconds: Optional[float] = None
+    compact_interval_seconds: Optional[float] = 300
+
+
+def encode_event(event: Event) -> bytes:
+    """Encodes an event as JSON without empty fields, compressed if large."""
+    return _compress(event.model_dump_json(exclude_none=True).encode("utf-8"))
+
+
+def _compress(data: bytes) -> bytes:
+    if len(data) >= COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(data, 6)
+    return b"j" + data
+
+
+def _dump_state(value) -> str:
+    """Serializes a state value the way the event carrying it is serialized.
+
+    Values JSON has no type for (e.g. the `Decimal`s of NUMERIC columns, or
+    bytes) are encoded as in `Event.model_dump_json`, instead of failing.
+    """
+    return pydantic_core.to_json(value, bytes_mode="base64").decode("utf-8")
+
+
+def decode_event(data: bytes) -> Event:
+    """Decodes an event stored by `encode_event`."""
+    data = bytes(data)
+    body = zlib.decompress(data[1:]) if data[:1] == b"z" else data[1:]
+    return Event.model_validate_json(body)
+
+
+def _split_state(state: dict[str, Any]) -> tuple[dict, dict, dict]:
+    """Splits a state (delta) into its app, user and session keys."""
+    app, user, session = {}, {}, {}
+    for key, value in (state or {}).items():
+        if key.startswith(State.APP_PREFIX):
+            app[key[len(State.APP_PREFIX) :]] = value
+        elif key.startswith(State.USER_PREFIX):
+            user[key[len(State.USER_PREFIX) :]] = value
+        elif not key.startswith(State.TEMP_PREFIX):
+            session[key] = value
+    return app, user, session
+
+
+class SqliteSessionService(BaseSessionService):
+    """Sessions, their state and events in a SQLite database in WAL mode.
+
+    Args:
+        path: The database file; created if it does not exist.
+        retention: The retention policy applied on compaction. Defaults to
+          keeping everything.
+        read_threads: Threads (each with its own connection) serving reads.
+        clock: Returns the current time in seconds, for the retention policy.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        retention: Optional[RetentionPolicy] = None,
+        read_threads: int = 4,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.retention = retention or RetentionPolicy(compact_interval_seconds=None)
+        self.clock = clock
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.executescript(_SCHEMA)
+        connection.close()
+        self._stats = dict.fromkeys(
+            ("appends", "commits", "compactions", "events_removed", "sessions_removed"),
+            0,
+        )
+        self._stats_lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._readers = concurrent.futures.ThreadPoolExecutor(
+            read_threads, thread_name_prefix="session-read"
+        )
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._closed = False
+        self._writer = threading.Thread(
+            target=self._write_loop, name="session-writer", daemon=True
+        )
+        self._writer.start()
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session_id = (session_id or "").strip() or str(uuid.uuid4())
+        now = time.time()
+
+        def create(connection):
+            app, user, session_state = _split_state(state)
+            try:
+                sid = connection.execute(
+                    "INSERT INTO sessions (app_name, user_id, id, create_time,"
+                    " update_time) VALUES (?, ?, ?, ?, ?)",
+                    (app_name, user_id, session_id, now, now),
+                ).lastrowid
+            except sqlite3.IntegrityError:
+                raise AlreadyExistsError(
+                    f"Session with id {session_id} already exists."
+                ) from None
+            self._upsert_state(connection, app_name, user_id, sid, app, user, session_state)
+
+        await self._write(create)
+        return Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=await self._read(
+                lambda c: self._merged_state(c, app_name, user_id, session_id)
+            ),
+            events=[],
+            last_update_time=now,
+        )
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        def get(connection):
+            row = connection.execute(
+                "SELECT sid, update_time FROM sessions"
+                " WHERE app_name = ? AND user_id = ? AND id = ?",
+                (app_name, user_id, session_id),
+            ).fetchone()
+            if row is None:
+                return None
+            sid, update_time = row
+            query = "SELECT data FROM events WHERE sid = ?"
+            params: list = [sid]
+            if config and config.after_timestamp:
+                query += " AND timestamp >= ?"
+                params.append(config.after_timestamp)
+            query += " ORDER BY seq DESC"
+            if config and config.num_recent_events is not None:
+                query += " LIMIT ?"
+                params.append(config.num_recent_events)
+            rows = connection.execute(query, params).fetchall()
+            return Session(
+                app_name=app_name,
+                user_id=user_id,
+                id=session_id,
+                state=self._merged_state(connection, app_name, user_id, session_id),
+                events=[decode_event(data) for (data,) in reversed(rows)],
+                last_update_time=update_time,
+            )
+
+        return await self._read(get)
+
+    async def list_sessions(
+        self, *, app_name: str, user_id: Optional[str] = None
+    ) -> ListSessionsResponse:
+        def list_(connection):
+            where, params = "app_name = ?", [app_name]
+            if user_id is not None:
+                where += " AND user_id = ?"
+                params.append(user_id)
+            rows = connection.execute(
+                f"SELECT sid, user_id, id, update_time FROM sessions WHERE {where}",
+                params,
+            ).fetchall()
+            session_state: dict[int, dict] = {}
+            for sid, key, value in connection.execute(
+                "SELECT sid, key, value FROM session_state WHERE sid IN"
+                f" (SELECT sid FROM sessions WHERE {where})",
+                params,
+            ):
+                session_state.setdefault(sid, {})[key] = json.loads(value)
+            app = self._app_state(connection, app_name)
+            users = {uid: self._user_state(connection, app_name, uid) for _, uid, _, _ in rows}
+            return ListSessionsResponse(
+                sessions=[
+                    Session(
+                        app_name=app_name,
+                        user_id=uid,
+                        id=session_id,
+                        state=_merge_state(app, users[uid], session_state.get(sid, {})),
+                        events=[],
+                        last_update_time=update_time,
+                    )
+                    for sid, uid, session_id, update_time in rows
+                ]
+            )
+
+        return await self._read(list_)
+
+    async def delete_session(
+        self, *, app_name: str, user_id: str, session_id: str
+    ) -> None:
+        await self._write(
+            lambda connection: connection.execute(
+                "DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                (app_name, user_id, session_id),
+            )
+        )
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        self._apply_temp_state(session, event)
+        event = self._trim_temp_delta_state(event)
+        # Compressed on the writer thread; zlib releases the GIL.
+        data = event.model_dump_json(exclude_none=True).encode("utf-8")
+        delta = event.actions.state_delta if event.actions else {}
+        last_update_time = session.last_update_time
+
+        def append(connection):
+            row = connection.execute(
+                "SELECT sid, update_time, last_seq FROM sessions"
+                " WHERE app_name = ? AND user_id = ? AND id = ?",
+                (session.app_name, session.user_id, session.id),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Session {session.id} not found.")
+            sid, update_time, last_seq = row
+            if update_time > last_update_time:
+                raise ValueError(
+                    f"Session {session.id} was updated in storage after it was"
+                    " read; it is stale."
+                )
+            self._upsert_state(
+                connection, session.app_name, session.user_id, sid, *_split_state(delta)
+            )
+            connection.execute(
+                "INSERT INTO events (sid, seq, timestamp, data) VALUES (?, ?, ?, ?)",
+                (sid, last_seq + 1, event.timestamp, _compress(data)),
+            )
+            connection.execute(
+                "UPDATE sessions SET update_time = ?, last_seq = ? WHERE sid = ?",
+                (event.timestamp, last_seq + 1, sid),
+            )
+
+        await self._write(append)
+        with self._stats_lock:
+            self._stats["appends"] += 1
+        session.last_update_time = event.timestamp
+        return await super().append_event(session=session, event=event)
+
+    async def compact(self) -> dict:
+        """Applies the retention policy now.
+
+        Returns:
+            dict: The number of removed sessions and events.
+        """
+        return await self._write(self._compact)
+
+    def stats(self) -> dict:
+        """Returns the write and compaction counters."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["events_per_commit"] = (
+            round(stats["appends"] / stats["commits"], 2) if stats["commits"] else None
+        )
+        return stats
+
+    def close(self):
+        """Stops the writer after the queued writes and closes the database."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._readers.shutdown(wait=True)
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False, timeout=30
+        )
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        return connection
+
+    async def _read(self, func):
+        def run():
+            connection = getattr(self._local, "connection", None)
+            if connection is None:
+                connection = self._local.connection = self._connect()
+                with self._connections_lock:
+                    self._connections.append(connection)
+            return func(connection)
+
+        return await asyncio.get_running_loop().run_in_executor(self._readers, run)
+
+    async def _write(self, func):
+        if self._closed:
+            raise RuntimeError("The session service is closed.")
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self._queue.put((func, future))
+        return await asyncio.wrap_future(future)
+
+    def _write_loop(self):
+        """Commits queued writes in batches and compacts on schedule."""
+        connection = self._connect()
+        interval = self.retention.compact_interval_seconds
+        next_compaction = time.monotonic() + interval if interval else None
+        stop = False
+        while not stop:
+            timeout = (
+                max(0.0, next_compaction - time.monotonic()) if next_compaction else None
+            )
+            try:
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stop = True
+                batch = [item for item in batch if item is not _STOP]
+            if batch:
+                self._commit(connection, batch)
+            if next_compaction and time.monotonic() >= next_compaction:
+                try:
+                    self._run_in_transaction(connection, self._compact)
+                except sqlite3.Error as e:
+                    logger.warning("Session compaction failed: %s", e)
+                next_compaction = time.monotonic() + interval
+        connection.close()
+
+    def _commit(self, connection: sqlite3.Connection, batch: list):
+        """Runs writes in one transaction, each in its own savepoint."""
+        results = []
+        with tracer.span("session_store.commit", writes=len(batch)):
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+                for func, _ in batch:
+                    connection.execute("SAVEPOINT write")
+                    try:
+                        results.append((func(connection), None))
+                        connection.execute("RELEASE write")
+                    except Exception as e:  # pylint: disable=broad-exception-caught
+                        connection.execute("ROLLBACK TO write")
+                        connection.execute("RELEASE write")
+                        results.append((None, e))
+                connection.execute("COMMIT")
+            except sqlite3.Error as e:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                results = [(None, e)] * len(batch)
+        with self._stats_lock:
+            self._stats["commits"] += 1
+        for (_, future), (result, error) in zip(batch, results):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _run_in_transaction(self, connection, func):
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(connection)
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return result
+
+    def _compact(self, connection: sqlite3.Connection) -> dict:
+        policy, now = self.retention, self.clock()
+        removed = {"sessions": 0, "events": 0}
+        with tracer.span("session_store.compact") as span:
+            if policy.session_ttl_seconds is not None:
+                removed["sessions"] += connection.execute(
+                    "DELETE FROM sessions WHERE update_time < ?",
+                    (now - policy.session_ttl_seconds,),
+                ).rowcount
+            if policy.event_ttl_seconds is not None:
+                removed["events"] += connection.execute(
+                    "DELETE FROM events WHERE timestamp < ?",
+                    (now - policy.event_ttl_seconds,),
+                ).rowcount
+            if policy.max_events_per_session is not None:
+                removed["events"] += connection.execute(
+                    "DELETE FROM events WHERE seq <= (SELECT last_seq FROM sessions"
+                    " WHERE sessions.sid = events.sid) - ?",
+                    (policy.max_events_per_session,),
+                ).rowcount
+            span.set(**removed)
+        with self._stats_lock:
+            self._stats["compactions"] += 1
+            self._stats["sessions_removed"] += removed["sessions"]
+            self._stats["events_removed"] += removed["events"]
+        if any(removed.values()):
+            logger.info("Compacted sessions: %s", removed)
+        return removed
+
+    @staticmethod
+    def _upsert_state(connection, app_name, user_id, sid, app, user, session):
+        if app:
+            connection.executemany(
+                "INSERT INTO app_state (app_name, key, value) VALUES (?, ?, ?)"
+                " ON CONFLICT (app_name, key) DO UPDATE SET value = excluded.value",
+                [(app_name, k, _dump_state(v)) for k, v in app.items()],
+            )
+        if user:
+            connection.executemany(
+                "INSERT INTO user_state (app_name, user_id, key, value)"
+                " VALUES (?, ?, ?, ?) ON CONFLICT (app_name, user_id, key)"
+                " DO UPDATE SET value = excluded.value",
+                [(app_name, user_id, k, _dump_state(v)) for k, v in user.items()],
+            )
+        if session:
+            connection.executemany(
+                "INSERT INTO session_state (sid, key, value) VALUES (?, ?, ?)"
+                " ON CONFLICT (sid, key) DO UPDATE SET value = excluded.value",
+                [(sid, k, _dump_state(v)) for k, v in session.items()],
+            )
+
+    @staticmethod
+    def _app_state(connection, app_name) -> dict:
+        return {
+            key: json.loads(value)
+            for key, value in connection.execute(
+                "SELECT key, value FROM app_state WHERE app_name = ?", (app_name,)
+            )
+        }
+
+    @staticmethod
+    def _user_state(connection, app_name, user_id) -> dict:
+        return {
+            key: json.loads(value)
+            for key, value in connection.execute(
+                "SELECT key, value FROM user_state WHERE app_name = ? AND user_id = ?",
+                (app_name, user_id),
+            )
+        }
+
+    def _merged_state(self, connection, app_name, user_id, session_id) -> dict:
+        session = {
+            key: json.loads(value)
+            for key, value in connection.execute(
+                "SELECT key, value FROM session_state WHERE sid ="
+                " (SELECT sid FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?)",
+                (app_name, user_id, session_id),
+            )
+        }
+        return _merge_state(
+            self._app_state(connection, app_name),
+            self._user_state(connection, app_name, user_id),
+            session,
+        )
+
+
+def _merge_state(app: dict, user: dict, session: dict) -> dict:
+    state = dict(session)
+    state.update({State.APP_PREFIX + k: v for k, v in app.items()})
+    state.update({State.USER_PREFIX + k: v for k, v in user.items()})
+    return state
@@ -0,0 +1,218 @@
+"""Size budgets for session state values, spilling large values to artifacts.
+
+Session state is persisted with the session, and every state change with the
+event that made it, so query results, sub-agent outputs and the DDL schema
+kept in state make sessions grow with every turn. `StateManager` gives state
+keys a budget (the size of the value as JSON, in bytes) and moves values over
+it to the artifact service, leaving a small reference in state:
+
+    {"__spilled__": {"artifact": "state_query_result_<digest>.json",
+                     "version": 0, "bytes": 120384, "digest": ..., "fields": None}}
+
+Dict values keep their small fields inline next to the reference, so e.g.
+`state["database_settings"]["bq_schema_fingerprint"]` still reads directly
+and only the DDL schema and the column profile are spilled.
+
+Readers resolve values with `await state_manager.load(context, key)`, which
+returns values that were not spilled as they are. Loaded artifacts are kept
+in a small in-process cache, keyed by their digest.
+
+`spill_large_state` is an `after_tool_callback` spilling what a tool call
+wrote to state. Budgets can be overridden with `STATE_BUDGET_BYTES_<KEY>`
+(e.g. `STATE_BUDGET_BYTES_QUERY_RESULT`); keys without a budget are never
+spilled.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from google.genai import types
+
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Default budgets per state key, in bytes of JSON.
+STATE_BUDGETS = {
+    "query_result": 8_192,
+    "db_agent_output": 8_192,
+    "ana_agent_output": 8_192,
+    "da_agent_output": 8_192,
+    "rs_agent_output": 8_192,
+    "formatted_data": 8_192,
+    "database_settings": 4_096,
+}
+# Fields of a spilled dict value up to this size stay inline in state.
+INLINE_FIELD_BYTES = 256
+SPILLED = "__spilled__"
+
+
+def _encode(value: Any) -> bytes:
+    return json.dumps(value, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def is_spilled(value: Any) -> bool:
+    """Whether a state value is a reference to a spilled value."""
+    return isinstance(value, dict) and SPILLED in value
+
+
+class StateManager:
+    """Keeps state values within their budget by spilling them to artifacts.
+
+    Args:
+        budgets: Budgets per state key, in bytes. Defaults to `STATE_BUDGETS`.
+        cache_size: The number of loaded artifacts kept in process.
+    """
+
+    def __init__(self, budgets: Optional[dict[str, int]] = None, cache_size: int = 32):
+        self.budgets = dict(STATE_BUDGETS if budgets is None else budgets)
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ("spilled", "spilled_bytes", "loads", "cache_hits"), 0
+        )
+
+    def budget(self, key: str) -> Optional[int]:
+        """Returns the budget of a state key, or None if it is not managed."""
+        override = os.getenv(f"STATE_BUDGET_BYTES_{key.upper()}")
+        if override:
+            return int(override)
+        return self.budgets.get(key)
+
+    async def spill(self, context) -> list[str]:
+        """Spills the values written in this context that exceed their budget.
+
+        Only the keys changed by the pending state delta are checked; values
+        already persisted were checked when they were written.
+
+        Args:
+            context: A `CallbackContext` or `ToolContext`.
+
+        Returns:
+            list[str]: The spilled keys.
+        """
+        invocation_context = context._invocation_context  # pylint: disable=protected-access
+        if invocation_context.artifact_service is None:
+            return []
+        spilled = []
+        for key, value in list(context.actions.state_delta.items()):
+            budget = self.budget(key)
+            if budget is None or key.startswith("temp:") or is_spilled(value):
+                continue
+            data = _encode(value)
+            if len(data) <= budget:
+                continue
+            context.state[key] = await self._spill_value(context, key, value, data)
+            spilled.append(key)
+        return spilled
+
+    async def load(self, context, key: str, default: Any = None) -> Any:
+        """Returns a state value, loading it from its artifact if it was spilled.
+
+        Args:
+            context: A `ReadonlyContext`, `CallbackContext` or `ToolContext`.
+            key: The state key.
+            default: Returned if the key is not in state.
+
+        Raises:
+            KeyError: If the artifact of a spilled value no longer exists.
+        """
+        value = context.state.get(key, default)
+        if not is_spilled(value):
+            return value
+        reference = value[SPILLED]
+        data = self._cached(reference["digest"])
+        if data is None:
+            data = await self._load_artifact(context, key, reference)
+        payload = json.loads(data)
+        if reference.get("fields") is None:
+            return payload
+        return {**{k: v for k, v in value.items() if k != SPILLED}, **payload}
+
+    def stats(self) -> dict:
+        """Returns the spill and load counters."""
+        with self._lock:
+            return dict(self._stats, cached=len(self._cache))
+
+    async def _spill_value(self, context, key: str, value: Any, data: bytes) -> dict:
+        inline = {}
+        if isinstance(value, dict):
+            inline = {
+                k: v for k, v in value.items() if len(_encode(v)) <= INLINE_FIELD_BYTES
+            }
+            payload = {k: v for k, v in value.items() if k not in inline}
+            data = _encode(payload)
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        filename = f"state_{re.sub(r'[^A-Za-z0-9_.-]', '_', key)}_{digest}.json"
+        with tracer.span("state.spill", key=key, bytes=len(data)):
+            version = await context.save_artifact(
+                filename, types.Part.from_bytes(data=data, mime_type="application/json")
+            )
+        self._remember(digest, data)
+        with self._lock:
+            self._stats["spilled"] += 1
+            self._stats["spilled_bytes"] += len(data)
+        logger.info("Spilled state %r (%d bytes) to artifact %s", key, len(data), filename)
+        return {
+            **inline,
+            SPILLED: {
+                "artifact": filename,
+                "version": version,
+                "bytes": len(data),
+                "digest": digest,
+                "fields": sorted(payload) if isinstance(value, dict) else None,
+            },
+        }
+
+    async def _load_artifact(self, context, key: str, reference: dict) -> bytes:
+        invocation_context = context._invocation_context  # pylint: disable=protected-access
+        part = None
+        with tracer.span("state.load", key=key, bytes=reference["bytes"]):
+            if invocation_context.artifact_service is not None:
+                part = await invocation_context.artifact_service.load_artifact(
+                    app_name=invocation_context.app_name,
+                    user_id=invocation_context.user_id,
+                    session_id=invocation_context.session.id,
+                    filename=reference["artifact"],
+                    version=reference["version"],
+                )
+        if part is None or part.inline_data is None:
+            raise KeyError(
+                f"State {key!r} was spilled to {reference['artifact']}, which no"
+                " longer exists."
+            )
+        with self._lock:
+            self._stats["loads"] += 1
+        self._remember(reference["digest"], part.inline_data.data)
+        return part.inline_data.data
+
+    def _cached(self, digest: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._cache.get(digest)
+            if data is not None:
+                self._cache.move_to_end(digest)
+                self._stats["cache_hits"] += 1
+            return data
+
+    def _remember(self, digest: str, data: bytes):
+        with self._lock:
+            self._cache[digest] = data
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+state_manager = StateManager()
+
+
+async def spill_large_state(tool, args, tool_context, tool_response):
+    """`after_tool_callback` spilling the state values a tool wrote over budget."""
+    del tool, args, tool_response  # Unused.
+    await state_manager.spill(tool_context)
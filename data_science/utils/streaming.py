@@ -0,0 +1,253 @@
+"""Backpressure-aware streaming of model output to a client.
+
+`TokenStream` sits between a token producer (an LLM callback) and a consumer
+(e.g. a websocket). Producers put events into a bounded queue; a single
+consumer task coalesces consecutive tokens into frames, bounded by size and by
+time, and awaits the sink for each frame. When the consumer falls behind, the
+queue fills up and the configured overflow policy applies:
+
+- "block": producers wait for room, slowing generation down to the consumer.
+- "drop": token events that do not fit are dropped and counted; the consumer
+  sends a `{"type": "dropped", ...}` frame before the next frame so clients
+  know the text has gaps. Control events (start/end/actions) are never dropped.
+"""
+
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+Sink = Callable[[dict], Union[Awaitable[Any], Any]]
+
+OVERFLOW_POLICIES = ("block", "drop")
+
+_CLOSE = object()
+
+
+class StreamClosed(Exception):
+    """Raised when putting into a stream whose consumer has stopped."""
+
+
+@dataclass
+class StreamStats:
+    """Counters of a `TokenStream`."""
+
+    events_in: int = 0
+    tokens_in: int = 0
+    frames_out: int = 0
+    dropped_tokens: int = 0
+    dropped_chars: int = 0
+    max_queue_depth: int = 0
+    blocked_seconds: float = 0.0
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__, blocked_seconds=round(self.blocked_seconds, 4))
+
+
+class TokenStream:
+    """Bounded, coalescing event stream between a model and a sink.
+
+    Events are dicts with a "type" key; "token" events carry the text in
+    "content" and are merged with following tokens of the same "agent" and
+    "task".
+
+    Args:
+        sink: Called (and awaited, if it returns an awaitable) with every frame,
+          e.g. `lambda frame: websocket.send_text(json.dumps(frame))`.
+        max_queue: Maximum number of events waiting for the consumer.
+        frame_chars: A frame is sent once it holds at least this many chars.
+        frame_interval: A frame is sent at most this many seconds after its
+          first token, even if it is smaller than `frame_chars`.
+        overflow: "block" or "drop", see the module docstring.
+    """
+
+    def __init__(
+        self,
+        sink: Sink,
+        max_queue: int = 256,
+        frame_chars: int = 512,
+        frame_interval: float = 0.05,
+        overflow: str = "block",
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown overflow policy: {overflow}. Use one of {OVERFLOW_POLICIES}"
+            )
+        self.sink = sink
+        self.max_queue = max_queue
+        self.frame_chars = frame_chars
+        self.frame_interval = frame_interval
+        self.overflow = overflow
+        self.stats = StreamStats()
+        self.error: Optional[BaseException] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._carry = None  # Event read while building a frame, sent next.
+        self._notified_drops = 0
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        """Whether the stream was closed or its sink failed."""
+        return self._closed
+
+    def start(self) -> "TokenStream":
+        """Starts the consumer task on the running event loop."""
+        if self._consumer is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._consumer = self._loop.create_task(self._consume())
+        return self
+
+    async def put(self, event: dict):
+        """Puts an event, applying the overflow policy when the queue is full.
+
+        Raises:
+            StreamClosed: If the stream was closed or its sink failed.
+        """
+        self.start()
+        if self._closed:
+            raise StreamClosed("stream is closed") from self.error
+        self.stats.events_in += 1
+        is_token = event.get("type") == "token"
+        if is_token:
+            self.stats.tokens_in += 1
+        if self._queue.full():
+            if is_token and self.overflow == "drop":
+                self.stats.dropped_tokens += 1
+                self.stats.dropped_chars += len(event.get("content") or "")
+                return
+            start = time.perf_counter()
+            await self._queue.put(event)
+            self.stats.blocked_seconds += time.perf_counter() - start
+        else:
+            self._queue.put_nowait(event)
+        self.stats.max_queue_depth = max(
+            self.stats.max_queue_depth, self._queue.qsize()
+        )
+
+    def push(self, event: dict, timeout: Optional[float] = None):
+        """Thread-safe, synchronous `put` for callbacks running off the loop.
+
+        Blocks the calling thread while the stream applies backpressure.
+
+        Raises:
+            RuntimeError: If called from the event loop thread, where blocking
+              would deadlock the consumer. Use `await put()` there instead.
+            StreamClosed: If the stream was closed or its sink failed.
+        """
+        if self._loop is None:
+            raise RuntimeError("TokenStream.start() must be called first")
+        if self._loop_thread == threading.get_ident():
+            raise RuntimeError(
+                "TokenStream.push() called on the event loop thread; use"
+                " `await put()` (e.g. AsyncStreamingCallbackHandler) instead"
+            )
+        asyncio.run_coroutine_threadsafe(self.put(event), self._loop).result(
+            timeout
+        )
+
+    async def aclose(self):
+        """Flushes all queued events to the sink and stops the consumer.
+
+        Raises:
+            StreamClosed: If the sink failed while sending.
+        """
+        if self._consumer is None:
+            self._closed = True
+            return
+        if not self._closed:
+            self._closed = True
+            if not self._consumer.done():
+                await self._queue.put(_CLOSE)
+        await self._consumer
+        if self.error is not None:
+            raise StreamClosed("sink failed") from self.error
+
+    async def _consume(self):
+        try:
+            while True:
+                frame = await self._next_frame()
+                await self._notify_drops()
+                if frame is None:
+                    return
+                await self._send(frame)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning("Stream sink failed, closing stream: %r", e)
+            self.error = e
+            self._closed = True
+            # Unblock producers waiting for room; their events are discarded
+            # and subsequent puts raise StreamClosed.
+            while not self._queue.empty():
+                self._queue.get_nowait()
+
+    async def _notify_drops(self):
+        """Tells the sink how many tokens were dropped since the last notice."""
+        dropped = self.stats.dropped_tokens - self._notified_drops
+        if dropped:
+            self._notified_drops = self.stats.dropped_tokens
+            await self._send(
+                {
+                    "type": "dropped",
+                    "tokens": dropped,
+                    "total_tokens": self.stats.dropped_tokens,
+                }
+            )
+
+    async def _send(self, frame: dict):
+        result = self.sink(frame)
+        if inspect.isawaitable(result):
+            await result
+        self.stats.frames_out += 1
+
+    async def _get(self, timeout: Optional[float] = None):
+        if self._carry is not None:
+            event, self._carry = self._carry, None
+            return event
+        if timeout is None:
+            return await self._queue.get()
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    async def _next_frame(self) -> Optional[dict]:
+        """Returns the next frame, coalescing consecutive tokens."""
+        first = await self._get()
+        if first is _CLOSE:
+            return None
+        if first.get("type") != "token":
+            return first
+
+        frame = dict(first)
+        content = [first.get("content") or ""]
+        size = len(content[0])
+        deadline = self._loop.time() + self.frame_interval
+        while size < self.frame_chars:
+            if self._queue.empty():
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    event = await self._get(timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                event = self._queue.get_nowait()
+            if (
+                event is _CLOSE
+                or event.get("type") != "token"
+                or event.get("agent") != frame.get("agent")
+                or event.get("task") != frame.get("task")
+            ):
+                self._carry = event
+                break
+            content.append(event.get("content") or "")
+            size += len(content[-1])
+        frame["content"] = "".join(content)
+        return frame
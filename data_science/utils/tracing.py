@@ -0,0 +1,379 @@
+"""Structured tracing spans with pluggable exporters.
+
+A span times one unit of work (an LLM call, a BigQuery job, a sqlglot step, a
+formatter) and carries structured attributes such as token counts, bytes
+processed, rows returned and cache hits. Spans nest: a span opened while
+another one is active (in the same thread or asyncio task) becomes its child,
+so the spans of one user query form a tree that shows which stage of the
+agent pipeline is slow, without a live APM.
+
+Finished spans are handed to the tracer's exporters:
+
+    from data_science.utils.tracing import InMemoryExporter, tracer
+
+    exporter = tracer.add_exporter(InMemoryExporter())
+    ...
+    print(exporter.summary())
+
+The model calls of ADK agents are traced by the callbacks of
+`model_call_tracer`. Setting `TRACE_FILE` in the environment exports every span as one JSON line
+to that file.
+"""
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+@dataclass
+class Span:
+    """A timed unit of work with structured attributes."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_time: float = field(default_factory=time.time)
+    duration: Optional[float] = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    status: str = "ok"
+    error: Optional[str] = None
+    _started: float = field(default_factory=time.perf_counter, repr=False)
+
+    def set(self, **attributes) -> "Span":
+        """Sets attributes; `None` values are skipped."""
+        self.attributes.update(
+            {k: v for k, v in attributes.items() if v is not None}
+        )
+        return self
+
+    def add(self, key: str, amount: float = 1) -> "Span":
+        """Adds `amount` to the numeric attribute `key`."""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration": round(self.duration, 6) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "status": self.status,
+            "error": self.error,
+        }
+
+
+class SpanExporter:
+    """Receives finished spans. Subclasses implement `export`."""
+
+    def export(self, span: Span):
+        raise NotImplementedError
+
+    def shutdown(self):
+        """Releases resources held by the exporter."""
+
+
+class InMemoryExporter(SpanExporter):
+    """Keeps finished spans in memory, e.g. for tests and benchmarks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans: list[Span] = []
+
+    def export(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+
+    @property
+    def spans(self) -> list[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def find(self, name: str) -> list[Span]:
+        """Returns the finished spans called `name`."""
+        return [span for span in self.spans if span.name == name]
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def summary(self) -> dict[str, dict]:
+        """Returns call counts and durations per span name, slowest first."""
+        return summarize(self.spans)
+
+
+class JsonlFileExporter(SpanExporter):
+    """Appends every finished span as one JSON line to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")  # pylint: disable=consider-using-with
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def shutdown(self):
+        with self._lock:
+            self._file.close()
+
+
+def summarize(spans: list[Span]) -> dict[str, dict]:
+    """Aggregates spans by name into counts and durations, slowest first.
+
+    Args:
+        spans: Finished spans.
+
+    Returns:
+        dict: Per span name, the number of spans, errors, and the total, mean
+        and max duration in seconds.
+    """
+    summary: dict[str, dict] = {}
+    for span in spans:
+        entry = summary.setdefault(
+            span.name, {"count": 0, "errors": 0, "total": 0.0, "max": 0.0}
+        )
+        entry["count"] += 1
+        entry["errors"] += span.status == "error"
+        entry["total"] += span.duration or 0.0
+        entry["max"] = max(entry["max"], span.duration or 0.0)
+    for entry in summary.values():
+        entry["mean"] = round(entry["total"] / entry["count"], 6)
+        entry["total"] = round(entry["total"], 6)
+        entry["max"] = round(entry["max"], 6)
+    return dict(sorted(summary.items(), key=lambda item: -item[1]["total"]))
+
+
+class Tracer:
+    """Creates spans and hands finished spans to the registered exporters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._exporters: list[SpanExporter] = []
+
+    def add_exporter(self, exporter: SpanExporter) -> SpanExporter:
+        with self._lock:
+            self._exporters.append(exporter)
+        return exporter
+
+    def remove_exporter(self, exporter: SpanExporter):
+        with self._lock:
+            if exporter in self._exporters:
+                self._exporters.remove(exporter)
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        """Returns the innermost active span of this thread or task."""
+        return _current_span.get()
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes):
+        """Times the enclosed block as a span called `name`.
+
+        The span is a child of the current span, if any. Exceptions raised in
+        the block mark the span as failed and are re-raised.
+
+        Args:
+            name: The span name, e.g. "bigquery.query".
+            **attributes: Initial span attributes.
+
+        Yields:
+            Span: The span, to attach further attributes with `set` and `add`.
+        """
+        span = self.start_span(name, **attributes)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span, error)
+
+    def start_span(self, name: str, **attributes) -> Span:
+        """Starts a span that is finished with `end_span`.
+
+        Unlike `span`, the span does not become the current span, so it can be
+        started and finished in different places: around a generator, which
+        must not hold a context variable across its `yield`s, or in a pair of
+        callbacks. It is a child of the current span, if any.
+
+        Args:
+            name: The span name.
+            **attributes: Initial span attributes.
+
+        Returns:
+            Span: The started span.
+        """
+        parent = _current_span.get()
+        return Span(
+            name=name,
+            trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent else None,
+        ).set(**attributes)
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None):
+        """Finishes a span started with `start_span` and exports it.
+
+        Args:
+            span: The span.
+            error: The exception the work failed with, if any.
+        """
+        span.duration = time.perf_counter() - span._started  # pylint: disable=protected-access
+        if error is not None:
+            span.status = "error"
+            span.error = f"{type(error).__name__}: {error}"
+        self._export(span)
+
+    def _export(self, span: Span):
+        with self._lock:
+            exporters = list(self._exporters)
+        for exporter in exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning("Span exporter %r failed: %r", exporter, e)
+
+
+tracer = Tracer()
+
+if os.getenv("TRACE_FILE"):
+    tracer.add_exporter(JsonlFileExporter(os.environ["TRACE_FILE"]))
+
+
+def traced(name: str | None = None):
+    """Decorator that runs every call of a function in a span.
+
+    Works for plain and async functions and keeps the signature, so decorated
+    functions can still be registered as ADK tools.
+
+    Args:
+        name: The span name. Defaults to the function's qualified name.
+    """
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(span_name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_llm_usage(span: Span, response) -> None:
+    """Copies the token usage of a Gemini response onto `span`.
+
+    Works for `google.genai` and Vertex AI SDK responses, which both expose
+    `usage_metadata`. Tokens served from a context cache count as a cache hit.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    cached = getattr(usage, "cached_content_token_count", None) or 0
+    span.set(
+        prompt_tokens=getattr(usage, "prompt_token_count", None),
+        completion_tokens=getattr(usage, "candidates_token_count", None),
+        total_tokens=getattr(usage, "total_token_count", None),
+        cached_tokens=cached,
+        cache_hit=cached > 0,
+    )
+
+
+class ModelCallTracer:
+    """ADK model callbacks tracing every model call of an agent.
+
+    `before_model` starts an "llm.call" span, `after_model` copies the token
+    usage of the response onto it and finishes it, and `on_model_error`
+    finishes it as failed. Add `before_model` last to an agent's
+    `before_model_callback`s, since an earlier callback returning a response
+    skips the model call.
+
+    Args:
+        max_open: The number of unfinished spans kept; older ones, e.g. of
+          model calls whose response a plugin replaced, are dropped.
+    """
+
+    def __init__(self, max_open: int = 1024):
+        self.max_open = max_open
+        self._open: OrderedDict[tuple, Span] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(callback_context) -> tuple:
+        return (callback_context.invocation_id, callback_context.agent_name)
+
+    def _pop(self, callback_context) -> Optional[Span]:
+        with self._lock:
+            return self._open.pop(self._key(callback_context), None)
+
+    def before_model(self, callback_context, llm_request):
+        """`before_model_callback` starting the span of a model call."""
+        span = tracer.start_span(
+            "llm.call",
+            model=getattr(llm_request, "model", None) or "unknown",
+            agent=callback_context.agent_name,
+        )
+        with self._lock:
+            self._open[self._key(callback_context)] = span
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return None
+
+    def after_model(self, callback_context, llm_response):
+        """`after_model_callback` finishing the span with the token usage."""
+        if getattr(llm_response, "partial", False):
+            return None
+        span = self._pop(callback_context)
+        if span is not None:
+            record_llm_usage(span, llm_response)
+            tracer.end_span(span)
+        return None
+
+    def on_model_error(self, callback_context, llm_request, error):
+        """`on_model_error_callback` finishing the span as failed."""
+        del llm_request  # Unused.
+        span = self._pop(callback_context)
+        if span is not None:
+            tracer.end_span(span, error)
+        return None
+
+
+model_call_tracer = ModelCallTracer()
@@ -3,10 +3,12 @@
 import json
 import os
 
-from vertexai.preview.extensions import Extension
-
 
 def list_all_extensions():
+  # Imported here so that importing this module does not load the Vertex AI
+  # SDK.
+  from vertexai.preview.extensions import Extension  # pylint: disable=g-import-not-at-top
+
   extensions = Extension.list(location='us-central1')
   for extension in extensions:
     print('Name:', extension.gca_resource.name)
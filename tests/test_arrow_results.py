@@ -0,0 +1,217 @@
+#
+
+"""Test cases for the Arrow result path and the paged result store."""
+
+import asyncio
+import datetime
+import json
+import os
+import sys
+import tempfile
+import unittest
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+import pyarrow as pa
+from google.cloud import bigquery
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from data_science.sub_agents.bigquery import tools
+from data_science.sub_agents.bigquery.arrow_results import fetch_arrow, to_rows
+from data_science.sub_agents.bigquery.result_tools import (
+    aggregate_result,
+    fetch_result_page,
+)
+from data_science.sub_agents.data_formatter.tools import format_pie_data
+from data_science.utils.result_files import STATE_KEY, read_result_file
+
+DAY = datetime.date(2024, 3, 1)
+
+
+class FakeRowIterator:
+    """Serves a result as Arrow record batches of `page_rows` rows."""
+
+    def __init__(self, num_rows, page_rows=40):
+        self.table = pa.table(
+            {
+                "country": [f"c{i % 4}" for i in range(num_rows)],
+                "sold": list(range(num_rows)),
+                "day": [DAY] * num_rows,
+            }
+        )
+        self.page_rows = page_rows
+        self.schema = [
+            bigquery.SchemaField("country", "STRING"),
+            bigquery.SchemaField("sold", "INTEGER"),
+            bigquery.SchemaField("day", "DATE"),
+        ]
+        self.total_rows = num_rows
+        self.pages_read = 0
+        self.started = False
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        self._start()
+        for batch in self.table.to_batches(max_chunksize=self.page_rows):
+            self.pages_read += 1
+            yield batch
+
+    def to_arrow(self, create_bqstorage_client=True):
+        self._start()
+        return self.table
+
+    def _start(self):
+        # Like RowIterator, which can only be iterated once.
+        if self.started:
+            raise ValueError("Iterator has already started")
+        self.started = True
+
+
+class FakeQueryJob:
+    job_id = "job_1"
+    total_bytes_processed = 1024
+    total_bytes_billed = 10485760
+    cache_hit = False
+
+    def __init__(self, results):
+        self.results = results
+
+    def result(self):
+        return self.results
+
+
+class TestArrowResults(unittest.TestCase):
+    """Test cases for fetch_arrow, to_rows and their consumers."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.dict(os.environ, {"RESULT_FILES_DIR": directory.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fetch_stops_after_max_rows(self):
+        results = FakeRowIterator(200)
+        table = fetch_arrow(results, max_rows=90)
+        self.assertEqual(table.num_rows, 90)
+        self.assertEqual(results.pages_read, 3)
+
+        empty = fetch_arrow(FakeRowIterator(0))
+        self.assertEqual(empty.num_rows, 0)
+        self.assertEqual(empty.column_names, ["country", "sold", "day"])
+        self.assertEqual(empty.schema.field("day").type, pa.date32())
+
+    def test_rows_have_formatted_dates(self):
+        rows = to_rows(fetch_arrow(FakeRowIterator(10)), max_rows=2)
+        self.assertEqual(
+            rows,
+            [
+                {"country": "c0", "sold": 0, "day": "2024-03-01"},
+                {"country": "c1", "sold": 1, "day": "2024-03-01"},
+            ],
+        )
+        numeric = pa.table(
+            {"total": pa.array([Decimal("1.50"), None], pa.decimal128(38, 9))}
+        )
+        self.assertEqual(to_rows(numeric), [{"total": 1.5}, {"total": None}])
+
+    def test_validation_shares_the_arrow_result(self):
+        client = mock.Mock()
+        client.query.return_value = FakeQueryJob(FakeRowIterator(4))
+        tool_context = SimpleNamespace(state={}, invocation_id="run-1")
+        with mock.patch.object(tools, "get_bq_client", return_value=client):
+            result = asyncio.run(
+                tools.run_bigquery_validation("SELECT country, sold, day FROM t", tool_context)
+            )
+        self.assertIsNone(result["error_message"])
+        self.assertEqual(result["query_result"][3]["day"], "2024-03-01")
+        self.assertNotIn("note", result)
+        handoff = tool_context.state[STATE_KEY]
+        self.assertEqual(handoff["num_rows"], 4)
+        self.assertEqual(handoff["result_id"], "job_1")
+        self.assertEqual(
+            read_result_file(handoff["path"]).column("sold").to_pylist(), [0, 1, 2, 3]
+        )
+
+        # The formatters read the same file instead of parsing text.
+        tool_context.state[STATE_KEY] = {
+            **handoff,
+            "path": _write(pa.table({"country": ["a", "b"], "sold": [1, 3]})),
+        }
+        pie = json.loads(format_pie_data("query_result", tool_context))
+        values = pie["formatted_data_for_visualization"]
+        self.assertEqual([v["value"] for v in values], [1.0, 3.0])
+
+    def run_large_query(self, num_rows, tool_context=None):
+        client = mock.Mock()
+        client.query.return_value = FakeQueryJob(FakeRowIterator(num_rows))
+        self.tool_context = tool_context or SimpleNamespace(
+            state={}, invocation_id="run-1"
+        )
+        with mock.patch.object(tools, "get_bq_client", return_value=client):
+            return asyncio.run(
+                tools.run_bigquery_validation("SELECT * FROM t", self.tool_context)
+            )
+
+    def test_large_results_are_paged_not_truncated(self):
+        result = self.run_large_query(200)
+        self.assertEqual(len(result["query_result"]), tools.MAX_NUM_ROWS)
+        self.assertEqual((result["total_rows"], result["result_id"]), (200, "job_1"))
+        self.assertIn("Only the first 80 of 200 rows", result["note"])
+
+        page = fetch_result_page("job_1", 3, self.tool_context)
+        self.assertEqual((page["pages"], len(page["rows"])), (3, 40))
+        self.assertEqual(page["rows"][0]["sold"], 160)
+        self.assertIn("error_message", fetch_result_page("job_1", 4, self.tool_context))
+        self.assertIn(
+            "error_message", fetch_result_page("../job_1", 1, self.tool_context)
+        )
+        # Other sessions cannot read the result.
+        other = SimpleNamespace(state={})
+        self.assertIn("error_message", fetch_result_page("job_1", 1, other))
+
+    def test_aggregates_cover_all_rows(self):
+        self.run_large_query(200)
+        result = aggregate_result(
+            "job_1",
+            ["sum:sold", "count"],
+            self.tool_context,
+            group_by=["country"],
+            order_by="sum_sold",
+        )
+        self.assertEqual(result["groups"], 4)
+        self.assertEqual(
+            result["rows"][0], {"country": "c3", "sum_sold": 5050, "count": 50}
+        )
+        total = aggregate_result("job_1", ["max:sold", "mean:sold"], self.tool_context)
+        self.assertEqual(total["rows"], [{"max_sold": 199, "mean_sold": 99.5}])
+        for aggregations in (["sum:missing"], ["sum:country"], ["mean:day"]):
+            with self.subTest(aggregations=aggregations):
+                self.assertIn(
+                    "error_message",
+                    aggregate_result("job_1", aggregations, self.tool_context),
+                )
+        repeated = aggregate_result(
+            "job_1", ["sum:sold", "sum:sold", "min:day", "count"], self.tool_context
+        )
+        self.assertEqual(
+            repeated["rows"], [{"sum_sold": 19900, "min_day": "2024-03-01", "count": 200}]
+        )
+
+    def test_results_over_the_cap_are_flagged(self):
+        with mock.patch.object(tools, "MAX_RESULT_ROWS", 150):
+            result = self.run_large_query(200)
+        self.assertEqual(result["total_rows"], 150)
+        self.assertIn("more than 150 rows", result["note"])
+
+
+def _write(table):
+    path = os.path.join(os.environ["RESULT_FILES_DIR"], "pie.arrow")
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return path
+
+
+if __name__ == "__main__":
+    unittest.main()
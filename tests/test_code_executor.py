@@ -0,0 +1,169 @@
+#
+
+"""Test cases for the local code executor and kernel pool of the analytics agent."""
+
+import base64
+import os
+import sys
+import unittest
+import unittest.mock
+from types import SimpleNamespace
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from google.adk.code_executors.code_execution_utils import CodeExecutionInput, File
+
+from data_science.sub_agents.analytics.code_executors import (
+    LazyVertexAiCodeExecutor,
+    LocalCodeExecutor,
+    get_code_executor,
+)
+from data_science.sub_agents.analytics.kernel import KernelLimits
+from data_science.sub_agents.analytics.kernel_pool import KernelPool
+from data_science.utils.result_files import STATE_KEY, write_result_file
+
+
+class TestLocalCodeExecutor(unittest.TestCase):
+    """Test cases for LocalCodeExecutor."""
+
+    def setUp(self):
+        self.executor = LocalCodeExecutor(
+            stateful=True, timeout_seconds=2, pool_size=0
+        )
+        self.addCleanup(self.executor.shutdown)
+
+    def run_cell(self, code, session="s1", input_files=(), state=None):
+        return self.executor.execute_code(
+            SimpleNamespace(session=SimpleNamespace(state=state or {})),
+            CodeExecutionInput(
+                code=code, input_files=list(input_files), execution_id=session
+            ),
+        )
+
+    def test_state_persists_per_session(self):
+        self.run_cell("df = pd.DataFrame({'a': [1, 2, 3]})")
+        result = self.run_cell("print(df['a'].sum())\nfloat(np.mean(df['a']))")
+        self.assertEqual(result.stdout, "6\n2.0\n")
+        self.assertEqual(result.stderr, "")
+        other = self.run_cell("df", session="s2")
+        self.assertIn("NameError", other.stderr)
+
+    def test_input_and_output_files(self):
+        csv = File(
+            name="data_1_1.csv",
+            content=base64.b64encode(b"x,y\n1,2\n3,4\n").decode(),
+            mime_type="text/csv",
+        )
+        result = self.run_cell(
+            "pd.read_csv('data_1_1.csv').sum().to_csv('sums.csv')",
+            input_files=[csv],
+        )
+        self.assertEqual(result.stderr, "")
+        self.assertEqual([f.name for f in result.output_files], ["sums.csv"])
+        self.assertIn(b"x,4", base64.b64decode(result.output_files[0].content))
+
+    def test_query_result_is_bound_as_df_once(self):
+        state = {STATE_KEY: write_result_file([{"a": 1}, {"a": 2}]).to_state()}
+        result = self.run_cell("df = df[df.a > 1]", state=state)
+        self.assertEqual(result.stderr, "")
+        # The same result is not loaded again over the model's own `df`.
+        self.assertEqual(self.run_cell("len(df)", state=state).stdout, "1\n")
+        state = {STATE_KEY: write_result_file([{"b": 1}] * 5).to_state()}
+        self.assertEqual(self.run_cell("df.shape", state=state).stdout, "(5, 1)\n")
+
+    def test_failed_result_binding_is_reported(self):
+        result_file = write_result_file([{"a": 1}])
+        os.remove(result_file.path)
+        result = self.run_cell("1", state={STATE_KEY: result_file.to_state()})
+        self.assertIn("could not be loaded as the DataFrame `df`", result.stderr)
+        self.assertIn("FileNotFoundError", result.stderr)
+
+    def test_timeout_interrupts_cell_and_keeps_state(self):
+        self.run_cell("x = 1")
+        result = self.run_cell("while True:\n    pass")
+        self.assertIn("timed out", result.stderr)
+        self.assertIn("KeyboardInterrupt", result.stderr)
+        self.assertEqual(self.run_cell("x").stdout, "1\n")
+
+    def test_memory_limit(self):
+        executor = LocalCodeExecutor(
+            stateful=True, memory_limit_mb=1024, pool_size=0
+        )
+        self.addCleanup(executor.shutdown)
+        result = executor.execute_code(
+            None, CodeExecutionInput(code="b = bytearray(2 * 1024**3)", execution_id="m")
+        )
+        self.assertIn("MemoryError", result.stderr)
+
+    def test_kernel_gets_no_credentials(self):
+        os.environ["DS_TEST_API_KEY"] = "secret"
+        self.addCleanup(os.environ.pop, "DS_TEST_API_KEY")
+        result = self.run_cell(
+            "import os\nprint(os.environ.get('DS_TEST_API_KEY'))\n"
+            "print(os.environ['HOME'] == os.getcwd())"
+        )
+        self.assertEqual(result.stdout, "None\nTrue\n")
+
+    def test_backend_selection(self):
+        with unittest.mock.patch.dict(os.environ):
+            os.environ.pop("ANALYTICS_CODE_EXECUTOR", None)
+            self.assertIsInstance(get_code_executor(), LazyVertexAiCodeExecutor)
+        self.assertIsInstance(get_code_executor("local"), LocalCodeExecutor)
+        vertex = get_code_executor("vertex")
+        self.assertIsInstance(vertex, LazyVertexAiCodeExecutor)
+        self.assertTrue(vertex.stateful and vertex.optimize_data_file)
+        with self.assertRaises(ValueError):
+            get_code_executor("docker")
+
+
+class TestKernelPool(unittest.TestCase):
+    """Test cases for KernelPool."""
+
+    def setUp(self):
+        self.now = 0.0
+        self.pool = KernelPool(
+            size=1,
+            limits=KernelLimits(cell_timeout_seconds=5),
+            idle_timeout_seconds=60,
+            max_sessions=2,
+            maintain=False,
+            clock=lambda: self.now,
+        )
+        self.addCleanup(self.pool.shutdown)
+
+    def test_prewarmed_kernel_is_a_pool_hit(self):
+        self.pool.prewarm()
+        kernel, cold = self.pool.acquire("a")
+        self.assertFalse(cold)
+        self.assertEqual(self.pool.acquire("a")[0], kernel)
+        _, cold = self.pool.acquire("b")
+        self.assertTrue(cold)
+        stats = self.pool.stats()
+        self.assertEqual(
+            (stats["hits"], stats["reuses"], stats["cold_starts"]), (1, 1, 1)
+        )
+        self.assertEqual(stats["active"], 2)
+        self.assertGreater(stats["max_kernel_memory_bytes"], 0)
+
+    def test_idle_session_is_reset_and_recycled(self):
+        kernel, _ = self.pool.acquire("a")
+        kernel.execute("secret = 42\nopen('notes.txt', 'w').write('x')")
+        self.now += 61
+        self.assertEqual(self.pool.expire(), 1)
+
+        reused, cold = self.pool.acquire("b")
+        self.assertFalse(cold)
+        self.assertEqual(reused.pid, kernel.pid)
+        result = reused.execute("print('secret' in globals(), pd.__name__)")
+        self.assertEqual(result.stdout, "False pandas\n")
+        self.assertEqual(os.listdir(reused.work_dir), [])
+        self.assertEqual(self.pool.stats()["recycled"], 1)
+
+        # A kernel that served `max_sessions` sessions is retired.
+        self.pool.release("b")
+        self.assertFalse(reused.alive)
+        self.assertEqual(self.pool.stats()["retired"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
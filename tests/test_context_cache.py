@@ -0,0 +1,177 @@
+#
+
+"""Test cases for the context-cache manager, against a local cache service."""
+
+import asyncio
+import os
+import sys
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from data_science.sub_agents.bigquery.chase_sql import chase_db_tools
+from data_science.sub_agents.bigquery.chase_sql.chase_constants import (
+    chase_sql_constants_dict,
+)
+from data_science.utils.context_cache import CacheService, ContextCacheManager
+
+
+class LocalCacheService(CacheService):
+    """In-process stand-in for Vertex AI context caching."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.caches = {}
+        self.created = 0
+        self.fail_create = False
+
+    def create(self, model, contents, ttl_seconds):
+        if self.fail_create:
+            raise ConnectionError("cache service unavailable")
+        self.created += 1
+        name = f"cachedContents/{self.created}"
+        self.caches[name] = {
+            "model": model,
+            "contents": contents,
+            "expires": self.clock() + ttl_seconds,
+        }
+        return name
+
+    def refresh(self, name, ttl_seconds):
+        self.caches[name]["expires"] = self.clock() + ttl_seconds
+
+    def delete(self, name):
+        del self.caches[name]
+
+
+PREFIX = "Few-shot example. " * 50
+
+
+class TestContextCacheManager(unittest.TestCase):
+    """Test cases for ContextCacheManager."""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.service = LocalCacheService(lambda: self.now)
+        self.manager = ContextCacheManager(
+            self.service,
+            ttl_seconds=600,
+            refresh_margin_seconds=60,
+            min_tokens=10,
+            clock=lambda: self.now,
+        )
+
+    def test_prefix_is_created_once_and_reused(self):
+        first = self.manager.get("gemini", "dc", "fp1", PREFIX)
+        second = self.manager.get("gemini", "dc", "fp1", PREFIX)
+        self.assertEqual(first, second)
+        self.assertEqual(self.service.created, 1)
+        self.assertEqual(self.service.caches[first]["contents"], PREFIX)
+        self.assertEqual(self.manager.stats()["hits"], 1)
+        # Another template gets its own cache.
+        self.assertNotEqual(self.manager.get("gemini", "qp", "fp1", PREFIX), first)
+
+    def test_cache_is_refreshed_near_expiry_and_recreated_after(self):
+        name = self.manager.get("gemini", "dc", "fp1", PREFIX)
+        self.now += 570  # Within the refresh margin.
+        self.assertEqual(self.manager.get("gemini", "dc", "fp1", PREFIX), name)
+        self.assertEqual(self.service.caches[name]["expires"], self.now + 600)
+        self.assertEqual(self.manager.stats()["refreshes"], 1)
+
+        self.now += 601  # Expired.
+        self.assertEqual(self.manager.expire(), 1)
+        self.assertNotIn(name, self.service.caches)
+        self.assertNotEqual(self.manager.get("gemini", "dc", "fp1", PREFIX), name)
+
+    def test_new_schema_fingerprint_replaces_old_cache(self):
+        old = self.manager.get("gemini", "dc", "fp1", PREFIX)
+        new = self.manager.get("gemini", "dc", "fp2", PREFIX + "new table")
+        self.assertNotEqual(old, new)
+        # Calls still using the old cache can finish before it is deleted.
+        self.assertEqual(sorted(self.service.caches), [old, new])
+        self.assertEqual(self.manager.stats()["retired"], 1)
+        self.now += 301
+        self.assertEqual(self.manager.expire(), 1)
+        self.assertEqual(list(self.service.caches), [new])
+
+    def test_remote_calls_run_outside_the_lock(self):
+        started, release = threading.Event(), threading.Event()
+        create = self.service.create
+
+        def slow_create(model, contents, ttl_seconds):
+            if contents == PREFIX:
+                started.set()
+                release.wait(5)
+            return create(model, contents, ttl_seconds)
+
+        self.service.create = slow_create
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            first = executor.submit(self.manager.get, "gemini", "dc", "fp1", PREFIX)
+            self.assertTrue(started.wait(5))
+            same = executor.submit(self.manager.get, "gemini", "dc", "fp1", PREFIX)
+            # Another prefix is not held up by the creation in flight.
+            other = self.manager.get("gemini", "qp", "fp1", PREFIX + "other")
+            self.assertIsNotNone(other)
+            self.assertFalse(first.done())
+            release.set()
+            self.assertEqual(first.result(5), same.result(5))
+        self.assertEqual(self.service.created, 2)
+
+    def test_short_prefixes_and_service_errors_fall_back_to_uncached(self):
+        self.assertIsNone(self.manager.get("gemini", "dc", "fp1", "short"))
+        self.service.fail_create = True
+        self.assertIsNone(self.manager.get("gemini", "dc", "fp1", PREFIX))
+        stats = self.manager.stats()
+        self.assertEqual((stats["skipped"], stats["errors"], stats["live"]), (1, 1, 0))
+
+
+class TestChaseNl2sql(unittest.TestCase):
+    """Test cases for the CHASE-SQL `initial_bq_nl2sql`."""
+
+    def test_cache_and_model_calls_run_off_the_event_loop(self):
+        threads = {}
+
+        def record(name, result):
+            def call(*args, **kwargs):
+                threads[name] = threading.get_ident()
+                return result
+
+            return call
+
+        model = SimpleNamespace(
+            model_name="gemini-test",
+            call_parallel=record("call_parallel", ["SELECT 1"]),
+        )
+        settings = {
+            **chase_sql_constants_dict,
+            "transpile_to_bigquery": False,
+            "bq_ddl_schema": "CREATE TABLE t (a INT64);",
+            "bq_project_id": "proj",
+            "bq_dataset_id": "ds",
+        }
+
+        async def run():
+            with mock.patch.object(
+                chase_db_tools.state_manager, "load", mock.AsyncMock(return_value=settings)
+            ), mock.patch.object(
+                chase_db_tools, "get_gemini_model", return_value=model
+            ), mock.patch.object(
+                chase_db_tools,
+                "cache_static_prefix",
+                record("cache_static_prefix", ("", "prompt", None)),
+            ):
+                sql = await chase_db_tools.initial_bq_nl2sql("question", None)
+            return sql, threading.get_ident()
+
+        sql, loop_thread = asyncio.run(run())
+        self.assertEqual(sql, "SELECT 1")
+        self.assertEqual(set(threads), {"cache_static_prefix", "call_parallel"})
+        self.assertNotIn(loop_thread, threads.values())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+#
+
+"""Test cases for the bulk BigQuery loader, against a local client stand-in."""
+
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from data_science.utils.create_bq_table import (
+    STICKER_SALES_SCHEMA,
+    LoadSpec,
+    bulk_load,
+    csv_to_parquet,
+)
+
+
+class _Job:
+    def __init__(self, output_rows):
+        self.output_rows = output_rows
+
+    def result(self):
+        return self
+
+
+class FakeBigQueryClient:
+    """Records tables and the Parquet chunks loaded into them."""
+
+    def __init__(self, fail_table=None):
+        self.fail_table = fail_table
+        self.tables = {}
+        self.loaded = {}
+        self.source_formats = set()
+        self._lock = threading.Lock()
+
+    def delete_table(self, table_id, not_found_ok=False):
+        with self._lock:
+            self.tables.pop(table_id, None)
+            self.loaded.pop(table_id, None)
+
+    def create_table(self, table):
+        with self._lock:
+            self.tables[f"{table.project}.{table.dataset_id}.{table.table_id}"] = [
+                (f.name, f.field_type) for f in table.schema
+            ]
+
+    def copy_table(self, source, destination, job_config=None):
+        assert job_config.write_disposition == "WRITE_TRUNCATE"
+        with self._lock:
+            self.tables[destination] = self.tables[source]
+            self.loaded[destination] = list(self.loaded.get(source, []))
+        return _Job(None)
+
+    def load_table_from_file(self, source_file, table_id, job_config=None):
+        if f".{self.fail_table}__staging" in table_id:
+            raise ConnectionError("upload interrupted")
+        rows = pq.read_table(source_file).to_pylist()
+        with self._lock:
+            self.source_formats.add(job_config.source_format)
+            self.loaded.setdefault(table_id, []).extend(rows)
+        return _Job(len(rows))
+
+
+def _write_csv(path, rows, with_sales=True):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("id,date,country,store,product")
+        f.write(",num_sold\n" if with_sales else "\n")
+        for i in range(rows):
+            line = f"{i},2017-01-{i % 28 + 1:02d},Canada,Store {i % 3},Sticker"
+            if with_sales:
+                line += "," if i % 10 == 0 else f",{i * 2}.0"
+            f.write(line + "\n")
+
+
+class TestBulkLoad(unittest.TestCase):
+    """Test cases for bulk_load."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.train = os.path.join(self.tmp.name, "train.csv")
+        self.test = os.path.join(self.tmp.name, "test.csv")
+        _write_csv(self.train, 250)
+        _write_csv(self.test, 40, with_sales=False)
+        self.specs = [
+            LoadSpec("train", self.train, STICKER_SALES_SCHEMA["train"]),
+            LoadSpec("test", self.test, STICKER_SALES_SCHEMA["test"]),
+        ]
+
+    def test_csv_is_split_into_typed_parquet_chunks(self):
+        chunks = csv_to_parquet(
+            self.train, self.tmp.name, STICKER_SALES_SCHEMA["train"], chunk_rows=100
+        )
+        self.assertEqual([rows for _, rows in chunks], [100, 100, 50])
+        table = pq.read_table(chunks[0][0])
+        self.assertEqual(str(table.schema.field("date").type), "date32[day]")
+        first = table.slice(0, 1).to_pylist()[0]
+        self.assertEqual(first["date"], datetime.date(2017, 1, 1))
+        self.assertIsNone(first["num_sold"])
+
+    def test_loads_all_files_with_explicit_schema(self):
+        client = FakeBigQueryClient()
+        reports = bulk_load(client, "proj", "ds", self.specs, chunk_rows=100)
+
+        self.assertEqual([r.rows for r in reports], [250, 40])
+        self.assertEqual([r.chunks for r in reports], [3, 1])
+        self.assertEqual(
+            sorted(row["id"] for row in client.loaded["proj.ds.train"]),
+            list(range(250)),
+        )
+        sold = {row["id"]: row["num_sold"] for row in client.loaded["proj.ds.train"]}
+        self.assertEqual(sold[1], 2.0)
+        self.assertEqual(client.tables["proj.ds.test"], STICKER_SALES_SCHEMA["test"])
+        # The staging tables are gone once swapped in.
+        self.assertEqual(sorted(client.tables), ["proj.ds.test", "proj.ds.train"])
+        self.assertEqual(client.source_formats, {"PARQUET"})
+        self.assertTrue(all(r.throughput_mb_s > 0 and not r.errors for r in reports))
+
+    def test_failed_table_does_not_stop_other_loads(self):
+        client = FakeBigQueryClient(fail_table="train")
+        client.tables["proj.ds.train"] = STICKER_SALES_SCHEMA["train"]
+        client.loaded["proj.ds.train"] = [{"id": -1}]
+        reports = bulk_load(client, "proj", "ds", self.specs, chunk_rows=100)
+
+        self.assertEqual(len(reports[0].errors), 3)
+        self.assertEqual(reports[1].rows, 40)
+        self.assertEqual(reports[1].errors, [])
+        # The failed table keeps its previous contents.
+        self.assertEqual(client.loaded["proj.ds.train"], [{"id": -1}])
+        self.assertEqual(sorted(client.tables), ["proj.ds.test", "proj.ds.train"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+#
+
+"""Test cases for compacting the conversation history sent to the model."""
+
+import asyncio
+import json
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from google.adk.agents import LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.artifacts import InMemoryArtifactService
+from google.adk.models import LlmRequest
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from data_science.utils.history_compaction import HistoryCompactor, request_tokens
+
+ROWS = [{"country": f"country {i}", "num_sold": i * 10} for i in range(300)]
+REPORT = "The sales report. " + "Sales grew in every country. " * 400
+
+
+def turn(i, tool, output):
+    return [
+        types.Content(role="user", parts=[types.Part(text=f"question {i}")]),
+        types.Content(
+            role="model",
+            parts=[types.Part.from_function_call(name=tool, args={"question": f"q{i}"})],
+        ),
+        types.Content(
+            role="user",
+            parts=[
+                types.Part(
+                    function_response=types.FunctionResponse(
+                        id=f"call-{i}", name=tool, response=output
+                    )
+                )
+            ],
+        ),
+        types.Content(role="model", parts=[types.Part(text=f"answer {i}")]),
+    ]
+
+
+class TestHistoryCompactor(unittest.TestCase):
+    """Test cases for `HistoryCompactor`."""
+
+    def setUp(self):
+        sessions = InMemorySessionService()
+        session = asyncio.run(sessions.create_session(app_name="app", user_id="user"))
+        self.artifacts = InMemoryArtifactService()
+        self.context = CallbackContext(
+            InvocationContext(
+                session_service=sessions,
+                artifact_service=self.artifacts,
+                invocation_id="invocation",
+                agent=LlmAgent(name="root", model="gemini-2.0-flash"),
+                session=session,
+            )
+        )
+        self.contents = (
+            turn(1, "fetch_result_page", {"result_id": "job_1", "total_rows": 300, "rows": ROWS})
+            + turn(2, "call_rs_agent", {"result": REPORT})
+            + turn(3, "call_rs_agent", {"result": REPORT})
+            + [types.Content(role="user", parts=[types.Part(text="question 4")])]
+        )
+
+    def compact(self, compactor):
+        request = LlmRequest(contents=self.contents)
+        report = asyncio.run(compactor.compact(self.context, request))
+        return request, report
+
+    def test_old_outputs_are_summarized_within_budget(self):
+        before = request_tokens(LlmRequest(contents=self.contents))
+        request, report = self.compact(HistoryCompactor(budget=before // 2))
+
+        self.assertEqual(report["tokens_before"], before)
+        self.assertLessEqual(report["tokens_after"], before // 2)
+        self.assertEqual(report["tokens_after"], request_tokens(request))
+        self.assertEqual(report["compacted_outputs"], 2)
+
+        page = request.contents[2].parts[0].function_response.response
+        self.assertTrue(page["compacted"])
+        self.assertEqual(page["result_id"], "job_1")
+        self.assertIn("fetch_result_page", page["reference"])
+        report_summary = request.contents[6].parts[0].function_response.response
+        self.assertIn("tool_output_call-2.json", report_summary["reference"])
+        saved = asyncio.run(self.context.load_artifact("tool_output_call-2.json"))
+        self.assertEqual(json.loads(saved.inline_data.data), {"result": REPORT})
+
+        # The previous turn is kept as is.
+        latest = request.contents[10].parts[0].function_response.response
+        self.assertEqual(latest, {"result": REPORT})
+
+    def test_requests_within_budget_are_unchanged(self):
+        request, report = self.compact(HistoryCompactor(budget=10**6))
+        self.assertEqual(report["compacted_outputs"], 0)
+        self.assertEqual(report["tokens_after"], report["tokens_before"])
+        self.assertEqual(request.contents, self.contents)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+#
+
+"""Test cases for the local intent routing of root agent questions."""
+
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from google.adk.agents import LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.models import LlmRequest
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from data_science.utils.intent_router import (
+    AGENT,
+    SCHEMA,
+    SQL,
+    IntentRouter,
+    classify,
+    schema_tables,
+)
+
+DDL = """CREATE OR REPLACE TABLE `project.forecasting_sticker_sales.train` (
+  `id` INTEGER,
+  `date` DATE,
+  `country` STRING,
+  `store` STRING,
+  `product` STRING,
+  `num_sold` FLOAT
+);
+
+-- Example values for table `project.forecasting_sticker_sales.train`:
+INSERT INTO `project.forecasting_sticker_sales.train` VALUES
+(1,'2010-01-01','Canada','Discount Stickers','Kaggle',973.0);
+
+CREATE OR REPLACE TABLE `project.forecasting_sticker_sales.test` (
+  `id` INTEGER,
+  `date` DATE,
+  `country` STRING
+);
+
+"""
+DB_SETTINGS = {
+    "bq_ddl_schema": DDL,
+    "bq_schema_fingerprint": "fingerprint",
+    "bq_column_profile": {"project.forecasting_sticker_sales.train": {"rows": 230130}},
+}
+
+
+class TestIntentRouter(unittest.TestCase):
+    """Test cases for `classify` and `IntentRouter`."""
+
+    def setUp(self):
+        self.tables = schema_tables(DB_SETTINGS)
+        sessions = InMemorySessionService()
+        session = asyncio.run(
+            sessions.create_session(
+                app_name="app", user_id="user", state={"database_settings": DB_SETTINGS}
+            )
+        )
+        self.context = CallbackContext(
+            InvocationContext(
+                session_service=sessions,
+                invocation_id="invocation",
+                agent=LlmAgent(name="root", model="gemini-2.0-flash"),
+                session=session,
+            )
+        )
+
+    def test_schema_tables(self):
+        train, test = self.tables
+        self.assertEqual(train.name, "train")
+        self.assertEqual(train.rows, 230130)
+        self.assertEqual(train.columns[-1], ("num_sold", "FLOAT"))
+        self.assertEqual([c for c, _ in test.columns], ["id", "date", "country"])
+        self.assertIsNone(test.rows)
+
+    def test_classify(self):
+        cases = {
+            "What tables do you have?": SCHEMA,
+            "Which columns are in the test table?": SCHEMA,
+            "What data do you have access to?": SCHEMA,
+            "How many columns does train have?": SCHEMA,
+            "Show me the data in the test table": SQL,
+            "Show me the train table": SQL,
+            "Show me a sample of the records in train": SQL,
+            "Which columns have null values in train?": AGENT,
+            "How many rows are in train?": SQL,
+            "Top 5 countries by num sold": SQL,
+            "What are the unique countries in the test table?": SQL,
+            "Which product has the most sales?": SQL,
+            "Plot the sales by country": AGENT,
+            "Show me those by store": AGENT,
+            "Train a model to forecast num_sold": AGENT,
+            "Which table has the most rows?": AGENT,
+            "Hello!": AGENT,
+        }
+        for question, kind in cases.items():
+            with self.subTest(question=question):
+                self.assertEqual(classify(question, self.tables).kind, kind)
+
+    def route(self, router, *contents):
+        request = LlmRequest(contents=list(contents))
+        return asyncio.run(router.route(self.context, request))
+
+    def test_route(self):
+        router = IntentRouter(enabled=True)
+        ask = lambda text: types.Content(role="user", parts=[types.Part(text=text)])
+
+        response = self.route(router, ask("What columns does the test table have?"))
+        text = response.content.parts[0].text
+        self.assertIn("`country` STRING", text)
+        self.assertNotIn("num_sold", text)
+
+        question = "How many rows are in train?"
+        response = self.route(router, ask(question))
+        call = response.content.parts[0].function_call
+        self.assertEqual((call.name, call.args), ("call_db_agent", {"question": question}))
+
+        self.assertIsNone(self.route(router, ask("Plot the sales by country")))
+        # Later model calls of a turn are never routed.
+        tool_output = types.Content(
+            role="user",
+            parts=[
+                types.Part(
+                    function_response=types.FunctionResponse(
+                        name="call_db_agent", response={"result": "42"}
+                    )
+                )
+            ],
+        )
+        self.assertIsNone(self.route(router, ask(question), tool_output))
+        self.assertEqual(router.stats(), {SCHEMA: 1, SQL: 1, AGENT: 1})
+        self.assertIsNone(self.route(IntentRouter(enabled=False), ask(question)))
+
+
+if __name__ == "__main__":
+    unittest.main()
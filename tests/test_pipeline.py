@@ -0,0 +1,72 @@
+#
+
+"""Test cases for the DAG pipeline executor."""
+
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from data_science.utils.pipeline import PipelineExecutor, PipelineStage
+
+
+def _sleeper(name, delay):
+    async def run(*inputs):
+        await asyncio.sleep(delay)
+        return (name, inputs)
+
+    return run
+
+
+class TestPipelineExecutor(unittest.TestCase):
+    """Test cases for PipelineExecutor."""
+
+    def test_independent_stages_run_concurrently(self):
+        stages = [
+            PipelineStage("db", _sleeper("db", 0.05)),
+            PipelineStage("da", _sleeper("da", 0.2), inputs=("db",)),
+            PipelineStage("rs", _sleeper("rs", 0.2), inputs=("db",)),
+        ]
+        result = asyncio.run(PipelineExecutor(stages).run())
+
+        self.assertEqual(result.outputs["rs"], ("rs", (("db", ()),)))
+        # da and rs overlap, so the run takes ~0.25s rather than ~0.45s.
+        self.assertLess(result.total, 0.4)
+        self.assertLess(result.timings["da"].start, result.timings["rs"].end)
+        self.assertEqual(result.critical_path()[0], "db")
+        self.assertEqual(len(result.to_dict()["stages"]), 3)
+
+    def test_failure_skips_dependents(self):
+        calls = []
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def dependent(_):
+            calls.append("da")
+
+        stages = [
+            PipelineStage("db", fail),
+            PipelineStage("da", dependent, inputs=("db",)),
+        ]
+        with self.assertRaises(RuntimeError):
+            asyncio.run(PipelineExecutor(stages).run())
+        self.assertEqual(calls, [])
+
+    def test_rejects_cycles_and_unknown_inputs(self):
+        noop = _sleeper("x", 0)
+        with self.assertRaises(ValueError):
+            PipelineExecutor(
+                [
+                    PipelineStage("a", noop, inputs=("b",)),
+                    PipelineStage("b", noop, inputs=("a",)),
+                ]
+            )
+        with self.assertRaises(ValueError):
+            PipelineExecutor([PipelineStage("a", noop, inputs=("missing",))])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+#
+
+"""Test cases for the token-budgeted prompt builder."""
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from data_science.utils.prompt_budget import (
+    SCHEMA_REDUCERS,
+    PromptBuilder,
+    analysis_prompt,
+    estimate_tokens,
+    split_schema,
+    truncate_text,
+)
+
+
+def _table(name, columns, rows=5):
+    ddl = f"CREATE OR REPLACE TABLE `proj.ds.{name}` (\n"
+    ddl += ",\n".join(f"  `{c}` STRING" for c in columns) + "\n);\n\n"
+    ddl += f"-- Example values for table `proj.ds.{name}`:\n"
+    for i in range(rows):
+        values = ",".join(f"'{c} value number {i} " + "x" * 40 + "'" for c in columns)
+        ddl += f"INSERT INTO `proj.ds.{name}` VALUES\n({values});\n\n"
+    return ddl
+
+
+SCHEMA = (
+    _table("orders", ["order_id", "country", "amount"])
+    + _table("stores", ["store_id", "city"])
+    + _table("weather", ["day", "temperature", "rain"])
+)
+TEMPLATE = "Schema:\n{SCHEMA}\nQuestion: {QUESTION}\n"
+
+
+class TestPromptBuilder(unittest.TestCase):
+    """Test cases for PromptBuilder and its reducers."""
+
+    def test_prompt_within_budget_is_unchanged(self):
+        prompt = PromptBuilder("test", TEMPLATE, SCHEMA_REDUCERS).build(
+            budget=100_000, SCHEMA=SCHEMA, QUESTION="How many orders?"
+        )
+        self.assertEqual(prompt.text, TEMPLATE.format(SCHEMA=SCHEMA, QUESTION="How many orders?"))
+        self.assertEqual(prompt.reductions, [])
+        self.assertEqual(prompt.tokens, estimate_tokens(prompt.text))
+
+    def test_sample_rows_are_dropped_before_tables(self):
+        full = estimate_tokens(SCHEMA)
+        prompt = PromptBuilder("test", TEMPLATE, SCHEMA_REDUCERS).build(
+            budget=full // 2, SCHEMA=SCHEMA, QUESTION="Total amount per country?"
+        )
+        self.assertTrue(prompt.within_budget)
+        self.assertTrue(prompt.reductions[0].startswith("sample_row_levels"))
+        self.assertEqual(prompt.text.count("CREATE OR REPLACE TABLE"), 3)
+        self.assertLess(prompt.text.count("INSERT INTO"), 15)
+
+    def test_least_relevant_tables_are_pruned(self):
+        no_rows = "".join(
+            t.split("-- Example values")[0] for t in split_schema(SCHEMA)
+        )
+        prompt = PromptBuilder("test", TEMPLATE, SCHEMA_REDUCERS).build(
+            budget=estimate_tokens(no_rows) - 5,
+            SCHEMA=SCHEMA,
+            QUESTION="What is the rain and temperature per day?",
+        )
+        self.assertTrue(prompt.within_budget)
+        self.assertIn("proj.ds.weather", prompt.text)
+        self.assertNotIn("INSERT INTO", prompt.text)
+        self.assertLess(prompt.text.count("CREATE OR REPLACE TABLE"), 3)
+
+    def test_large_results_are_summarized(self):
+        rows = [{"country": f"c{i % 7}", "amount": i} for i in range(2000)]
+        prompt = analysis_prompt("Which country sells most?", rows, "Data:")
+        self.assertLessEqual(prompt.tokens, 16_000)
+        self.assertIn("2000 rows in total.", prompt.text)
+        self.assertIn('"max": 1999', prompt.text)
+
+    def test_truncate_text_keeps_head_and_tail(self):
+        text = "head " + "filler " * 1000 + "tail"
+        cut = truncate_text(text, 50)
+        self.assertLessEqual(estimate_tokens(cut), 50)
+        self.assertTrue(cut.startswith("head") and cut.endswith("tail"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+#
+
+"""Test cases for handing query results to the analysis kernel as Arrow files."""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from data_science.utils import result_files
+from data_science.utils.result_files import (
+    SCOPE_KEY,
+    ResultFile,
+    describe_result_file,
+    is_readable,
+    open_result,
+    read_result_file,
+    result_scope,
+    write_result_file,
+)
+
+ROWS = [{"country": f"c{i % 3}", "amount": i, "day": "2024-01-01"} for i in range(1000)]
+
+
+class TestResultFiles(unittest.TestCase):
+    """Test cases for result files."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.dict(os.environ, {"RESULT_FILES_DIR": directory.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_round_trip_through_state(self):
+        written = write_result_file(ROWS)
+        result = ResultFile.from_state(written.to_state())
+        self.assertEqual(result, written)
+        self.assertEqual(read_result_file(result.path).to_pylist(), ROWS)
+        self.assertEqual(
+            result.columns, [("country", "string"), ("amount", "int64"), ("day", "string")]
+        )
+
+    def test_description_carries_schema_and_head_only(self):
+        description = describe_result_file(write_result_file(ROWS, head_rows=3))
+        self.assertIn("(1000 rows)", description)
+        self.assertIn("as the pandas DataFrame `df`", description)
+        self.assertIn("  - amount: int64", description)
+        self.assertEqual(description.count('"country"'), 3)
+
+    def test_old_files_are_removed_per_session(self):
+        other = write_result_file(ROWS[:1], scope="other").path
+        with mock.patch.object(result_files, "MAX_RESULT_FILES", 2):
+            paths = [write_result_file(ROWS[:1], scope="s1").path for _ in range(4)]
+        self.assertEqual([os.path.exists(p) for p in paths].count(True), 2)
+        self.assertTrue(os.path.exists(paths[-1]))
+        # Another session's results are not pruned.
+        self.assertTrue(os.path.exists(other))
+
+    def test_results_are_read_only_from_their_session(self):
+        state = {}
+        written = write_result_file(ROWS, result_id="job_1", scope=result_scope(state))
+        self.assertEqual(written.scope, state[SCOPE_KEY])
+        self.assertEqual(open_result("job_1", written.scope).num_rows, 1000)
+        with self.assertRaises(KeyError):
+            open_result("job_1", result_scope({}))
+        with self.assertRaises(ValueError):
+            open_result("job_1", "../" + written.scope)
+
+    def test_idle_sessions_expire(self):
+        old = write_result_file(ROWS[:1], scope="old")
+        self.assertTrue(is_readable(old))
+        two_hours_ago = time.time() - 7200
+        os.utime(os.path.dirname(old.path), (two_hours_ago, two_hours_ago))
+        with mock.patch.dict(os.environ, {"RESULT_FILES_TTL_SECONDS": "3600"}):
+            new = write_result_file(ROWS[:1], scope="new")
+        self.assertFalse(is_readable(old))
+        self.assertFalse(os.path.exists(os.path.dirname(old.path)))
+        self.assertTrue(is_readable(new))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+#
+
+"""Test cases for the SQLite session service."""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+from decimal import Decimal
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events import Event, EventActions
+from google.genai import types
+
+from data_science.utils.session_store import (
+    RetentionPolicy,
+    SqliteSessionService,
+    decode_event,
+    encode_event,
+)
+
+
+def make_event(text, delta=None, timestamp=None):
+    return Event(
+        invocation_id="invocation",
+        author="db_ds_multiagent",
+        content=types.Content(role="model", parts=[types.Part(text=text)]),
+        actions=EventActions(state_delta=delta or {}),
+        timestamp=timestamp or time.time(),
+    )
+
+
+class TestSqliteSessionService(unittest.TestCase):
+    """Test cases for `SqliteSessionService`."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "sessions.db")
+
+    def service(self, **kwargs):
+        service = SqliteSessionService(self.path, **kwargs)
+        self.addCleanup(service.close)
+        return service
+
+    def test_sessions_survive_a_restart(self):
+        async def run():
+            service = self.service()
+            session = await service.create_session(
+                app_name="app", user_id="u", state={"a": 1, "app:x": 2, "temp:t": 3}
+            )
+            await service.append_event(
+                session, make_event("one", {"a": 4, "user:pref": "bar", "temp:t": 5})
+            )
+            await service.append_event(session, make_event("two" * 500, {"b": [1, 2]}))
+            with self.assertRaises(AlreadyExistsError):
+                await service.create_session(app_name="app", user_id="u", session_id=session.id)
+            service.close()
+
+            loaded = await self.service().get_session(
+                app_name="app", user_id="u", session_id=session.id
+            )
+            self.assertEqual(
+                loaded.state, {"a": 4, "b": [1, 2], "app:x": 2, "user:pref": "bar"}
+            )
+            self.assertEqual(
+                [e.content.parts[0].text for e in loaded.events], ["one", "two" * 500]
+            )
+            self.assertNotIn("temp:t", loaded.events[0].actions.state_delta)
+
+        asyncio.run(run())
+
+    def test_state_without_a_json_type_is_stored_like_the_event(self):
+        async def run():
+            service = self.service()
+            session = await service.create_session(app_name="app", user_id="u")
+            event = make_event(
+                "one", {"query_result": [{"total": Decimal("1.50")}], "blob": b"\xff\x00"}
+            )
+            await service.append_event(session, event)
+            service.close()
+            return event, await self.service().get_session(
+                app_name="app", user_id="u", session_id=session.id
+            )
+
+        event, loaded = asyncio.run(run())
+        self.assertEqual(
+            loaded.state, {"query_result": [{"total": "1.50"}], "blob": "_wA="}
+        )
+        self.assertEqual(
+            loaded.events[0].actions.state_delta,
+            decode_event(encode_event(event)).actions.state_delta,
+        )
+
+    def test_events_round_trip_compressed(self):
+        event = make_event("x" * 5000, {"query_result": [{"a": 1}] * 100})
+        data = encode_event(event)
+        self.assertEqual(data[:1], b"z")
+        self.assertLess(len(data), 1000)
+        self.assertEqual(decode_event(data), event)
+
+    def test_retention_policy(self):
+        now = [1000.0]
+
+        async def run():
+            service = self.service(
+                retention=RetentionPolicy(
+                    max_events_per_session=2,
+                    session_ttl_seconds=100,
+                    compact_interval_seconds=None,
+                ),
+                clock=lambda: now[0],
+            )
+            active = await service.create_session(app_name="app", user_id="u")
+            idle = await service.create_session(app_name="app", user_id="u")
+            await service.append_event(idle, make_event("old", {"k": 0}, timestamp=850))
+            for i in range(5):
+                await service.append_event(
+                    active, make_event(str(i), {"k": i}, timestamp=990 + i)
+                )
+
+            self.assertEqual(await service.compact(), {"sessions": 1, "events": 3})
+            session = await service.get_session(
+                app_name="app", user_id="u", session_id=active.id
+            )
+            self.assertEqual([e.content.parts[0].text for e in session.events], ["3", "4"])
+            self.assertEqual(session.state, {"k": 4})
+            sessions = (await service.list_sessions(app_name="app", user_id="u")).sessions
+            self.assertEqual([s.id for s in sessions], [active.id])
+
+        asyncio.run(run())
+
+    def test_concurrent_appends_share_commits(self):
+        async def run():
+            service = self.service()
+            sessions = await asyncio.gather(
+                *(service.create_session(app_name="app", user_id=f"u{i}") for i in range(200))
+            )
+            await asyncio.gather(
+                *(service.append_event(s, make_event("hi", {"n": 1})) for s in sessions)
+            )
+            stats = service.stats()
+            self.assertEqual(stats["appends"], 200)
+            self.assertLess(stats["commits"], 400)
+            session = await service.get_session(
+                app_name="app", user_id="u7", session_id=sessions[7].id
+            )
+            self.assertEqual(session.state, {"n": 1})
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
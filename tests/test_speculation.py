@@ -0,0 +1,123 @@
+#
+
+"""Test cases for speculative NL2SQL ahead of the root agent."""
+
+import asyncio
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from google.adk.models import LlmRequest
+from google.genai import types
+
+from data_science.sub_agents.bigquery import speculation as speculation_module
+from data_science.sub_agents.bigquery import tools
+from data_science.sub_agents.bigquery.speculation import (
+    SpeculativeSql,
+    question_similarity,
+    use_speculative_sql,
+)
+from tests.test_intent_router import DB_SETTINGS
+
+QUESTION = "What is the total num_sold per country in train?"
+
+
+def fake_generate(question, _ddl_schema):
+    if "broken" in question:
+        return {"sql": "SELECT nope", "error": "Unrecognized name: nope"}
+    return {"sql": f"SELECT 1 -- {question}", "error": None}
+
+
+class TestSpeculativeSql(unittest.TestCase):
+    """Test cases for `SpeculativeSql`."""
+
+    def test_question_similarity(self):
+        self.assertEqual(question_similarity(QUESTION, QUESTION.upper() + "!"), 1.0)
+        self.assertGreater(
+            question_similarity(QUESTION, "Total num_sold per country in train"), 0.8
+        )
+        self.assertLess(
+            question_similarity(QUESTION, "Plot the monthly trend of sales"), 0.5
+        )
+
+    def test_claims(self):
+        speculation = SpeculativeSql(enabled=True, generate=fake_generate)
+
+        async def run():
+            speculation.start("i1", QUESTION, "ddl")
+            reused = await speculation.claim("i1", "total num_sold per country in train")
+            # A speculation is claimed once.
+            again = await speculation.claim("i1", QUESTION)
+
+            speculation.start("i2", QUESTION, "ddl")
+            mismatched = await speculation.claim("i2", "How many stores are there?")
+
+            speculation.start("i3", "broken " + QUESTION, "ddl")
+            invalid = await speculation.claim("i3", "broken " + QUESTION)
+            return reused, again, mismatched, invalid
+
+        reused, again, mismatched, invalid = asyncio.run(run())
+        self.assertEqual(reused, f"SELECT 1 -- {QUESTION}")
+        self.assertEqual((again, mismatched, invalid), (None, None, None))
+        stats = speculation.stats()
+        self.assertEqual(
+            (stats["started"], stats["reused"], stats["mismatched"], stats["invalid"]),
+            (3, 1, 1, 1),
+        )
+
+    def test_unclaimed_speculation_is_discarded(self):
+        speculation = SpeculativeSql(enabled=True, generate=fake_generate)
+
+        async def run():
+            task = speculation.start("i1", QUESTION, "ddl").task
+            speculation.discard("i1")
+            await asyncio.sleep(0)
+            return task, await speculation.claim("i1", QUESTION)
+
+        task, claimed = asyncio.run(run())
+        self.assertTrue(task.cancelled())
+        self.assertIsNone(claimed)
+        self.assertEqual(speculation.stats()["unclaimed"], 1)
+
+    def test_only_baseline_nl2sql_is_speculated_on(self):
+        callback_context = SimpleNamespace(
+            invocation_id="i1", state={"database_settings": DB_SETTINGS}
+        )
+        llm_request = LlmRequest(
+            contents=[types.Content(role="user", parts=[types.Part(text=QUESTION)])]
+        )
+        started = {}
+        for method in ("CHASE", "BASELINE"):
+            with mock.patch.object(
+                speculation_module.speculative_sql, "enabled", True
+            ), mock.patch.dict(os.environ, {"NL2SQL_METHOD": method}), mock.patch.object(
+                speculation_module.speculative_sql, "start"
+            ) as start:
+                asyncio.run(
+                    speculation_module.speculate_sql(callback_context, llm_request)
+                )
+            started[method] = start.called
+        self.assertEqual(started, {"CHASE": False, "BASELINE": True})
+
+    def test_initial_nl2sql_uses_the_claimed_sql_once(self):
+        tool_context = SimpleNamespace(state={})
+
+        async def run():
+            with use_speculative_sql("SELECT 1"):
+                first = await tools.initial_bq_nl2sql(QUESTION, tool_context)
+                with mock.patch.object(
+                    tools.state_manager, "load", return_value={"bq_ddl_schema": "ddl"}
+                ), mock.patch.object(tools, "generate_sql", return_value="SELECT 2"):
+                    second = await tools.initial_bq_nl2sql(QUESTION, tool_context)
+            return first, second
+
+        self.assertEqual(asyncio.run(run()), ("SELECT 1", "SELECT 2"))
+        self.assertEqual(tool_context.state["sql_query"], "SELECT 2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+#
+
+"""Test cases for the AST-based SQL safety check."""
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from data_science.sub_agents.bigquery.sql_safety import check_sql
+
+
+class TestCheckSql(unittest.TestCase):
+    """Test cases for check_sql."""
+
+    def test_identifiers_that_look_like_keywords_are_allowed(self):
+        check = check_sql(
+            "SELECT last_updated, created_at, is_deleted FROM `p.d.t`"
+            " WHERE description = 'drop shipping'",
+            80,
+        )
+        self.assertTrue(check.allowed)
+        self.assertEqual(check.statement_type, "query")
+
+    def test_writes_and_scripts_are_rejected(self):
+        cases = {
+            "UPDATE `p.d.t` SET a = 1 WHERE TRUE": "dml",
+            "MERGE `p.d.t` t USING `p.d.s` s ON t.id = s.id WHEN MATCHED THEN DELETE": "dml",
+            "CREATE TABLE `p.d.x` AS SELECT 1 AS a": "ddl",
+            "DROP TABLE `p.d.t`": "ddl",
+            "TRUNCATE TABLE `p.d.t`": "ddl",
+            "SELECT 1; DROP TABLE `p.d.t`": "multiple",
+            "EXPORT DATA OPTIONS(uri='gs://b/*.csv') AS SELECT 1": "other",
+        }
+        for sql, statement_type in cases.items():
+            check = check_sql(sql, 80)
+            self.assertFalse(check.allowed, sql)
+            self.assertEqual(check.statement_type, statement_type, sql)
+            self.assertTrue(check.reason)
+
+    def test_limit_is_injected_on_the_outermost_query_only(self):
+        sql = (
+            "WITH top AS (SELECT store FROM `p.d.t` LIMIT 5)\n"
+            "SELECT * FROM top ORDER BY store -- stores;"
+        )
+        check = check_sql(sql, 80)
+        self.assertEqual(check.limit_action, "injected")
+        self.assertTrue(check.sql.startswith(sql.rstrip(";")))
+        self.assertTrue(check.sql.endswith("\nLIMIT 80"))
+
+        union = check_sql("SELECT 1 AS a UNION ALL SELECT 2 AS a", 80)
+        self.assertTrue(union.sql.endswith("LIMIT 80"))
+
+    def test_trailing_semicolon_and_comment_are_one_statement(self):
+        for sql in ["SELECT 1;\n-- done", "SELECT 1; /* done */", "SELECT 1;;"]:
+            with self.subTest(sql=sql):
+                check = check_sql(sql, 80)
+                self.assertTrue(check.allowed, check.reason)
+                self.assertEqual(check.sql.count(";"), 0)
+                self.assertTrue(check.sql.endswith("\nLIMIT 80"))
+
+    def test_large_limits_are_clamped_and_small_ones_kept(self):
+        clamped = check_sql("SELECT a FROM `p.d.t` ORDER BY a LIMIT 100000", 80)
+        self.assertEqual(clamped.limit_action, "clamped")
+        self.assertIn("LIMIT 80", clamped.sql)
+        self.assertNotIn("100000", clamped.sql)
+
+        kept = check_sql("select a from `p.d.t` limit 10", 80)
+        self.assertIsNone(kept.limit_action)
+        self.assertEqual(kept.sql, "select a from `p.d.t` limit 10")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+#
+
+"""Test cases for the local pre-validation of SQL against the schema."""
+
+import asyncio
+import os
+import sys
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from data_science.sub_agents.bigquery import tools
+from data_science.sub_agents.bigquery.sql_validation import SqlAttempts, validate_sql
+from data_science.utils.intent_router import schema_tables
+from tests.test_intent_router import DB_SETTINGS
+
+TRAIN = "`project.forecasting_sticker_sales.train`"
+TEST = "`project.forecasting_sticker_sales.test`"
+
+
+class TestValidateSql(unittest.TestCase):
+    """Test cases for `validate_sql`."""
+
+    def setUp(self):
+        self.tables = schema_tables(DB_SETTINGS)
+
+    def issues(self, sql):
+        return [(i.kind, i.fix) for i in validate_sql(sql, self.tables)]
+
+    def test_valid_queries_have_no_issues(self):
+        for sql in [
+            f"SELECT country, SUM(num_sold) AS total FROM {TRAIN} GROUP BY country"
+            " ORDER BY total DESC",
+            f"WITH s AS (SELECT country, SUM(num_sold) AS total FROM {TRAIN} GROUP BY 1)"
+            " SELECT s.country, s.total FROM s",
+            f"SELECT country, (SELECT MAX(id) FROM {TEST} x WHERE x.country = t.country)"
+            f" FROM {TRAIN} t",
+            f"SELECT DATE_TRUNC(date, MONTH) AS m, COUNT(*) FROM {TRAIN} GROUP BY m",
+            f"SELECT tag FROM {TRAIN}, UNNEST(['a', 'b']) AS tag",
+            "SELECT name FROM `bigquery-public-data.samples.shakespeare`",
+            "SELECT * FROM UNPARSEABLE ((",
+            f"SELECT * FROM ML.PREDICT(MODEL `project.forecasting_sticker_sales.sales_model`,"
+            f" (SELECT * FROM {TEST}))",
+            "SELECT * FROM ML.FORECAST(MODEL `forecasting_sticker_sales.sales_model`,"
+            " STRUCT(30 AS horizon))",
+        ]:
+            with self.subTest(sql=sql):
+                self.assertEqual(self.issues(sql), [])
+
+    def test_unknown_names_come_with_suggestions(self):
+        self.assertEqual(
+            self.issues(f"SELECT t.contry, SUM(num_sol) FROM {TRAIN} t GROUP BY 1"),
+            [
+                ("unknown_column", "Did you mean `country`?"),
+                ("unknown_column", "Did you mean `num_sold`?"),
+            ],
+        )
+        self.assertEqual(
+            self.issues("SELECT * FROM `project.forecasting_sticker_sales.trian`"),
+            [
+                (
+                    "unknown_table",
+                    "Did you mean `project.forecasting_sticker_sales.train`?"
+                    " Use the fully qualified table name.",
+                )
+            ],
+        )
+
+    def test_join_types(self):
+        (issue,) = validate_sql(
+            f"SELECT a.id FROM {TRAIN} a JOIN {TEST} b ON a.date = b.country", self.tables
+        )
+        self.assertEqual(issue.kind, "join_type")
+        self.assertIn("DATE `a.date` with STRING `b.country`", issue.message)
+        self.assertEqual(
+            self.issues(f"SELECT a.id FROM {TRAIN} a JOIN {TEST} b ON a.id = b.id"), []
+        )
+
+
+class TestRetryBudget(unittest.TestCase):
+    """Test cases for the attempt budget of `run_bigquery_validation`."""
+
+    def test_local_rejections_count_against_the_budget(self):
+        attempts = SqlAttempts(max_failures=2)
+        tool_context = SimpleNamespace(
+            state={"database_settings": DB_SETTINGS}, invocation_id="run-1"
+        )
+        client = mock.Mock()
+        with mock.patch.object(tools, "sql_attempts", attempts), mock.patch.object(
+            tools, "get_bq_client", return_value=client
+        ):
+            results = [
+                asyncio.run(
+                    tools.run_bigquery_validation(
+                        f"SELECT num_sol FROM {TRAIN}", tool_context
+                    )
+                )
+                for _ in range(3)
+            ]
+        client.query.assert_not_called()
+        self.assertEqual(results[0]["fixes"], ["Did you mean `num_sold`?"])
+        self.assertEqual([r.get("attempts_left") for r in results], [1, 0, None])
+        self.assertIn("budget of 2 failed attempts", results[2]["error_message"])
+        stats = attempts.stats()
+        self.assertEqual((stats["rejected_locally"], stats["refused"]), (2, 1))
+
+    def test_queries_run_off_the_event_loop(self):
+        tool_context = SimpleNamespace(
+            state={"database_settings": DB_SETTINGS}, invocation_id="run-2"
+        )
+        threads = []
+
+        def run_query(_sql, _tool_context, final_result):
+            threads.append(threading.get_ident())
+            final_result["query_result"] = []
+
+        async def run():
+            with mock.patch.object(tools, "_run_query", run_query):
+                await tools.run_bigquery_validation(
+                    f"SELECT num_sold FROM {TRAIN}", tool_context
+                )
+            return threading.get_ident()
+
+        self.assertNotEqual(threads, [asyncio.run(run())])
+        self.assertEqual(len(threads), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
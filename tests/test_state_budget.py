@@ -0,0 +1,93 @@
+#
+
+"""Test cases for spilling large session state values to artifacts."""
+
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from google.adk.agents import LlmAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.artifacts import InMemoryArtifactService
+from google.adk.sessions import InMemorySessionService
+from google.adk.tools import ToolContext
+
+from data_science.utils.state_budget import SPILLED, StateManager, is_spilled
+
+ROWS = [{"country": f"c{i}", "num_sold": i} for i in range(500)]
+SETTINGS = {
+    "bq_project_id": "project",
+    "bq_schema_fingerprint": "0123456789abcdef",
+    "bq_ddl_schema": "CREATE OR REPLACE TABLE `t` (`id` INT64);\n" * 200,
+}
+
+
+class TestStateManager(unittest.TestCase):
+    """Test cases for `StateManager`."""
+
+    def setUp(self):
+        self.manager = StateManager(budgets={"query_result": 1024, "database_settings": 1024})
+        self.artifacts = InMemoryArtifactService()
+        self.sessions = InMemorySessionService()
+        self.session = self.run_async(
+            self.sessions.create_session(app_name="app", user_id="user")
+        )
+
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def tool_context(self):
+        return ToolContext(
+            InvocationContext(
+                session_service=self.sessions,
+                artifact_service=self.artifacts,
+                invocation_id="invocation",
+                agent=LlmAgent(name="root", model="gemini-2.0-flash"),
+                session=self.session,
+            )
+        )
+
+    def test_spills_values_over_budget(self):
+        context = self.tool_context()
+        context.state["query_result"] = ROWS
+        context.state["sql_query"] = "SELECT 1" * 1000
+        self.assertEqual(self.run_async(self.manager.spill(context)), ["query_result"])
+
+        reference = context.actions.state_delta["query_result"]
+        self.assertTrue(is_spilled(reference))
+        self.assertLess(len(str(reference)), 400)
+        self.assertIn(reference[SPILLED]["artifact"], context.actions.artifact_delta)
+        self.assertEqual(context.state["sql_query"], "SELECT 1" * 1000)
+
+        # A fresh manager (e.g. another process) loads from the artifact.
+        fresh = StateManager()
+        self.assertEqual(self.run_async(fresh.load(self.tool_context(), "query_result")), ROWS)
+        self.assertEqual(fresh.stats()["loads"], 1)
+
+    def test_keeps_small_dict_fields_inline(self):
+        context = self.tool_context()
+        context.state["database_settings"] = SETTINGS
+        self.run_async(self.manager.spill(context))
+
+        reference = context.state["database_settings"]
+        self.assertEqual(reference["bq_schema_fingerprint"], "0123456789abcdef")
+        self.assertNotIn("bq_ddl_schema", reference)
+        self.assertEqual(reference[SPILLED]["fields"], ["bq_ddl_schema"])
+        self.assertEqual(
+            self.run_async(self.manager.load(context, "database_settings")), SETTINGS
+        )
+        self.assertEqual(self.manager.stats()["cache_hits"], 1)
+
+    def test_small_and_unspilled_values_load_as_is(self):
+        context = self.tool_context()
+        context.state["query_result"] = ROWS[:2]
+        self.assertEqual(self.run_async(self.manager.spill(context)), [])
+        self.assertEqual(self.run_async(self.manager.load(context, "query_result")), ROWS[:2])
+        self.assertIsNone(self.run_async(self.manager.load(context, "missing")))
+
+
+if __name__ == "__main__":
+    unittest.main()
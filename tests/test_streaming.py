@@ -0,0 +1,299 @@
+#
+
+"""Test cases for the backpressure-aware token stream."""
+
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from google.adk.agents import Agent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.adk.plugins import BasePlugin
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.adk.tools import ToolContext
+from google.genai import types
+from langchain_core.outputs import Generation, LLMResult
+
+from data_science.utils.LLMManager import (
+    AsyncStreamingCallbackHandler,
+    StreamingCallbackHandler,
+)
+from data_science.utils.agent_streaming import (
+    get_session_stream,
+    run_agent_streaming,
+    stream_query,
+)
+from data_science.utils.streaming import StreamClosed, TokenStream
+
+
+def _token(text, agent="analyst"):
+    return {"type": "token", "content": text, "agent": agent, "task": None}
+
+
+class TestTokenStream(unittest.TestCase):
+    """Test cases for TokenStream."""
+
+    def test_coalesces_tokens_into_frames(self):
+        frames = []
+
+        async def run():
+            stream = TokenStream(frames.append, frame_chars=6).start()
+            for text in ["ab", "cd", "ef", "gh"]:
+                await stream.put(_token(text))
+            await stream.put({"type": "llm_end", "content": "abcdefgh"})
+            await stream.aclose()
+
+        asyncio.run(run())
+        self.assertEqual(
+            [f.get("content") for f in frames], ["abcdef", "gh", "abcdefgh"]
+        )
+        self.assertEqual(frames[-1]["type"], "llm_end")
+
+    def test_block_policy_applies_backpressure(self):
+        frames = []
+
+        async def slow_sink(frame):
+            await asyncio.sleep(0.01)
+            frames.append(frame)
+
+        async def run():
+            stream = TokenStream(
+                slow_sink, max_queue=2, frame_chars=1, overflow="block"
+            ).start()
+            for i in range(10):
+                await stream.put(_token(str(i)))
+            await stream.aclose()
+            return stream
+
+        stream = asyncio.run(run())
+        self.assertEqual("".join(f["content"] for f in frames), "0123456789")
+        self.assertEqual(stream.stats.dropped_tokens, 0)
+        self.assertGreater(stream.stats.blocked_seconds, 0)
+        self.assertLessEqual(stream.stats.max_queue_depth, 2)
+
+    def test_drop_policy_reports_dropped_tokens(self):
+        frames = []
+
+        async def slow_sink(frame):
+            await asyncio.sleep(0.01)
+            frames.append(frame)
+
+        async def run():
+            stream = TokenStream(
+                slow_sink, max_queue=2, frame_chars=1, overflow="drop"
+            ).start()
+            for i in range(10):
+                await stream.put(_token(str(i)))
+            await stream.put({"type": "llm_end"})
+            await stream.aclose()
+            return stream
+
+        stream = asyncio.run(run())
+        dropped = sum(f["tokens"] for f in frames if f["type"] == "dropped")
+        received = "".join(f["content"] for f in frames if f["type"] == "token")
+        self.assertGreater(stream.stats.dropped_tokens, 0)
+        self.assertEqual(dropped, stream.stats.dropped_tokens)
+        self.assertEqual(len(received) + dropped, 10)
+        self.assertEqual(frames[-1]["type"], "llm_end")
+
+    def test_sink_failure_closes_stream(self):
+        def broken_sink(frame):
+            raise ConnectionError("client went away")
+
+        async def run():
+            stream = TokenStream(broken_sink, frame_interval=0).start()
+            await stream.put(_token("a"))
+            await asyncio.sleep(0.01)
+            with self.assertRaises(StreamClosed):
+                await stream.put(_token("b"))
+            with self.assertRaises(StreamClosed):
+                await stream.aclose()
+
+        asyncio.run(run())
+
+    def test_push_from_worker_thread(self):
+        frames = []
+
+        async def run():
+            stream = TokenStream(frames.append, frame_chars=100).start()
+            await asyncio.to_thread(
+                lambda: [stream.push(_token(t)) for t in "hello"]
+            )
+            with self.assertRaises(RuntimeError):
+                stream.push(_token("x"))
+            await stream.aclose()
+
+        asyncio.run(run())
+        self.assertEqual("".join(f["content"] for f in frames), "hello")
+
+
+def _generation(handler, tokens):
+    """Drives `handler` through one generation of `tokens`, as LangChain does."""
+    handler.on_llm_start({}, ["prompt"])
+    for token in tokens:
+        handler.on_llm_new_token(token)
+    handler.on_llm_end(LLMResult(generations=[[Generation(text="".join(tokens))]]))
+
+
+class TestStreamingCallbackHandlers(unittest.TestCase):
+    """Test cases for the LangChain streaming callback handlers."""
+
+    def test_sync_handler_streams_from_worker_thread(self):
+        frames = []
+
+        async def run():
+            handler = StreamingCallbackHandler()
+            handler.set_stream_function(frames.append)
+            first = handler.token_stream
+            await asyncio.to_thread(_generation, handler, ["he", "llo"])
+            self.assertTrue(first.closed)
+            # The next generation gets a fresh stream to the same sink.
+            await asyncio.to_thread(_generation, handler, ["again"])
+            self.assertIsNot(handler.token_stream, first)
+            self.assertTrue(handler.token_stream.closed)
+
+        asyncio.run(run())
+        self.assertEqual(
+            [(f["type"], f.get("content")) for f in frames],
+            [
+                ("llm_start", None),
+                ("token", "hello"),
+                ("llm_end", "hello"),
+                ("llm_start", None),
+                ("token", "again"),
+                ("llm_end", "again"),
+            ],
+        )
+
+    def test_sync_handler_refuses_to_block_its_own_loop(self):
+        async def run():
+            handler = StreamingCallbackHandler()
+            handler.set_stream_function(lambda frame: None)
+            with self.assertRaisesRegex(RuntimeError, "event loop thread"):
+                handler.on_llm_start({}, ["prompt"])
+            with self.assertRaisesRegex(RuntimeError, "event loop thread"):
+                handler.on_llm_end(None)
+
+        asyncio.run(asyncio.wait_for(run(), 5))
+
+    def test_async_handler_closes_stream_on_error(self):
+        frames = []
+
+        async def run():
+            handler = AsyncStreamingCallbackHandler(
+                token_stream=TokenStream(frames.append)
+            )
+            await handler.on_llm_start({}, ["prompt"])
+            await handler.on_llm_new_token("partial")
+            await handler.on_llm_error(RuntimeError("quota"))
+            self.assertTrue(handler.token_stream.closed)
+
+        asyncio.run(run())
+        self.assertEqual(
+            [(f["type"], f.get("content")) for f in frames],
+            [("llm_start", None), ("token", "partial")],
+        )
+
+
+class _ChunkedLlm(BaseLlm):
+    """Local model stand-in that streams fixed chunks, calling `tool` first."""
+
+    model: str = "local-chunked"
+    chunks: list[str] = []
+    tool: str | None = None
+
+    async def generate_content_async(self, llm_request, stream=False):
+        last = llm_request.contents[-1].parts[0]
+        if self.tool and not last.function_response:
+            call = types.FunctionCall(name=self.tool, args={"question": "q"})
+            yield LlmResponse(
+                content=types.Content(role="model", parts=[types.Part(function_call=call)])
+            )
+            return
+        if stream:
+            for chunk in self.chunks:
+                yield LlmResponse(
+                    content=types.Content(role="model", parts=[types.Part(text=chunk)]),
+                    partial=True,
+                )
+        yield LlmResponse(
+            content=types.Content(
+                role="model", parts=[types.Part(text="".join(self.chunks))]
+            )
+        )
+
+
+class _AgentRecorder(BasePlugin):
+    """Plugin recording the agents it runs for."""
+
+    def __init__(self):
+        super().__init__(name="agent_recorder")
+        self.agents = []
+
+    async def before_agent_callback(self, *, agent, callback_context):
+        self.agents.append(agent.name)
+
+
+class TestStreamQuery(unittest.TestCase):
+    """Test cases for streaming sub-agent output through the root agent."""
+
+    def test_sub_agent_partials_reach_the_caller(self):
+        sub_agent = Agent(
+            model=_ChunkedLlm(chunks=["sub ", "agent"]), name="sub_agent"
+        )
+
+        async def call_sub_agent(question: str, tool_context: ToolContext):
+            """Calls the sub agent."""
+            return await run_agent_streaming(
+                sub_agent, question, tool_context, get_session_stream(tool_context)
+            )
+
+        root = Agent(
+            model=_ChunkedLlm(chunks=["root ", "answer"], tool="call_sub_agent"),
+            name="root",
+            tools=[call_sub_agent],
+        )
+
+        recorder = _AgentRecorder()
+
+        async def run():
+            sessions = InMemorySessionService()
+            runner = Runner(
+                app_name="app", agent=root, session_service=sessions, plugins=[recorder]
+            )
+            session = await sessions.create_session(app_name="app", user_id="u")
+            return [
+                frame
+                async for frame in stream_query(
+                    runner, "u", session.id, "hi", frame_interval=0
+                )
+            ]
+
+        frames = asyncio.run(run())
+        types_ = [f["type"] for f in frames]
+        self.assertLess(types_.index("agent_start"), types_.index("agent_end"))
+        sub_text = "".join(
+            f["content"] for f in frames
+            if f["type"] == "token" and f["agent"] == "sub_agent"
+        )
+        root_text = "".join(
+            f["content"] for f in frames
+            if f["type"] == "token" and f["agent"] == "root"
+        )
+        self.assertEqual(sub_text, "sub agent")
+        self.assertEqual(root_text, "root answer")
+        self.assertEqual(frames[-1]["type"], "done")
+        self.assertIsNotNone(frames[-1]["ttft"])
+        agent_end = frames[types_.index("agent_end")]
+        self.assertIsNotNone(agent_end["ttft"])
+        # The parent runner's plugins run for the sub-agent too.
+        self.assertEqual(recorder.agents, ["root", "sub_agent"])
+
+
+if __name__ == "__main__":
+    unittest.main()
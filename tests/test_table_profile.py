@@ -0,0 +1,199 @@
+#
+
+"""Test cases for the batched, representative sample rows of the schema."""
+
+import datetime
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+from google.cloud import bigquery
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from data_science.sub_agents.bigquery.table_profile import (
+    pick_representative_rows,
+    profile_tables,
+    render_value,
+)
+from data_science.sub_agents.bigquery import tools
+from data_science.sub_agents.bigquery.tools import get_bigquery_schema
+from data_science.utils.prompt_budget import sample_row_levels
+
+
+def _table(table_id, columns, num_bytes=1000, modified_ms=0):
+    table = bigquery.Table(
+        table_id, schema=[bigquery.SchemaField(name, kind) for name, kind in columns]
+    )
+    table._properties.update(  # pylint: disable=protected-access
+        {
+            "type": "TABLE",
+            "numBytes": str(num_bytes),
+            "lastModifiedTime": str(modified_ms),
+        }
+    )
+    return table
+
+
+class _Job:
+    def __init__(self, rows):
+        self.rows = rows
+        self.total_bytes_processed = 2048
+        self.cache_hit = False
+
+    def result(self):
+        return self.rows
+
+
+class FakeBigQueryClient:
+    """Serves table metadata and answers the sampling query from memory."""
+
+    def __init__(self, tables, rows, profile_rows=None):
+        self.tables = {str(t.reference): t for t in tables}
+        self.rows = rows
+        self.profile_rows = profile_rows or {}
+        self.queries = []
+        self.listed = 0
+
+    def list_tables(self, dataset_ref):
+        self.listed += 1
+        return [bigquery.TableReference.from_string(t) for t in self.tables]
+
+    def get_table(self, table_ref):
+        return self.tables[str(table_ref)]
+
+    def query(self, sql):
+        self.queries.append(sql)
+        if sql.startswith("SELECT\n  COUNT(*)"):
+            table_id = sql.split("FROM `")[1].split("`")[0]
+            return _Job([self.profile_rows[table_id]])
+        return _Job(
+            [
+                {"table_id": table_id, "row_json": json.dumps(row)}
+                for table_id, rows in self.rows.items()
+                for row in rows
+            ]
+        )
+
+
+class TestSchemaSampling(unittest.TestCase):
+    """Test cases for get_bigquery_schema's sample rows."""
+
+    def test_all_tables_are_sampled_with_one_query(self):
+        sales = "proj.ds.sales"
+        stores = "proj.ds.stores"
+        client = FakeBigQueryClient(
+            [
+                _table(sales, [("country", "STRING"), ("num_sold", "INTEGER")], 10**11),
+                _table(stores, [("store", "STRING"), ("notes", "STRING")]),
+            ],
+            {
+                sales: [{"country": "Canada", "num_sold": 5}] * 20
+                + [{"country": "Kenya", "num_sold": 7}],
+                stores: [{"store": "Store A", "notes": "x" * 500}],
+            },
+        )
+
+        ddl = get_bigquery_schema("ds", client=client, project_id="proj")
+
+        self.assertEqual(len(client.queries), 1)
+        self.assertIn("TABLESAMPLE SYSTEM", client.queries[0].split("UNION ALL")[0])
+        self.assertNotIn("TABLESAMPLE", client.queries[0].split("UNION ALL")[1])
+        # Duplicate rows are dropped in favor of rows with other values.
+        self.assertEqual(ddl.count(f"INSERT INTO `{sales}`"), 2)
+        self.assertIn("('Kenya',7)", ddl)
+        # Long values are truncated.
+        self.assertIn("'" + "x" * 37 + "...'", ddl)
+        self.assertNotIn("x" * 41, ddl)
+
+    def test_representative_rows_cover_distinct_values(self):
+        rows = [
+            {"a": 1, "b": "x"},
+            {"a": 1, "b": "x"},
+            {"a": 2, "b": "x"},
+            {"a": 3, "b": "y"},
+        ]
+        self.assertEqual(
+            pick_representative_rows(rows, 2), [{"a": 1, "b": "x"}, {"a": 3, "b": "y"}]
+        )
+        self.assertEqual(len(pick_representative_rows(rows, 10)), 3)
+
+    def test_render_value_escapes_literals(self):
+        self.assertEqual(render_value("it's"), "'it\\'s'")
+        self.assertEqual(render_value(None), "NULL")
+        self.assertEqual(render_value(2.5), "2.5")
+
+
+class TestColumnProfile(unittest.TestCase):
+    """Test cases for the column profiles."""
+
+    SALES = "proj.ds.profiled_sales"
+    PROFILE_ROW = {
+        "row_count": 200,
+        "c0_distinct": 6,
+        "c0_nulls": 0,
+        "c0_top": [{"value": "Canada", "count": 40}, {"value": "Kenya", "count": 35}],
+        "c1_distinct": 120,
+        "c1_nulls": 10,
+        "c1_min": 0,
+        "c1_max": 5939,
+        "c2_distinct": 150,
+        "c2_nulls": 0,
+        "c2_min": datetime.date(2010, 1, 1),
+        "c2_max": datetime.date(2016, 12, 31),
+    }
+    COLUMNS = [("country", "STRING"), ("num_sold", "INTEGER"), ("date", "DATE")]
+
+    def _client(self, modified_ms=0):
+        return FakeBigQueryClient(
+            [_table(self.SALES, self.COLUMNS, modified_ms=modified_ms)],
+            {self.SALES: [{"country": "Canada", "num_sold": 5, "date": "2010-01-01"}]},
+            {self.SALES: self.PROFILE_ROW},
+        )
+
+    def test_profile_is_one_query_per_table_and_rendered_in_schema(self):
+        client = self._client(modified_ms=1)
+        profiles = profile_tables(client, list(client.tables.values()))
+        (query,) = client.queries
+        self.assertIn("APPROX_TOP_COUNT(`country`, 5)", query)
+        self.assertIn("MIN(`num_sold`)", query)
+        self.assertNotIn("MIN(`country`)", query)
+
+        num_sold = profiles[self.SALES].columns[1]
+        self.assertEqual((num_sold.min, num_sold.max, num_sold.null_rate), (0, 5939, 0.05))
+
+        ddl = get_bigquery_schema("ds", client=client, project_id="proj", profiles=profiles)
+        self.assertIn("-- Column profile (200 rows):", ddl)
+        self.assertIn("`country` STRING: ~6 distinct top: 'Canada' (40), 'Kenya' (35)", ddl)
+        self.assertIn("range 2010-01-01 .. 2016-12-31", ddl)
+        # The prompt budget drops sample rows but keeps the profile.
+        without_rows = list(sample_row_levels(ddl, {}))[-1]
+        self.assertNotIn("INSERT INTO", without_rows)
+        self.assertIn("-- Column profile", without_rows)
+
+    def test_profiles_are_cached_until_the_table_changes(self):
+        client = self._client(modified_ms=2)
+        profile_tables(client, list(client.tables.values()))
+        profile_tables(client, list(client.tables.values()))
+        self.assertEqual(len(client.queries), 1)
+
+        changed = self._client(modified_ms=3)
+        profile_tables(changed, list(changed.tables.values()))
+        self.assertEqual(len(changed.queries), 1)
+
+    def test_settings_fetch_the_table_metadata_once(self):
+        client = self._client(modified_ms=4)
+        with mock.patch.object(tools, "get_bq_client", return_value=client), mock.patch.dict(
+            os.environ,
+            {"BQ_PROJECT_ID": "proj", "BQ_DATASET_ID": "ds", "BQ_COLUMN_PROFILE": "true"},
+        ), mock.patch.object(tools, "database_settings", None):
+            settings = tools.update_database_settings()
+        self.assertEqual(client.listed, 1)
+        self.assertIn("-- Column profile (200 rows):", settings["bq_ddl_schema"])
+        self.assertIn(self.SALES, settings["bq_column_profile"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+#
+
+"""Test cases for tracing spans and exporters."""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.prompts import ChatPromptTemplate
+
+from data_science.utils import LLMManager as llm_manager_module
+from data_science.utils.LLMManager import LLMManager
+from data_science.utils.clients import ClientRegistry
+from data_science.utils.tracing import (
+    InMemoryExporter,
+    JsonlFileExporter,
+    ModelCallTracer,
+    Tracer,
+    record_llm_usage,
+    traced,
+    tracer,
+)
+
+
+class TestTracer(unittest.TestCase):
+    """Test cases for Tracer."""
+
+    def setUp(self):
+        self.tracer = Tracer()
+        self.exporter = self.tracer.add_exporter(InMemoryExporter())
+
+    def test_spans_nest_and_carry_attributes(self):
+        with self.tracer.span("agent.db", streaming=False) as parent:
+            with self.tracer.span("bigquery.query") as child:
+                child.set(bytes_processed=1024, cache_hit=True, job_id=None)
+                child.add("rows_returned", 3).add("rows_returned", 2)
+
+        child, parent = self.exporter.spans
+        self.assertEqual(child.parent_id, parent.span_id)
+        self.assertEqual(child.trace_id, parent.trace_id)
+        self.assertIsNone(parent.parent_id)
+        self.assertEqual(
+            child.attributes,
+            {"bytes_processed": 1024, "cache_hit": True, "rows_returned": 5},
+        )
+        self.assertGreaterEqual(parent.duration, child.duration)
+
+    def test_errors_mark_the_span(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.span("sqlglot.parse"):
+                raise ValueError("bad sql")
+        (span,) = self.exporter.find("sqlglot.parse")
+        self.assertEqual(span.status, "error")
+        self.assertEqual(span.error, "ValueError: bad sql")
+        self.assertEqual(self.exporter.summary()["sqlglot.parse"]["errors"], 1)
+
+    def test_async_tasks_inherit_the_current_span(self):
+        exporter = tracer.add_exporter(InMemoryExporter())
+        self.addCleanup(tracer.remove_exporter, exporter)
+
+        @traced("stage")
+        async def stage(delay):
+            await asyncio.sleep(delay)
+
+        async def run():
+            with tracer.span("pipeline"):
+                await asyncio.gather(stage(0.01), stage(0.02))
+
+        asyncio.run(run())
+        (root,) = exporter.find("pipeline")
+        stages = exporter.find("stage")
+        self.assertEqual(len(stages), 2)
+        self.assertTrue(all(s.parent_id == root.span_id for s in stages))
+        self.assertEqual(exporter.summary()["stage"]["count"], 2)
+
+    def test_jsonl_exporter_writes_one_line_per_span(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "spans.jsonl")
+            exporter = self.tracer.add_exporter(JsonlFileExporter(path))
+            with self.tracer.span("formatter.bar", rows=2):
+                pass
+            with self.tracer.span("formatter.pie"):
+                pass
+            exporter.shutdown()
+            with open(path, encoding="utf-8") as f:
+                spans = [json.loads(line) for line in f]
+        self.assertEqual([s["name"] for s in spans], ["formatter.bar", "formatter.pie"])
+        self.assertEqual(spans[0]["attributes"], {"rows": 2})
+
+    def test_llm_calls_record_token_usage(self):
+        exporter = tracer.add_exporter(InMemoryExporter())
+        self.addCleanup(tracer.remove_exporter, exporter)
+        response = SimpleNamespace(
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=120,
+                candidates_token_count=30,
+                total_token_count=150,
+                cached_content_token_count=100,
+            )
+        )
+
+        with ClientRegistry().track("gemini-test", role="nl2sql") as span:
+            record_llm_usage(span, response)
+
+        (span,) = exporter.find("llm.call")
+        self.assertEqual(span.attributes["model"], "gemini-test")
+        self.assertEqual(span.attributes["prompt_tokens"], 120)
+        self.assertEqual(span.attributes["completion_tokens"], 30)
+        self.assertTrue(span.attributes["cache_hit"])
+
+    def test_model_callbacks_trace_each_model_call(self):
+        exporter = tracer.add_exporter(InMemoryExporter())
+        self.addCleanup(tracer.remove_exporter, exporter)
+        calls = ModelCallTracer()
+        context = SimpleNamespace(invocation_id="i1", agent_name="database_agent")
+        request = SimpleNamespace(model="gemini-test")
+        usage = SimpleNamespace(prompt_token_count=80, candidates_token_count=20)
+
+        calls.before_model(context, request)
+        calls.after_model(context, SimpleNamespace(partial=True, usage_metadata=None))
+        self.assertEqual(exporter.find("llm.call"), [])
+        calls.after_model(context, SimpleNamespace(partial=False, usage_metadata=usage))
+        calls.before_model(context, request)
+        calls.on_model_error(context, request, RuntimeError("quota"))
+
+        ok, failed = exporter.find("llm.call")
+        self.assertEqual(ok.attributes["agent"], "database_agent")
+        self.assertEqual(ok.attributes["model"], "gemini-test")
+        self.assertEqual(ok.attributes["prompt_tokens"], 80)
+        self.assertEqual((failed.status, failed.error), ("error", "RuntimeError: quota"))
+
+    def test_streaming_does_not_hold_the_span_across_yields(self):
+        exporter = tracer.add_exporter(InMemoryExporter())
+        self.addCleanup(tracer.remove_exporter, exporter)
+        registry = ClientRegistry()
+        manager = object.__new__(LLMManager)
+        manager._llm = FakeListChatModel(responses=["abc"])
+        manager._llm.__dict__["model"] = "gemini-test"
+        prompt = ChatPromptTemplate.from_template("{question}")
+        seen = []
+
+        with mock.patch.object(llm_manager_module, "llm_clients", registry):
+            with tracer.span("request") as request:
+                for _ in manager.stream(prompt, question="q"):
+                    seen.append(tracer.current_span())
+
+        self.assertEqual(seen, [request] * 3)
+        (call,) = exporter.find("llm.call")
+        self.assertEqual(call.parent_id, request.span_id)
+        self.assertEqual(registry.stats()["gemini-test"]["completed"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()